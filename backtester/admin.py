@@ -1,8 +1,26 @@
 from django.contrib import admin
-from .models import StockHistory
+from .models import StockHistory, CorporateAction, DataQuality, JobRun
 
 
 @admin.register(StockHistory)
 class StockHistoryAdmin(admin.ModelAdmin):
     list_display = ("symbol", "date", "close", "volume")
     list_filter = ("symbol",)
+
+
+@admin.register(CorporateAction)
+class CorporateActionAdmin(admin.ModelAdmin):
+    list_display = ("symbol", "ex_date", "action", "ratio", "amount", "provider_adjusted_from")
+    list_filter = ("symbol", "action")
+
+
+@admin.register(DataQuality)
+class DataQualityAdmin(admin.ModelAdmin):
+    list_display = ("symbol", "clean", "rows", "zero_volume", "ohlc_invalid", "checked_at")
+    list_filter = ("clean",)
+
+
+@admin.register(JobRun)
+class JobRunAdmin(admin.ModelAdmin):
+    list_display = ("job", "trigger", "status", "attempts", "started_at", "finished_at")
+    list_filter = ("job", "status")
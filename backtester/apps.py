@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class BacktesterConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'backtester'
+
+    def ready(self):
+        from .db import connect_signals
+
+        connect_signals()
@@ -0,0 +1,91 @@
+import numpy as np
+import pandas as pd
+from backtester.models import CorporateAction
+
+PRICE_COLS = ["open", "high", "low", "close"]
+
+
+def load_actions(symbol):
+    return list(
+        CorporateAction.objects.filter(symbol=symbol)
+        .order_by("ex_date")
+        .values("action", "ex_date", "ratio", "amount", "provider_adjusted_from")
+    )
+
+
+def _index_of(dates, day):
+    """第一個 >= day 的位置"""
+    return int(np.searchsorted(dates, np.datetime64(day, "D")))
+
+
+def restore_factors(dates, actions):
+    """
+    資料來源已經先做過分割調整的區間要乘回去，回傳每根 bar 的價格倍數
+    (成交量用倒數)
+    """
+    restore = np.ones(len(dates))
+    for a in actions:
+        if a["action"] == CorporateAction.DIVIDEND or not a["provider_adjusted_from"]:
+            continue
+        lo = _index_of(dates, a["provider_adjusted_from"])
+        hi = _index_of(dates, a["ex_date"])
+        restore[lo:hi] *= _split_ratio(a)
+    return restore
+
+
+def _split_ratio(a):
+    return a["ratio"] if a["action"] == CorporateAction.SPLIT else 1.0 / a["ratio"]
+
+
+def cumulative_factors(dates, close, actions):
+    """
+    原始價 -> 還原價的累積因子 (向後還原: 最新一根的因子為 1)
+    分割: 除權日之前的價格除以分割比例
+    現金股利: 除息日之前乘上 (1 - 股利 / 前一日收盤)
+    回傳 (分割因子, 股利因子)，沒有現金股利紀錄時股利因子為 None
+    """
+    split = np.ones(len(dates))
+    dividend = None
+    for a in actions:
+        idx = _index_of(dates, a["ex_date"])
+        if idx == 0:
+            continue
+        if a["action"] == CorporateAction.DIVIDEND:
+            if dividend is None:
+                dividend = np.ones(len(dates))
+            dividend[:idx] *= 1.0 - a["amount"] / close[idx - 1]
+        else:
+            split[:idx] /= _split_ratio(a)
+    return split, dividend
+
+
+def apply_actions(symbol, df, actions=None):
+    """
+    provider 抓回來的資料 -> (原始價, 還原價) 兩個 DataFrame
+    原始價: 把資料來源先做過的分割調整乘回去
+    還原價: 原始價 * 累積因子 (分割 x 股利)，OHLC 一次乘完；
+            沒有現金股利紀錄時，股利部分沿用資料來源的 adj_close / close
+    還原價含 factor 欄位 (還原價 = 原始價 * factor)
+    """
+    if actions is None:
+        actions = load_actions(symbol)
+    dates = df.index.to_numpy(dtype="datetime64[D]")
+    prices = df[PRICE_COLS].to_numpy(dtype=float)
+    volume = df["volume"].to_numpy(dtype=float)
+
+    restore = restore_factors(dates, actions)
+    raw_prices = prices * restore[:, None]
+    raw_volume = volume / restore
+
+    split, dividend = cumulative_factors(dates, raw_prices[:, 3], actions)
+    if dividend is None:
+        dividend = (df["adj_close"] / df["close"]).fillna(1.0).to_numpy()
+    factor = split * dividend
+
+    df_raw = pd.DataFrame(raw_prices, index=df.index, columns=PRICE_COLS)
+    df_raw["volume"] = raw_volume
+
+    df_adj = pd.DataFrame(raw_prices * factor[:, None], index=df.index, columns=PRICE_COLS)
+    df_adj["volume"] = raw_volume / split  # 成交量只跟著分割調整
+    df_adj["factor"] = factor
+    return df_raw, df_adj
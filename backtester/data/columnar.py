@@ -0,0 +1,166 @@
+import os
+import shutil
+import tempfile
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+# 每個欄位一個連續陣列 (.npy)，日期為排序好的 datetime64[D]
+PRICE_COLS = ["open", "high", "low", "close"]
+COLUMNS = PRICE_COLS + ["volume"]
+
+# 已開啟的 mmap (同一個 worker 內重複使用)，key = 版本目錄
+_opened = {}
+
+
+def cache_root(root=None):
+    if root:
+        return Path(root)
+    if settings.configured and hasattr(settings, "PRICE_CACHE_DIR"):
+        return Path(settings.PRICE_CACHE_DIR)
+    return Path(__file__).resolve().parents[2] / "price_cache"
+
+
+def _symbol_dir(kind, symbol, root=None):
+    return cache_root(root) / kind / symbol
+
+
+def write_price_arrays(symbol, kind, dates, columns, version, root=None):
+    """
+    寫入一個新版本目錄，再以 os.replace 原子性地切換 CURRENT 指標
+    讀取端永遠看到完整的一組檔案，不會讀到寫一半的資料
+    同一個版本的內容相同: 多個執行緒 / 行程同時重建時，目錄已存在就直接沿用
+    """
+    base = _symbol_dir(kind, symbol, root)
+    base.mkdir(parents=True, exist_ok=True)
+    target = base / f"v{version}"
+
+    if not target.exists():
+        # 每次寫入用自己的暫存目錄 (同一個行程的多個執行緒也不會共用)
+        tmp = Path(tempfile.mkdtemp(prefix=f".v{version}.", suffix=".tmp", dir=base))
+        np.save(tmp / "date.npy", np.asarray(dates, dtype="datetime64[D]"))
+        np.save(tmp / "open.npy", np.ascontiguousarray(columns["open"], dtype=np.float64))
+        np.save(tmp / "high.npy", np.ascontiguousarray(columns["high"], dtype=np.float64))
+        np.save(tmp / "low.npy", np.ascontiguousarray(columns["low"], dtype=np.float64))
+        np.save(tmp / "close.npy", np.ascontiguousarray(columns["close"], dtype=np.float64))
+        np.save(tmp / "volume.npy", np.ascontiguousarray(columns["volume"], dtype=np.int64))
+        try:
+            os.replace(tmp, target)
+        except OSError:
+            # 別人先寫好了同一個版本 (目標目錄非空時 replace 會失敗)
+            shutil.rmtree(tmp, ignore_errors=True)
+            if not target.exists():
+                raise
+
+    # CURRENT 只往新版本移動，避免慢的舊版本寫入者把指標蓋回去
+    current = _current_version(base)
+    if current is None or current < version:
+        fd, pointer = tempfile.mkstemp(prefix=".CURRENT.", dir=base)
+        with os.fdopen(fd, "w") as f:
+            f.write(str(version))
+        os.replace(pointer, base / "CURRENT")
+
+    # 清掉舊版本 (Windows 上被別的 worker mmap 中的檔案刪不掉，下次再清)
+    for old in base.glob("v*"):
+        if old.name[1:].isdigit() and int(old.name[1:]) < version:
+            shutil.rmtree(old, ignore_errors=True)
+    return target
+
+
+def _current_version(base):
+    try:
+        return int((base / "CURRENT").read_text().strip())
+    except (OSError, ValueError):
+        return None
+
+
+def build_price_cache(symbol, root=None):
+    """從資料庫重建某支股票的 columnar cache (ingestion 完成後呼叫)"""
+    from backtester.models import StockHistory, AdjustedStockHistory, DataVersion
+
+    version = DataVersion.get_version(symbol)
+    for kind, model in (("raw", StockHistory), ("adjusted", AdjustedStockHistory)):
+        rows = list(
+            model.objects.filter(symbol=symbol)
+            .order_by("date")
+            .values_list("date", *COLUMNS)
+        )
+        if not rows:
+            continue
+        date, o, h, l, c, v = zip(*rows)
+        write_price_arrays(
+            symbol,
+            kind,
+            np.array(date, dtype="datetime64[D]"),
+            {"open": o, "high": h, "low": l, "close": c, "volume": v},
+            version,
+            root,
+        )
+
+
+def open_price_arrays(symbol, kind="adjusted", root=None, version=None):
+    """
+    以 mmap 開啟目前版本的陣列，回傳 dict (date + OHLCV)
+    沒有快取、或與指定的資料版本 (DataVersion) 不符時回傳 None
+    """
+    base = _symbol_dir(kind, symbol, root)
+    try:
+        current = (base / "CURRENT").read_text().strip()
+    except OSError:
+        return None
+    if version is not None and current != str(version):
+        return None
+    version = current
+
+    path = base / f"v{version}"
+    arrays = _opened.get(path)
+    if arrays is None:
+        try:
+            arrays = {
+                name: np.load(path / f"{name}.npy", mmap_mode="r")
+                for name in ["date"] + COLUMNS
+            }
+        except OSError:
+            return None
+        # 只保留目前版本，舊版本的 mmap 交給 GC 關閉
+        for key in [k for k in _opened if k.parent == base]:
+            del _opened[key]
+        _opened[path] = arrays
+    return arrays
+
+
+def load_price_arrays(
+    symbol, kind="adjusted", start=None, end=None, root=None, version=None
+):
+    """
+    讀取某段日期的陣列 (mmap 切片，零複製)
+    日期篩選用二分搜尋 (start / end 皆包含當天)
+    """
+    arrays = open_price_arrays(symbol, kind, root, version)
+    if arrays is None:
+        return None
+
+    dates = arrays["date"]
+    lo = np.searchsorted(dates, np.datetime64(start, "D")) if start else 0
+    hi = (
+        np.searchsorted(dates, np.datetime64(end, "D"), side="right")
+        if end
+        else len(dates)
+    )
+    return {name: arr[lo:hi] for name, arr in arrays.items()}
+
+
+def load_price_frame_cached(
+    symbol, kind="adjusted", start=None, end=None, root=None, version=None
+):
+    """
+    同 load_price_arrays，但包成 DataFrame
+    價格 / 成交量欄位直接引用 mmap 切片 (唯讀，要修改請先 copy)；
+    日期要從 datetime64[D] 轉成 pandas 的 ns 索引，這一欄會複製
+    """
+    arrays = load_price_arrays(symbol, kind, start, end, root, version)
+    if arrays is None:
+        return None
+    index = pd.DatetimeIndex(arrays["date"].astype("datetime64[ns]"), name="date")
+    return pd.DataFrame({col: arrays[col] for col in COLUMNS}, index=index, copy=False)
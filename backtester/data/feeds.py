@@ -0,0 +1,141 @@
+import asyncio
+import csv
+import datetime
+from pathlib import Path
+from django.utils.module_loading import import_string
+
+# 盤中 K 棒的統一格式 (dict): symbol / time / open / high / low / close / volume
+BAR_FIELDS = ["symbol", "time", "open", "high", "low", "close", "volume"]
+
+
+class BarFeed:
+    """
+    盤中資料來源介面: bars() 為 async generator，依時間順序產生 K 棒 dict
+    券商 API / websocket 只要包成這個介面就能接上 StreamEngine
+    """
+
+    async def bars(self):
+        raise NotImplementedError
+        yield
+
+
+class ReplayFeed(BarFeed):
+    """
+    從 CSV 重播分 K (測試 / 盤後回放用)
+    欄位: symbol, time (ISO 格式), open, high, low, close, volume；多檔股票可混在同一個檔案
+    speed: 0 = 不等待全速重播，1 = 照實際時間間隔，60 = 快轉 60 倍
+    """
+
+    def __init__(self, path, symbols=None, speed=0):
+        self.path = Path(path)
+        self.symbols = set(symbols) if symbols else None
+        self.speed = speed
+
+    def _rows(self):
+        with open(self.path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                if self.symbols and row["symbol"] not in self.symbols:
+                    continue
+                yield {
+                    "symbol": row["symbol"],
+                    "time": datetime.datetime.fromisoformat(row["time"]),
+                    "open": float(row["open"]),
+                    "high": float(row["high"]),
+                    "low": float(row["low"]),
+                    "close": float(row["close"]),
+                    "volume": float(row.get("volume") or 0),
+                }
+
+    async def bars(self):
+        prev = None
+        for i, bar in enumerate(self._rows()):
+            if self.speed and prev is not None and bar["time"] > prev:
+                await asyncio.sleep((bar["time"] - prev).total_seconds() / self.speed)
+            elif i % 1000 == 0:
+                await asyncio.sleep(0)  # 全速重播時也讓其他協程有機會執行
+            prev = bar["time"]
+            yield bar
+
+
+class QueueFeed(BarFeed):
+    """由外部 put() 推進來的 K 棒 (例如 websocket callback)，put(None) 結束"""
+
+    def __init__(self, maxsize=0):
+        self.queue = asyncio.Queue(maxsize)
+
+    async def put(self, bar):
+        await self.queue.put(bar)
+
+    async def bars(self):
+        while True:
+            bar = await self.queue.get()
+            if bar is None:
+                return
+            yield bar
+
+
+class MinuteBarAggregator:
+    """
+    逐筆成交 (tick) 合成分 K: 某檔股票進入下一分鐘時，回傳上一分鐘完成的 K 棒
+    tick: dict(symbol, time, price, volume)
+    """
+
+    def __init__(self):
+        self._open = {}  # symbol -> 進行中的 K 棒
+
+    def add(self, tick):
+        minute = tick["time"].replace(second=0, microsecond=0)
+        price = tick["price"]
+        bar = self._open.get(tick["symbol"])
+        if bar is not None and minute < bar["time"]:
+            return None  # 亂序的舊 tick
+        if bar is not None and minute == bar["time"]:
+            bar["high"] = max(bar["high"], price)
+            bar["low"] = min(bar["low"], price)
+            bar["close"] = price
+            bar["volume"] += tick.get("volume", 0)
+            return None
+
+        self._open[tick["symbol"]] = {
+            "symbol": tick["symbol"],
+            "time": minute,
+            "open": price,
+            "high": price,
+            "low": price,
+            "close": price,
+            "volume": tick.get("volume", 0),
+        }
+        return bar
+
+    def flush(self):
+        """收盤時把還沒完成的 K 棒全部吐出"""
+        bars = list(self._open.values())
+        self._open.clear()
+        return bars
+
+
+class TickFeed(BarFeed):
+    """把產生 tick 的 async iterable 轉成分 K feed"""
+
+    def __init__(self, ticks):
+        self.ticks = ticks
+
+    async def bars(self):
+        agg = MinuteBarAggregator()
+        async for tick in self.ticks:
+            bar = agg.add(tick)
+            if bar is not None:
+                yield bar
+        for bar in agg.flush():
+            yield bar
+
+
+FEEDS = {
+    "replay": ReplayFeed,
+}
+
+
+def get_feed(name, **kwargs):
+    """依名稱 (replay) 或類別路徑取得盤中資料來源"""
+    feed_class = FEEDS.get(name) or import_string(name)
+    return feed_class(**kwargs)
@@ -0,0 +1,128 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import timedelta
+from pathlib import Path
+from backtester.data.providers import get_provider, normalize_symbol
+from backtester.data.ingest import OVERLAP_DAYS, apply_tail, ingest_history, latest_dates
+
+# 內建的股票池檔案 (一行一個代號，# 開頭為註解)
+UNIVERSE_DIR = Path(__file__).resolve().parent / "universes"
+
+
+def load_universe(name_or_path, allow_path=False):
+    """
+    讀取股票池: 內建名稱 (例如 tw50)
+    allow_path=True 時也可以是任意檔案路徑 (只給指令列用，API 不可開放)
+    """
+    path = Path(name_or_path) if allow_path else None
+    if path is None or not path.exists():
+        name = str(name_or_path)
+        if not name or "/" in name or "\\" in name or ".." in name:
+            raise ValueError(f"找不到股票池: {name_or_path}")
+        path = UNIVERSE_DIR / f"{name}.txt"
+    if not path.is_file():
+        raise ValueError(f"找不到股票池: {name_or_path}")
+
+    symbols = []
+    for line in path.read_text(encoding="utf-8").splitlines():
+        line = line.split("#")[0].strip()
+        if line:
+            symbols.append(normalize_symbol(line.split(",")[0].strip()))
+    return symbols
+
+
+class RateLimiter:
+    """所有執行緒共用: 兩次請求之間至少間隔 1 / rate 秒"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self.lock = threading.Lock()
+        self.next_at = 0.0
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            at = max(now, self.next_at)
+            self.next_at = at + self.interval
+        if at > now:
+            time.sleep(at - now)
+
+
+def fetch_with_retry(provider, symbol, limiter, retries=3, backoff=1.0, **kwargs):
+    """
+    呼叫 provider.history，失敗時以指數退避 (backoff * 2^n，含隨機抖動) 重試
+    回傳 (DataFrame, 嘗試次數)，重試用完則拋出最後一次的例外
+    """
+    for attempt in range(retries + 1):
+        limiter.wait()
+        try:
+            return provider.history(symbol, **kwargs), attempt + 1
+        except Exception:
+            if attempt == retries:
+                raise
+            time.sleep(backoff * 2**attempt * (1 + random.random() * 0.1))
+
+
+def fetch_universe(
+    symbols,
+    provider=None,
+    workers=8,
+    rate=5.0,
+    retries=3,
+    backoff=1.0,
+    full=False,
+    overlap_days=OVERLAP_DAYS,
+):
+    """
+    多支股票同時下載 (執行緒池 + 全域限速 + 重試)，下載好的資料由呼叫端執行緒依序寫入資料庫
+    已有資料的股票只抓最後一段 (同 update_history)，full=True 則全部重抓
+
+    回傳每支股票的結果 list: {symbol, status (ok / empty / error), mode, count, attempts, error}
+    """
+    provider = provider or get_provider()
+    symbols = list(dict.fromkeys(normalize_symbol(s) for s in symbols))
+    latest = {} if full else latest_dates(symbols)
+    limiter = RateLimiter(rate)
+
+    def download(symbol):
+        if symbol in latest:
+            since = latest[symbol] - timedelta(days=overlap_days)
+            df, attempts = fetch_with_retry(
+                provider, symbol, limiter, retries, backoff, start=since.isoformat()
+            )
+            return df, since, attempts
+        df, attempts = fetch_with_retry(
+            provider, symbol, limiter, retries, backoff, period="max"
+        )
+        return df, None, attempts
+
+    results = []
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {pool.submit(download, s): s for s in symbols}
+        # 先完成的先寫，SQLite 只有一個寫入者，所以寫入留在這個執行緒
+        for future in as_completed(futures):
+            symbol = futures[future]
+            res = {"symbol": symbol, "status": "ok", "mode": None, "count": 0, "attempts": 0, "error": None}
+            try:
+                df, since, res["attempts"] = future.result()
+                if since is None:
+                    if df.empty:
+                        res["status"] = "empty"
+                    else:
+                        res["mode"] = "full"
+                        res["count"] = ingest_history(symbol, df, replace=True)
+                else:
+                    out = apply_tail(symbol, df, since, provider)
+                    res["mode"], res["count"] = out["mode"], out["count"]
+            except Exception as e:
+                res["status"] = "error"
+                res["error"] = str(e)
+            results.append(res)
+
+    order = {s: i for i, s in enumerate(symbols)}
+    results.sort(key=lambda r: order[r["symbol"]])
+    return results
@@ -0,0 +1,171 @@
+from datetime import timedelta
+import numpy as np
+import pandas as pd
+from django.db import transaction
+from django.db.models import Max
+from backtester.models import StockHistory, AdjustedStockHistory, DataVersion
+from backtester.data.columnar import build_price_cache
+from backtester.data.writer import bulk_write, PRICE_FIELDS
+from backtester.data.actions import PRICE_COLS, apply_actions
+from backtester.data.quality import validate_frame, record_quality
+
+ADJUSTED_FIELDS = PRICE_FIELDS + ["factor"]
+
+
+def ingest_history(symbol, df, replace=False):
+    """
+    把 provider 抓回來的資料寫進 StockHistory (原始價) 與 AdjustedStockHistory (還原價)
+    replace=True 時先清空該股票的舊資料 (完整重抓)
+    還原價會隨每次除權息整段改變，所以這次抓到的區間一律覆寫 (upsert)
+    回傳寫入筆數
+    """
+    if df.empty:
+        return 0
+
+    # 依 CorporateAction 還原原始價、計算還原價
+    df_raw, df_adj = apply_actions(symbol, df)
+
+    with transaction.atomic():
+        if replace:
+            StockHistory.objects.filter(symbol=symbol).delete()
+            AdjustedStockHistory.objects.filter(symbol=symbol).delete()
+
+        # 以 (symbol, date) upsert，重抓同一段資料結果不變
+        count = bulk_write(StockHistory, symbol, df_raw)
+        bulk_write(AdjustedStockHistory, symbol, df_adj, ADJUSTED_FIELDS)
+
+        # 資料品質只在寫入時檢查一次 (部分覆寫時整段重驗)
+        if not replace:
+            df_adj = _stored_frame(AdjustedStockHistory, symbol, None, PRICE_FIELDS)
+        record_quality(symbol, validate_frame(df_adj))
+
+        # 資料已改寫，讓舊的回測快取失效
+        DataVersion.bump(symbol)
+
+        # commit 之後重建 mmap 的 columnar cache
+        transaction.on_commit(lambda: build_price_cache(symbol))
+
+    return count
+
+
+# ==========================================
+# 增量更新: 只抓最後一段，只寫有變動的列
+# ==========================================
+# 往回多抓幾天，用來偵測 Yahoo 修正過的價格與還原因子的變化
+OVERLAP_DAYS = 10
+# 浮點比對容許誤差 (除息造成的因子變化遠大於此)
+RTOL = 1e-6
+
+
+def _stored_frame(model, symbol, since, columns):
+    queryset = model.objects.filter(symbol=symbol)
+    if since:
+        queryset = queryset.filter(date__gte=since)
+    rows = list(
+        queryset.order_by("date")
+        .values_list("date", *columns)
+    )
+    df = pd.DataFrame(rows, columns=["date"] + columns)
+    df.index = pd.to_datetime(df.pop("date"))
+    return df
+
+
+def _changed_rows(new, old, columns):
+    """new 裡面「舊資料沒有」或「任一欄位不同」的列"""
+    old = old.reindex(new.index)
+    same = np.isclose(new[columns].to_numpy(float), old[columns].to_numpy(float), rtol=RTOL)
+    return new[~same.all(axis=1)]
+
+
+def update_history(symbol, provider=None, overlap_days=OVERLAP_DAYS, full=False):
+    """
+    增量更新某支股票:
+    1. 查資料庫最後一天，只向 provider 要 (最後一天 - overlap_days) 之後的資料
+    2. 重疊區間的還原因子或原始價變了 (除權息 / 分割 / 合併) -> 改走完整重抓
+    3. 否則只 upsert 新的列與被修正過的列，不刪資料，讀取端不會看到空表
+
+    回傳 {"mode": "full" / "incremental" / "noop", "count": 寫入筆數}
+    """
+    from backtester.data.providers import get_provider
+
+    provider = provider or get_provider()
+    latest = (
+        StockHistory.objects.filter(symbol=symbol)
+        .order_by("-date")
+        .values_list("date", flat=True)
+        .first()
+    )
+    if full or latest is None:
+        df = provider.history(symbol, period="max")
+        return {"mode": "full", "count": ingest_history(symbol, df, replace=True)}
+
+    since = latest - timedelta(days=overlap_days)
+    tail = provider.history(symbol, start=since.isoformat())
+    return apply_tail(symbol, tail, since, provider)
+
+
+def latest_dates(symbols):
+    """一次查出多支股票在資料庫的最後一天 -> {symbol: date}"""
+    return dict(
+        StockHistory.objects.filter(symbol__in=symbols)
+        .values("symbol")
+        .annotate(latest=Max("date"))
+        .values_list("symbol", "latest")
+    )
+
+
+def apply_tail(symbol, tail, since, provider=None):
+    """
+    把 since 之後抓到的一段資料併進資料庫 (update_history 的寫入部分)
+    抓資料與寫入分開，讓多支股票可以平行下載、再由單一執行緒寫入
+    """
+    from backtester.data.providers import get_provider
+
+    if tail.empty:
+        return {"mode": "noop", "count": 0}
+
+    tail_raw, tail_adj = apply_actions(symbol, tail)
+
+    cols = PRICE_COLS + ["volume"]
+    stored_raw = _stored_frame(StockHistory, symbol, since, cols)
+    stored_adj = _stored_frame(AdjustedStockHistory, symbol, since, cols + ["factor"])
+
+    # 重疊區間: 還原因子變了 = 除權息；原始價整段換了基準 = 分割 / 合併
+    overlap = tail_adj.index.intersection(stored_adj.index)
+    factor_changed = not np.allclose(
+        tail_adj.loc[overlap, "factor"], stored_adj.loc[overlap, "factor"], rtol=RTOL
+    )
+    overlap = tail_raw.index.intersection(stored_raw.index)
+    split = not np.allclose(
+        tail_raw.loc[overlap, "close"], stored_raw.loc[overlap, "close"], rtol=1e-3
+    )
+    if factor_changed or split:
+        print(f"{symbol} 還原因子 / 股價基準有變動，改為完整重抓")
+        df = (provider or get_provider()).history(symbol, period="max")
+        return {"mode": "full", "count": ingest_history(symbol, df, replace=True)}
+
+    raw_changed = _changed_rows(tail_raw, stored_raw, cols)
+    adj_changed = _changed_rows(tail_adj, stored_adj, cols + ["factor"])
+    if raw_changed.empty and adj_changed.empty:
+        return {"mode": "noop", "count": 0}
+
+    # 只有新加的列: 只驗新的一段 (接縫處用前一根收盤檢查跳空)，再與舊的品質紀錄合併
+    # 重疊區間有被修正的列: 舊的品質紀錄已不可信，寫入後整段重驗
+    new_rows, prev_close = tail_adj, None
+    revised = False
+    if len(stored_adj):
+        new_rows = tail_adj[tail_adj.index > stored_adj.index[-1]]
+        prev_close = stored_adj["close"].iloc[-1]
+        revised = bool((adj_changed.index <= stored_adj.index[-1]).any())
+
+    with transaction.atomic():
+        bulk_write(StockHistory, symbol, raw_changed)
+        bulk_write(AdjustedStockHistory, symbol, adj_changed, ADJUSTED_FIELDS)
+        if revised:
+            record_quality(symbol, validate_frame(_stored_frame(AdjustedStockHistory, symbol, None, cols)))
+        elif len(new_rows):
+            record_quality(symbol, validate_frame(new_rows, prev_close), replace=False)
+        DataVersion.bump(symbol)
+        transaction.on_commit(lambda: build_price_cache(symbol))
+
+    return {"mode": "incremental", "count": max(len(raw_changed), len(adj_changed))}
@@ -0,0 +1,105 @@
+from pathlib import Path
+import pandas as pd
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+# 所有 provider 回傳的統一欄位 (index 為不含時區的日期)
+COLUMNS = ["open", "high", "low", "close", "adj_close", "volume"]
+
+
+def normalize_symbol(symbol):
+    """0050 -> 0050.TW"""
+    if symbol.isdigit() and not symbol.endswith(".TW"):
+        symbol = f"{symbol}.TW"
+    return symbol
+
+
+def normalize_frame(df):
+    """欄位轉小寫、去時區、排序去重，缺 adj_close 時以 close 代替 (視為無還原)"""
+    df = df.copy()
+    df.columns = [str(c).lower().replace(" ", "_") for c in df.columns]
+    if "adj_close" not in df.columns:
+        df["adj_close"] = df["close"]
+
+    index = pd.to_datetime(df.index)
+    if index.tz is not None:
+        index = index.tz_localize(None)
+    df.index = index.normalize()
+    df.index.name = "date"
+
+    df = df[~df.index.duplicated(keep="last")].sort_index()
+    return df[COLUMNS]
+
+
+class PriceProvider:
+    """
+    歷史股價來源介面
+    history() 回傳未還原的 OHLCV 加上 adj_close (含息還原收盤價)，
+    還原因子 = adj_close / close，由 ingestion 端計算並存進資料庫
+    """
+
+    def history(self, symbol, start=None, end=None, period="max"):
+        raise NotImplementedError
+
+
+class YahooProvider(PriceProvider):
+    def history(self, symbol, start=None, end=None, period="max"):
+        import yfinance as yf
+
+        ticker = yf.Ticker(symbol)
+        if start or end:
+            df = ticker.history(start=start, end=end, auto_adjust=False, actions=False)
+        else:
+            df = ticker.history(period=period, auto_adjust=False, actions=False)
+        if df.empty:
+            return pd.DataFrame(columns=COLUMNS)
+        return normalize_frame(df)
+
+
+class LocalFileProvider(PriceProvider):
+    """
+    離線用的本地資料來源 (測試 / 沒網路時)
+    讀取 <root>/<symbol>.parquet 或 <root>/<symbol>.csv，
+    需有 date, open, high, low, close, volume 欄位 (adj_close 可省略)
+    """
+
+    def __init__(self, root=None):
+        self.root = Path(root or settings.PRICE_DATA_DIR)
+
+    def _read(self, symbol):
+        parquet = self.root / f"{symbol}.parquet"
+        if parquet.exists():
+            df = pd.read_parquet(parquet)  # 需要 pyarrow
+        else:
+            csv = self.root / f"{symbol}.csv"
+            if not csv.exists():
+                return None
+            df = pd.read_csv(csv)
+
+        df.columns = [str(c).lower().replace(" ", "_") for c in df.columns]
+        if "date" in df.columns:
+            df = df.set_index("date")
+        return normalize_frame(df)
+
+    def history(self, symbol, start=None, end=None, period="max"):
+        df = self._read(symbol)
+        if df is None:
+            return pd.DataFrame(columns=COLUMNS)
+        if start:
+            df = df[df.index >= pd.Timestamp(start)]
+        if end:
+            df = df[df.index < pd.Timestamp(end)]  # 與 yfinance 相同，end 不含當天
+        return df
+
+
+PROVIDERS = {
+    "yahoo": YahooProvider,
+    "local": LocalFileProvider,
+}
+
+
+def get_provider(name=None):
+    """依 settings.PRICE_PROVIDER 取得資料來源 (可填 yahoo / local 或類別路徑)"""
+    name = name or getattr(settings, "PRICE_PROVIDER", "yahoo")
+    provider_class = PROVIDERS.get(name) or import_string(name)
+    return provider_class()
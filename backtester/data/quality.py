@@ -0,0 +1,91 @@
+import numpy as np
+from django.conf import settings
+from backtester.models import DataQuality
+
+# 隔夜跳空 (開盤 / 前一日收盤) 超過此比例視為異常 (台股漲跌幅上限 10%)
+JUMP_THRESHOLD = 0.2
+# 連續缺超過幾個工作天才算資料缺口 (春節連假約 5 天)
+MAX_GAP_DAYS = 6
+
+COUNT_FIELDS = ["duplicates", "unsorted", "missing_values", "ohlc_invalid", "zero_volume"]
+
+
+def validate_frame(df, prev_close=None, jump_threshold=JUMP_THRESHOLD, max_gap=MAX_GAP_DAYS):
+    """
+    向量化檢查一段日 K (index 為日期，欄位 open / high / low / close / volume)
+    prev_close: 這段資料前一根的收盤價 (增量寫入時用來檢查接縫處的跳空)
+    回傳與 DataQuality 欄位對應的 dict
+    """
+    dates = df.index.to_numpy(dtype="datetime64[D]")
+    o = df["open"].to_numpy(dtype=float)
+    h = df["high"].to_numpy(dtype=float)
+    l = df["low"].to_numpy(dtype=float)
+    c = df["close"].to_numpy(dtype=float)
+    v = df["volume"].to_numpy(dtype=float)
+
+    step = np.diff(dates).astype(np.int64)
+    values = np.stack([o, h, l, c, v])
+    nan_rows = np.isnan(values).any(axis=0)
+
+    tol = 1e-9 * np.abs(c)
+    with np.errstate(invalid="ignore"):
+        bad_bar = (
+            (h < np.maximum(o, c) - tol)
+            | (l > np.minimum(o, c) + tol)
+            | (l <= 0)
+        ) & ~nan_rows
+
+        prev = np.concatenate([[np.nan if prev_close is None else prev_close], c[:-1]])
+        jump = np.abs(o / prev - 1.0) > jump_threshold
+
+    # 交易日缺口: 相鄰兩根之間跳過的工作天 (可用 settings.TRADING_HOLIDAYS 排除國定假日)
+    holidays = getattr(settings, "TRADING_HOLIDAYS", [])
+    gap_idx = np.array([], dtype=int)
+    if len(dates) > 1:
+        ordered = step > 0
+        skipped = np.zeros(len(step), dtype=np.int64)
+        skipped[ordered] = np.busday_count(
+            dates[:-1][ordered] + 1, dates[1:][ordered], holidays=holidays
+        )
+        gap_idx = np.flatnonzero(skipped > max_gap)
+
+    report = {
+        "rows": len(df),
+        "duplicates": int((step == 0).sum()),
+        "unsorted": int((step < 0).sum()),
+        "missing_values": int(nan_rows.sum()),
+        "ohlc_invalid": int(bad_bar.sum()),
+        "zero_volume": int((v == 0).sum()),
+        "jumps": [str(d) for d in dates[jump]],
+        "gaps": [[str(dates[i]), str(dates[i + 1])] for i in gap_idx],
+    }
+    report["clean"] = is_clean_report(report)
+    return report
+
+
+def is_clean_report(report):
+    return not any(report[k] for k in COUNT_FIELDS) and not report["jumps"] and not report["gaps"]
+
+
+def record_quality(symbol, report, replace=True):
+    """
+    寫入 DataQuality；replace=False (只驗了新加的一段) 時與舊紀錄合併
+    """
+    if not replace:
+        old = DataQuality.objects.filter(symbol=symbol).values().first()
+        if old:
+            report = dict(report)
+            report["rows"] += old["rows"]
+            for k in COUNT_FIELDS:
+                report[k] += old[k]
+            report["jumps"] = sorted(set(old["jumps"]) | set(report["jumps"]))
+            report["gaps"] = old["gaps"] + [g for g in report["gaps"] if g not in old["gaps"]]
+            report["clean"] = is_clean_report(report)
+
+    DataQuality.objects.update_or_create(symbol=symbol, defaults=report)
+    return report
+
+
+def is_clean(symbol):
+    """資料是否通過 ingestion 檢查 (沒檢查過的一律當作不乾淨)"""
+    return DataQuality.objects.filter(symbol=symbol, clean=True).exists()
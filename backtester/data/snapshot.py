@@ -0,0 +1,97 @@
+import datetime
+import threading
+import time
+from concurrent.futures import Future
+from zoneinfo import ZoneInfo
+from django.conf import settings
+from backtester.data.providers import get_provider, normalize_symbol
+
+
+def trading_date(tz=None):
+    """市場當地的今天 (伺服器跑 UTC 時，台股 08:00 前仍算前一天)"""
+    tz = tz or getattr(settings, "MARKET_TIMEZONE", "Asia/Taipei")
+    return datetime.datetime.now(ZoneInfo(tz)).date()
+
+
+class MarketSnapshotCache:
+    """
+    同一個行程內共用的最新行情快取
+    key = (symbol, period, 交易日)，每筆 ttl 秒後過期；
+    provider 一次回傳原始價與還原價 (close / adj_close)，記帳與算指標共用同一份下載
+    多個執行緒同時要同一個 key 時只有第一個真的下載，其餘等它的結果 (失敗不快取)
+    """
+
+    def __init__(self, ttl=300, provider=None):
+        self.ttl = ttl
+        self.provider = provider
+        self._data = {}  # key -> (過期時間, DataFrame)
+        self._pending = {}  # key -> Future (下載中)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def get(self, symbol, period="5d", provider=None):
+        """回傳 DataFrame 的副本 (欄位與 PriceProvider.history 相同)"""
+        symbol = normalize_symbol(symbol)
+        key = (symbol, period, trading_date())
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and item[0] > now:
+                self.hits += 1
+                return item[1].copy()
+            future = self._pending.get(key)
+            owner = future is None
+            if owner:
+                future = self._pending[key] = Future()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not owner:
+            return future.result().copy()
+
+        try:
+            df = (provider or self.provider or get_provider()).history(symbol, period=period)
+        except BaseException as e:
+            with self._lock:
+                del self._pending[key]
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            del self._pending[key]
+            if not df.empty:  # 沒資料不快取，下次重抓
+                self._data = {k: v for k, v in self._data.items() if v[0] > now}
+                self._data[key] = (time.monotonic() + self.ttl, df)
+        future.set_result(df)
+        return df.copy()
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = self.coalesced = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+            }
+
+
+def _build_cache():
+    conf = getattr(settings, "MARKET_SNAPSHOT", {})
+    return MarketSnapshotCache(ttl=conf.get("TTL", 300))
+
+
+market_snapshots = _build_cache()
+
+
+def market_snapshot(symbol, period="5d", provider=None):
+    """monitor / 個人掃描 / StockInfoAPIView 共用的入口"""
+    return market_snapshots.get(symbol, period=period, provider=provider)
@@ -0,0 +1,74 @@
+import itertools
+import numpy as np
+from django.db import connection, transaction
+
+# 每次 executemany 送出的列數 (控制記憶體，整批仍在同一個 transaction)
+BATCH_SIZE = 10000
+
+PRICE_FIELDS = ["open", "high", "low", "close", "volume"]
+
+
+def frame_rows(symbol, df, fields=PRICE_FIELDS):
+    """
+    DataFrame -> (symbol, date, 欄位...) tuple 的產生器
+    整欄轉成 NumPy / Python 原生型別後再 zip，不建 model 物件、不走 iterrows
+    """
+    dates = df.index.strftime("%Y-%m-%d").tolist()
+    columns = []
+    for name in fields:
+        arr = df[name].to_numpy()
+        if name == "volume":
+            arr = np.nan_to_num(arr.astype(float)).astype(np.int64)
+        else:
+            arr = arr.astype(float)
+        columns.append(arr.tolist())
+    return zip([symbol] * len(dates), dates, *columns)
+
+
+def _upsert_sql(model, fields, upsert):
+    table = connection.ops.quote_name(model._meta.db_table)
+    names = ["symbol", "date"] + list(fields)
+    cols = ", ".join(connection.ops.quote_name(n) for n in names)
+    marks = ", ".join(["%s"] * len(names))
+    sql = f"INSERT INTO {table} ({cols}) VALUES ({marks}) ON CONFLICT (symbol, date) DO "
+    if not upsert:
+        return sql + "NOTHING"
+    updates = ", ".join(
+        f"{connection.ops.quote_name(n)} = EXCLUDED.{connection.ops.quote_name(n)}"
+        for n in fields
+    )
+    return sql + f"UPDATE SET {updates}"
+
+
+def bulk_write(model, symbol, df, fields=PRICE_FIELDS, upsert=True, batch_size=BATCH_SIZE):
+    """
+    把一支股票的 DataFrame 寫進以 (symbol, date) 為唯一鍵的價格表
+    upsert=True: 已存在的日期直接覆寫 (重抓同一段資料結果不變)；False: 已存在就略過
+    SQLite / PostgreSQL 用 INSERT ... ON CONFLICT 的 executemany，其他資料庫退回 bulk_create
+    回傳寫入筆數
+    """
+    if df.empty:
+        return 0
+
+    rows = frame_rows(symbol, df, fields)
+    count = 0
+    with transaction.atomic():
+        if connection.vendor in ("sqlite", "postgresql"):
+            sql = _upsert_sql(model, fields, upsert)
+            with connection.cursor() as cursor:
+                while True:
+                    batch = list(itertools.islice(rows, batch_size))
+                    if not batch:
+                        break
+                    cursor.executemany(sql, batch)
+                    count += len(batch)
+        else:
+            objs = [model(**dict(zip(["symbol", "date"] + list(fields), row))) for row in rows]
+            options = (
+                {"update_conflicts": True, "unique_fields": ["symbol", "date"], "update_fields": fields}
+                if upsert
+                else {"ignore_conflicts": True}
+            )
+            model.objects.bulk_create(objs, batch_size=batch_size, **options)
+            count = len(objs)
+    return count
@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.db.backends.signals import connection_created
+
+
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    """每條新的 SQLite 連線套用 settings.SQLITE_PRAGMAS"""
+    if connection.vendor != "sqlite":
+        return
+    pragmas = getattr(settings, "SQLITE_PRAGMAS", {})
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+
+
+def connect_signals():
+    connection_created.connect(apply_sqlite_pragmas, dispatch_uid="backtester_sqlite_pragmas")
@@ -0,0 +1,198 @@
+import numpy as np
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+from backtester.engine.grid import ewm_rows
+from backtester.engine.runner import load_prices
+from backtester.models import PaperTrading
+
+# 手續費 0.1425% (低消 20 元，概算)、證交稅 0.1%、買進時預留 0.5% 手續費空間
+FEE_RATE = 0.001425
+MIN_FEE = 20
+TAX_RATE = 0.001
+BUY_BUFFER = 0.995
+
+UPDATE_FIELDS = ["price", "action", "shares", "cash", "total_assets", "roi"]
+
+# 競技場的 Top 10 參數 (快, 慢, 訊號) - 來自之前的暴力搜索結果 (monitor_top10 / backfill_arena 共用)
+TOP_STRATEGIES = [
+    (11, 45, 9), (5, 35, 9), (14, 45, 9), (14, 40, 9), (8, 25, 9),
+    (5, 45, 9), (8, 40, 9), (11, 40, 9), (20, 45, 9), (17, 35, 9),
+]
+
+
+def strategy_name(fast, slow, sig):
+    return f"MACD({fast},{slow},{sig})"
+
+
+def macd_cross_matrix(close, strategies):
+    """
+    所有策略 x 所有 bars 的 MACD 交叉 (與 pandas ewm adjust=False 相同)
+    每個 EMA span 只算一次；回傳 (黃金交叉, 死亡交叉) 兩個 (策略數 x bars) 布林矩陣，第一根恆為 False
+    """
+    combos = np.asarray(strategies, dtype=int).reshape(-1, 3)
+    spans = np.unique(combos[:, :2])
+    ema = ewm_rows(close, spans)
+    pos = {s: i for i, s in enumerate(spans)}
+
+    dif = ema[[pos[f] for f in combos[:, 0]]] - ema[[pos[s] for s in combos[:, 1]]]
+    signal = ewm_rows(dif, combos[:, 2])
+
+    golden = np.zeros(dif.shape, dtype=bool)
+    death = np.zeros(dif.shape, dtype=bool)
+    golden[:, 1:] = (dif[:, :-1] < signal[:, :-1]) & (dif[:, 1:] > signal[:, 1:])
+    death[:, 1:] = (dif[:, :-1] > signal[:, :-1]) & (dif[:, 1:] < signal[:, 1:])
+    return golden, death
+
+
+def macd_cross(close, strategies):
+    """只要最後一根的交叉: 回傳兩個長度為策略數的布林陣列"""
+    golden, death = macd_cross_matrix(close, strategies)
+    return golden[:, -1], death[:, -1]
+
+
+def load_last_states(names, before):
+    """
+    一個查詢取出每個策略在 before 之前的最後一筆紀錄 -> {策略名稱: (現金, 股數)}
+    (同一天重跑時不會讀到今天自己寫的那筆，結果不變)
+    """
+    latest = (
+        PaperTrading.objects.filter(strategy_name=OuterRef("strategy_name"), date__lt=before)
+        .order_by("-date")
+        .values("date")[:1]
+    )
+    rows = (
+        PaperTrading.objects.filter(strategy_name__in=names, date__lt=before)
+        .filter(date=Subquery(latest))
+        .values_list("strategy_name", "cash", "shares")
+    )
+    return {name: (cash, shares) for name, cash, shares in rows}
+
+
+def step_wallets(cash, shares, price, golden, death):
+    """
+    所有帳戶同時依今天的訊號以收盤價成交 (梭哈買進 / 全部賣出)
+    回傳 (現金, 股數, 動作) 陣列
+    """
+    cash = np.asarray(cash, dtype=float).copy()
+    shares = np.asarray(shares, dtype=np.int64).copy()
+    action = np.full(len(cash), "HOLD", dtype=object)
+
+    buy_shares = np.floor(cash / price * BUY_BUFFER).astype(np.int64)
+    cost = buy_shares * price
+    fee = np.maximum(MIN_FEE, np.floor(cost * FEE_RATE))
+    buy = golden & (cash > price) & (buy_shares > 0) & (cash >= cost + fee)
+    shares = np.where(buy, shares + buy_shares, shares)
+    cash = np.where(buy, cash - (cost + fee), cash)
+    action[buy] = "BUY"
+
+    sell = ~golden & death & (shares > 0)
+    revenue = shares * price
+    fee = np.maximum(MIN_FEE, np.floor(revenue * FEE_RATE))
+    tax = np.floor(revenue * TAX_RATE)
+    cash = np.where(sell, cash + (revenue - fee - tax), cash)
+    shares = np.where(sell, 0, shares)
+    action[sell] = "SELL"
+    return cash, shares, action
+
+
+def _day_records(names, date, price, action, shares, cash, init_capital):
+    total = cash + shares * price
+    roi = np.round((total - init_capital) / init_capital * 100, 2)
+    return [
+        PaperTrading(
+            strategy_name=n,
+            date=date,
+            price=price,
+            action=a,
+            shares=int(sh),
+            cash=float(c),
+            total_assets=float(t),
+            roi=float(r),
+        )
+        for n, a, sh, c, t, r in zip(names, action, shares, cash, total, roi)
+    ]
+
+
+def upsert_records(records, batch_size=500):
+    """以 (策略, 日期) 為鍵 bulk upsert，同一天重跑 / 回補都是覆寫"""
+    PaperTrading.objects.bulk_create(
+        records,
+        batch_size=batch_size,
+        update_conflicts=True,
+        unique_fields=["strategy_name", "date"],
+        update_fields=UPDATE_FIELDS,
+    )
+
+
+def run_arena(strategies, close, price, date, init_capital=1000000, signals=None):
+    """
+    競技場每日更新: 一次讀出所有帳戶、一次算完所有策略訊號、一次 bulk upsert
+    close: 算指標用的還原收盤價序列；price: 今天記帳用的原始收盤價
+    signals: 已算好的 (黃金交叉, 死亡交叉) 陣列 (例如來自 indicator_state)，有給就不用 close
+    回傳每個策略的 dict (name, action, shares, cash, total_assets, roi)，順序同 strategies
+    """
+    names = [strategy_name(*s) for s in strategies]
+    states = load_last_states(names, date)
+    cash = np.array([states.get(n, (init_capital, 0))[0] for n in names], dtype=float)
+    shares = np.array([states.get(n, (init_capital, 0))[1] for n in names], dtype=np.int64)
+
+    golden, death = signals if signals is not None else macd_cross(close, strategies)
+    cash, shares, action = step_wallets(cash, shares, price, golden, death)
+    records = _day_records(names, date, price, action, shares, cash, init_capital)
+    upsert_records(records)
+    return [
+        {
+            "name": r.strategy_name,
+            "action": r.action,
+            "shares": r.shares,
+            "cash": r.cash,
+            "total_assets": r.total_assets,
+            "roi": r.roi,
+        }
+        for r in records
+    ]
+
+
+def backfill_arena(strategies, symbol, start, end=None, init_capital=1000000):
+    """
+    以資料庫裡的歷史股價重建 start ~ end 每一天的競技場紀錄 (補洞 / 重算)
+    - 指標用還原價、記帳用原始收盤價 (與每日監控相同)
+    - 指標從最早的歷史開始算 (EMA 充分收斂)，所有策略 x 所有日子一次算完交叉矩陣
+    - 帳戶從 start 前最後一筆紀錄接續，沒有就從 init_capital 開始；逐日只做陣列運算
+    - 所有紀錄一次 bulk upsert
+    回填範圍之後已有紀錄時丟 ValueError (那些紀錄的帳戶狀態會與回填結果接不上)
+    回傳寫入的天數
+    """
+    adjusted = load_prices(symbol, "adjusted", end_date=end)["close"]
+    raw = load_prices(symbol, "raw", end_date=end)["close"]
+    if adjusted.empty or raw.empty:
+        raise ValueError(f"{symbol} 沒有歷史資料，請先更新股價")
+    raw = raw.reindex(adjusted.index)
+
+    golden, death = macd_cross_matrix(adjusted.to_numpy(dtype=float), strategies)
+    dates = adjusted.index.date
+    days = np.flatnonzero((dates >= start) & ~np.isnan(raw.to_numpy(dtype=float)))
+    if len(days) == 0:
+        return 0
+
+    names = [strategy_name(*s) for s in strategies]
+    last_day = dates[days[-1]]
+    later = PaperTrading.objects.filter(strategy_name__in=names, date__gt=last_day).order_by("-date").first()
+    if later is not None:
+        # 後面的紀錄是從舊的帳戶狀態推出來的，只改前面會接不起來
+        raise ValueError(
+            f"{last_day} 之後已有紀錄 (最晚到 {later.date})，請把 end 設到 {later.date} 或不指定 end"
+        )
+    states = load_last_states(names, dates[days[0]])
+    cash = np.array([states.get(n, (init_capital, 0))[0] for n in names], dtype=float)
+    shares = np.array([states.get(n, (init_capital, 0))[1] for n in names], dtype=np.int64)
+
+    records = []
+    for t in days:
+        price = round(float(raw.iloc[t]), 2)
+        cash, shares, action = step_wallets(cash, shares, price, golden[:, t], death[:, t])
+        records += _day_records(names, dates[t], price, action, shares, cash, init_capital)
+
+    with transaction.atomic():
+        upsert_records(records)
+    return len(days)
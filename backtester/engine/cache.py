@@ -0,0 +1,149 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import caches
+from backtester.models import DataVersion
+from backtester.engine.runner import run_backtest_from_db, STRATEGY_MAP
+from backtester.strategies.kd_strategy import Taiwan50KDStrategy
+
+
+class BacktestCache:
+    """
+    回測結果快取
+    - 第一層: 行程內 LRU (maxsize 筆，每筆 ttl 秒後過期)
+    - 第二層 (選用): Django cache backend，讓多個 worker 共用結果
+    """
+
+    def __init__(self, maxsize=128, ttl=600, backend=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.backend = backend
+        self._data = OrderedDict()  # key -> (過期時間, 結果)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.backend_hits = 0
+
+    def _backend(self):
+        return caches[self.backend] if self.backend else None
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                expires, value = item
+                if expires > now:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+
+        backend = self._backend()
+        if backend is not None:
+            value = backend.get(f"backtest:{key}")
+            if value is not None:
+                self._store(key, value)
+                with self._lock:
+                    self.hits += 1
+                    self.backend_hits += 1
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key, value):
+        self._store(key, value)
+        backend = self._backend()
+        if backend is not None:
+            backend.set(f"backtest:{key}", value, timeout=self.ttl)
+
+    def _store(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)  # 淘汰最久沒用到的
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = self.backend_hits = 0
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "backend_hits": self.backend_hits,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            }
+
+
+def _build_cache():
+    conf = getattr(settings, "BACKTEST_CACHE", {})
+    return BacktestCache(
+        maxsize=conf.get("MAXSIZE", 128),
+        ttl=conf.get("TTL", 600),
+        backend=conf.get("BACKEND"),
+    )
+
+
+backtest_cache = _build_cache()
+
+
+def make_cache_key(symbol, strategy_name, params, engine, data_version):
+    """
+    把回測輸入正規化後做 hash
+    只保留會影響結果的欄位，參數轉型方式與 run_backtest_from_db 相同
+    """
+    p = params or {}
+    strat_class = STRATEGY_MAP.get(strategy_name, Taiwan50KDStrategy)
+    valid_keys = strat_class.params._getkeys()
+    strat_params = {
+        k: int(v) for k, v in p.items() if k in valid_keys and str(v).isdigit()
+    }
+
+    payload = {
+        "symbol": symbol,
+        "strategy": strat_class.__name__,
+        "params": strat_params,
+        "start_date": p.get("start_date") or None,
+        "end_date": p.get("end_date") or None,
+        "init_cash": float(p.get("init_cash", 1000000.0)),
+        "engine": engine,
+        "version": data_version,
+    }
+    raw = json.dumps(payload, sort_keys=True, default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def run_backtest_cached(symbol, strategy_name="default_kd", params=None, engine="backtrader"):
+    """
+    RunBacktestAPIView 用: 相同輸入 + 相同資料版本直接回傳上次結果
+    回傳的 dict 與快取共用，呼叫端請勿修改
+    """
+    if symbol.isdigit() and not symbol.endswith(".TW"):
+        symbol = f"{symbol}.TW"
+
+    key = make_cache_key(
+        symbol, strategy_name, params, engine, DataVersion.get_version(symbol)
+    )
+    result = backtest_cache.get(key)
+    if result is not None:
+        return result
+
+    result = run_backtest_from_db(
+        symbol, strategy_name=strategy_name, params=params, is_api=True, engine=engine
+    )
+    if "error" not in result:  # 錯誤結果不快取 (例如還沒抓資料)
+        backtest_cache.set(key, result)
+    return result
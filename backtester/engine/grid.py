@@ -0,0 +1,190 @@
+import math
+import numpy as np
+from backtester.engine.vector import PERCENTS, COMMISSION
+
+# 一次處理的參數組數 (控制 (組數 x bars) 矩陣的記憶體用量)
+CHUNK_SIZE = 256
+
+
+# ==========================================
+# 2D 指標: 每一列一條序列，沿著 bars 一起遞迴
+# ==========================================
+def ema_rows(x, periods):
+    """
+    對 (列數 x bars) 矩陣的每一列做 bt.EMA (SMA 種子)，每列可有不同 period
+    每列從自己的第一個有效值開始起算，結果與 vector.ema 逐列計算完全相同
+    """
+    x = np.atleast_2d(np.asarray(x, dtype=float))
+    periods = np.asarray(periods)
+    rows, n = x.shape
+    out = np.full((rows, n), np.nan)
+
+    valid = ~np.isnan(x)
+    first = np.where(valid.any(axis=1), valid.argmax(axis=1), n)
+    seed_idx = first + periods - 1
+    seed_val = np.full(rows, np.nan)
+    for r in range(rows):
+        if seed_idx[r] < n:
+            seed_val[r] = math.fsum(x[r, first[r] : seed_idx[r] + 1]) / periods[r]
+
+    alpha = 2.0 / (1.0 + periods)
+    alpha1 = 1.0 - alpha
+    start = seed_idx.min() if rows else n
+    prev = np.full(rows, np.nan)
+    # 迴圈只跑 bars，所有參數列同時向量化更新
+    for i in range(start, n):
+        prev = np.where(seed_idx == i, seed_val, prev * alpha1 + x[:, i] * alpha)
+        out[:, i] = prev
+    return out
+
+
+def ewm_rows(x, spans):
+    """
+    pandas ewm(span, adjust=False).mean() 的 2D 版本: 以第一根為種子，每列可有不同 span
+    x 為 1D 時對同一條序列算多個 span，回傳 (len(spans) x bars)
+    """
+    spans = np.asarray(spans, dtype=float)
+    x = np.asarray(x, dtype=float)
+    if x.ndim == 1:
+        x = np.broadcast_to(x, (len(spans), len(x)))
+    alpha = 2.0 / (spans + 1.0)
+    out = np.empty(x.shape)
+    out[:, 0] = x[:, 0]
+    for i in range(1, x.shape[1]):
+        out[:, i] = alpha * x[:, i] + (1.0 - alpha) * out[:, i - 1]
+    return out
+
+
+def ema_matrix(close, spans):
+    """同一條收盤價對多個 span 的 EMA -> (len(spans) x bars)"""
+    close = np.asarray(close, dtype=float)
+    return ema_rows(np.broadcast_to(close, (len(spans), len(close))), spans)
+
+
+def _ffill_rows(x):
+    """沿 bars 方向往前補值 (NaN 視為缺值)"""
+    n = x.shape[1]
+    idx = np.where(~np.isnan(x), np.arange(n), 0)
+    np.maximum.accumulate(idx, axis=1, out=idx)
+    return np.take_along_axis(x, idx, axis=1)
+
+
+def crossover_rows(a, b):
+    """
+    bt.CrossOver 的 2D 版本: 以「上一個非零差值」判斷交叉
+    回傳 (向上交叉, 向下交叉) 布林矩陣
+    """
+    diff = a - b
+    nzd = _ffill_rows(np.where(diff == 0.0, np.nan, diff))
+    prev = np.full_like(nzd, np.nan)
+    prev[:, 1:] = nzd[:, :-1]
+    with np.errstate(invalid="ignore"):
+        up = (prev < 0.0) & (diff > 0.0)
+        down = (prev > 0.0) & (diff < 0.0)
+    return up, down
+
+
+def macd_grid_signals(close, combos, ema_cache=None):
+    """
+    combos: [(fast, slow, signal), ...]
+    每個不同的 EMA span 只算一次 (ema_cache: span -> 列)，DIF 用索引一次取出所有組合
+    回傳 (向上交叉, 向下交叉) 矩陣，列順序同 combos
+    """
+    combos = np.asarray(combos, dtype=int).reshape(-1, 3)
+    spans = np.unique(combos[:, :2])
+    if ema_cache is None:
+        ema_cache = {}
+    missing = [s for s in spans if s not in ema_cache]
+    if missing:
+        for span, row in zip(missing, ema_matrix(close, missing)):
+            ema_cache[span] = row
+
+    ema = np.stack([ema_cache[s] for s in spans])
+    pos = {s: i for i, s in enumerate(spans)}
+    fast_rows = [pos[f] for f in combos[:, 0]]
+    slow_rows = [pos[s] for s in combos[:, 1]]
+
+    dif = ema[fast_rows] - ema[slow_rows]
+    signal = ema_rows(dif, combos[:, 2])
+    return crossover_rows(dif, signal)
+
+
+# ==========================================
+# 多組參數同時撮合 (long-only、全進全出)
+# ==========================================
+def simulate_grid(o, c, enter, leave, init_cash=1000000.0,
+                  percents=PERCENTS, commission=COMMISSION):
+    """
+    enter / leave: (組數 x bars) 布林矩陣 (第 i 根出訊號，第 i+1 根開盤成交)
+    撮合規則同 vector.simulate (含跳空資金不足作廢)，但所有組合同時前進
+    回傳 (最終資產, 最大回撤%) 兩個長度為組數的陣列
+    """
+    rows, n = enter.shape
+    cash = np.full(rows, float(init_cash))
+    size = np.zeros(rows)
+    entry_price = np.zeros(rows)
+    want_buy = np.zeros(rows, dtype=bool)
+    want_sell = np.zeros(rows, dtype=bool)
+    buy_size = np.zeros(rows)
+
+    peak = np.full(rows, -np.inf)
+    mdd = np.zeros(rows)
+    pct = percents / 100
+
+    for t in range(n):
+        # 1. 開盤成交前一根的委託
+        if want_buy.any():
+            cost = buy_size * o[t]
+            comm = cost * commission
+            ok = want_buy & (cash - cost - comm >= 0.0)
+            cash = np.where(ok, cash - cost - comm, cash)
+            size = np.where(ok, buy_size, size)
+            entry_price = np.where(ok, o[t], entry_price)
+            want_buy[:] = False
+        if want_sell.any():
+            gain = size * entry_price + size * (o[t] - entry_price)
+            fee = size * o[t] * commission
+            cash = np.where(want_sell, cash + gain - fee, cash)
+            size = np.where(want_sell, 0.0, size)
+            want_sell[:] = False
+
+        # 2. 收盤結算淨值與回撤
+        value = cash + size * c[t]
+        peak = np.maximum(peak, value)
+        mdd = np.maximum(mdd, 100.0 * (peak - value) / peak)
+
+        # 3. 依收盤訊號下單 (最後一根的委託不會成交)
+        flat = size == 0.0
+        want_buy = flat & enter[:, t]
+        want_sell = ~flat & leave[:, t]
+        buy_size = cash / c[t] * pct
+
+    return cash + size * c[-1], mdd
+
+
+def evaluate_macd_grid(df, combos, init_cash=1000000.0, chunk_size=CHUNK_SIZE, ema_cache=None):
+    """
+    一次評估整個 MACD 參數網格 (QuickMACD 規則)，回傳格式同 optimizer.evaluate_macd
+    EMA 跨 chunk 共用，每個 span 只算一次 (ema_cache 可由呼叫端傳入，跨多次呼叫共用)
+    """
+    o = df["open"].to_numpy(dtype=float)
+    c = df["close"].to_numpy(dtype=float)
+
+    if ema_cache is None:
+        ema_cache = {}
+    results = []
+    for k in range(0, len(combos), chunk_size):
+        chunk = combos[k : k + chunk_size]
+        up, down = macd_grid_signals(c, chunk, ema_cache)
+        final, mdd = simulate_grid(o, c, up, down, init_cash)
+        for (fast, slow, sig), final_val, dd in zip(chunk, final, mdd):
+            roi = (final_val - init_cash) / init_cash * 100
+            results.append(
+                {
+                    "params": f"({fast}, {slow}, {sig})",
+                    "roi": round(roi, 2),
+                    "final_value": int(final_val),
+                    "mdd": round(dd, 2),
+                }
+            )
+    return results
@@ -0,0 +1,144 @@
+import numpy as np
+import pandas as pd
+from backtester.engine.grid import ewm_rows
+from backtester.models import IndicatorState
+
+# 還原收盤價與狀態內紀錄的差超過此比例 -> 視為除權息調整，重新暖機
+RTOL = 1e-6
+# 暖機時建議抓的歷史長度 (EMA 種子的影響約剩 (1 - 2/41)^250 ≈ 0)
+WARM_PERIOD = "1y"
+
+
+def _as_series(closes):
+    """還原收盤價 -> 以 datetime.date 為 index、排序去重的 Series"""
+    closes = pd.Series(closes, dtype=float).dropna()
+    index = pd.to_datetime(closes.index)
+    if index.tz is not None:
+        index = index.tz_localize(None)
+    closes.index = index.date
+    closes = closes[~closes.index.duplicated(keep="last")]
+    return closes.sort_index()
+
+
+def _alpha(spans):
+    return 2.0 / (np.asarray(spans, dtype=float) + 1.0)
+
+
+def advance_macd(symbol, params, recent, load_history):
+    """
+    以最近幾根 K 棒推進每組 MACD 參數的 EMA 狀態 (與 pandas ewm adjust=False 相同的遞迴)
+    params: [(fast, slow, signal), ...]
+    recent: 最近幾天的還原收盤價 Series (要包含狀態的最後一天，用來檢查接縫)
+    load_history: 需要暖機時才呼叫，回傳較長的還原收盤價 Series
+
+    狀態不存在、中間有缺口 (最後一天不在 recent 裡)、或還原價被調整過時，
+    會以 load_history() 的整段歷史重新計算；否則每組參數每根新 K 棒只做幾個乘加
+
+    回傳 dict: date / close 與各組參數的 dif、signal、prev_dif、prev_signal、golden、death 陣列
+    """
+    params = np.asarray(params, dtype=int).reshape(-1, 3)
+    recent = _as_series(recent)
+    if recent.empty:
+        raise ValueError(f"{symbol} 沒有最新的 K 棒")
+
+    stored = {
+        (s.fast, s.slow, s.signal): s
+        for s in IndicatorState.objects.filter(symbol=symbol)
+    }
+
+    n = len(params)
+    ema_fast, ema_slow, ema_signal = np.zeros(n), np.zeros(n), np.zeros(n)
+    prev_dif, prev_signal = np.zeros(n), np.zeros(n)
+    last_date = np.empty(n, dtype=object)
+    warm = []
+    for i, key in enumerate(map(tuple, params)):
+        state = stored.get(key)
+        if (
+            state is None
+            or state.last_date not in recent.index
+            or not np.isclose(recent[state.last_date], state.last_close, rtol=RTOL)
+        ):
+            warm.append(i)
+            continue
+        ema_fast[i], ema_slow[i], ema_signal[i] = state.ema_fast, state.ema_slow, state.ema_signal
+        prev_dif[i], prev_signal[i] = state.prev_dif, state.prev_signal
+        last_date[i] = state.last_date
+
+    if warm:
+        history = _as_series(load_history())
+        closes = pd.concat([history[history.index < recent.index[0]], recent])
+        if len(closes) < 2:
+            raise ValueError(f"{symbol} 歷史資料不足，無法暖機")
+        w = params[warm]
+        fast = ewm_rows(closes.to_numpy(), w[:, 0])
+        slow = ewm_rows(closes.to_numpy(), w[:, 1])
+        signal = ewm_rows(fast - slow, w[:, 2])
+        ema_fast[warm], ema_slow[warm], ema_signal[warm] = fast[:, -1], slow[:, -1], signal[:, -1]
+        prev_dif[warm] = fast[:, -2] - slow[:, -2]
+        prev_signal[warm] = signal[:, -2]
+        last_date[warm] = closes.index[-1]
+
+    # O(1) 更新: 同一天結束的狀態一起往前推 (通常全部都是同一天)
+    a_fast, a_slow, a_signal = _alpha(params[:, 0]), _alpha(params[:, 1]), _alpha(params[:, 2])
+    for day in set(last_date):
+        rows = last_date == day
+        for close in recent[recent.index > day]:
+            prev_dif[rows] = ema_fast[rows] - ema_slow[rows]
+            prev_signal[rows] = ema_signal[rows]
+            ema_fast[rows] = a_fast[rows] * close + (1 - a_fast[rows]) * ema_fast[rows]
+            ema_slow[rows] = a_slow[rows] * close + (1 - a_slow[rows]) * ema_slow[rows]
+            dif = ema_fast[rows] - ema_slow[rows]
+            ema_signal[rows] = a_signal[rows] * dif + (1 - a_signal[rows]) * ema_signal[rows]
+
+    date, close = recent.index[-1], float(recent.iloc[-1])
+    IndicatorState.objects.bulk_create(
+        [
+            IndicatorState(
+                symbol=symbol,
+                fast=int(f),
+                slow=int(s),
+                signal=int(g),
+                last_date=date,
+                last_close=close,
+                ema_fast=float(ema_fast[i]),
+                ema_slow=float(ema_slow[i]),
+                ema_signal=float(ema_signal[i]),
+                prev_dif=float(prev_dif[i]),
+                prev_signal=float(prev_signal[i]),
+            )
+            for i, (f, s, g) in enumerate(params)
+        ],
+        batch_size=500,
+        update_conflicts=True,
+        unique_fields=["symbol", "fast", "slow", "signal"],
+        update_fields=[
+            "last_date",
+            "last_close",
+            "ema_fast",
+            "ema_slow",
+            "ema_signal",
+            "prev_dif",
+            "prev_signal",
+            "updated_at",
+        ],
+    )
+
+    dif = ema_fast - ema_slow
+    return {
+        "date": date,
+        "close": close,
+        "dif": dif,
+        "signal": ema_signal,
+        "prev_dif": prev_dif,
+        "prev_signal": prev_signal,
+        "golden": (prev_dif < prev_signal) & (dif > ema_signal),
+        "death": (prev_dif > prev_signal) & (dif < ema_signal),
+    }
+
+
+def provider_closes(symbol, period, provider=None):
+    """從共用的行情快取取還原收盤價 (adj_close)"""
+    from backtester.data.snapshot import market_snapshot
+
+    df = market_snapshot(symbol, period=period, provider=provider)
+    return df["adj_close"]
@@ -1,7 +1,17 @@
 import itertools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 import pandas as pd
 import yfinance as yf
 import backtrader as bt
+from django.core.exceptions import AppRegistryNotReady, ImproperlyConfigured
+from django.db import DatabaseError
+from backtester.data.columnar import load_price_frame_cached
+from backtester.engine.grid import CHUNK_SIZE, evaluate_macd_grid
+from backtester.engine.shared import share_arrays, attach_arrays, release
+from backtester.engine.walkforward import walk_forward
 
 
 # 簡易版策略
@@ -29,77 +39,230 @@ class QuickMACD(bt.Strategy):
             self.close()
 
 
-def optimize_macd(symbol="0050.TW", start="2020-01-01", end="2026-02-06"):
-    print(f"正在為 {symbol} 進行參數最佳化搜索 (含風險評估 MDD)...")
-    print("這可能需要 30~60 秒，請耐心等待...")
-
-    # 1. 抓取資料
+def load_optimizer_data(symbol, start, end):
+    """回傳清洗過的還原價 DataFrame，失敗回傳 None"""
     try:
-        df = yf.Ticker(symbol).history(start=start, end=end, auto_adjust=True)
-        if df.empty:
-            print("❌ 抓不到資料")
-            return
+        df = load_price_frame_cached(symbol, "adjusted", start, end)
+        if df is not None and not df.empty and _is_clean(symbol):
+            # ingestion 時已驗過 (沒有成交量為 0 的假 K 棒)，不必再篩
+            df = df.copy()
+            df["openinterest"] = 0
+            return df
+        if df is None or df.empty:
+            df = yf.Ticker(symbol).history(start=start, end=end, auto_adjust=True)
+            if df.empty:
+                print("❌ 抓不到資料")
+                return None
+            df.index = df.index.tz_localize(None)
+            df.columns = [c.lower() for c in df.columns]
+            df = df[["open", "high", "low", "close", "volume"]]
 
         # 資料清洗
-        df.index = df.index.tz_localize(None)
-        df.columns = [c.lower() for c in df.columns]
+        df = df[df["volume"] > 0].copy()
         df["openinterest"] = 0
-        df = df[df["volume"] > 0]
+        return df
 
     except Exception as e:
         print(f"資料抓取錯誤: {e}")
-        return
+        return None
 
-    # 2. 設定參數範圍 (你可以自行微調)
-    # 快線 (Fast): 5 到 20 (間隔 3)
-    fast_range = range(5, 21, 3)
-    # 慢線 (Slow): 20 到 60 (間隔 5)
-    slow_range = range(20, 61, 5)
-    # 訊號線 (Signal): 固定 9
-    signal_val = 9
 
-    results = []
+def _is_clean(symbol):
+    # 直接當腳本跑 (沒有 Django / 資料庫) 時一律當作需要清洗
+    try:
+        from backtester.data.quality import is_clean
+    except ImportError:
+        return False
+    try:
+        return is_clean(symbol)
+    except (ImproperlyConfigured, AppRegistryNotReady, DatabaseError):
+        return False
+
+
+def evaluate_macd(df, fast, slow, signal_val):
+    """單一組 MACD 參數的回測結果 (ROI / MDD / 最終資產)"""
+    cerebro = bt.Cerebro()
+    cerebro.broker.setcash(1000000)
+    cerebro.broker.setcommission(commission=0.002)
+    cerebro.addsizer(bt.sizers.AllInSizer, percents=95)
+
+    # 【關鍵新增】加入 DrawDown 分析器，計算最大虧損
+    cerebro.addanalyzer(bt.analyzers.DrawDown, _name="drawdown")
+
+    data = bt.feeds.PandasData(dataname=df)
+    cerebro.adddata(data)
+
+    cerebro.addstrategy(QuickMACD, m1=fast, m2=slow, m3=signal_val)
+
+    # 執行回測並獲取結果
+    strats = cerebro.run()
+    strat = strats[0]
+
+    final_val = cerebro.broker.getvalue()
+
+    # 從分析器提取 MDD (Max Drawdown)
+    # 這代表資產從最高點滑落的最大幅度
+    mdd = strat.analyzers.drawdown.get_analysis()["max"]["drawdown"]
+
+    profit = final_val - 1000000
+    roi = (profit / 1000000) * 100
+
+    return {
+        "params": f"({fast}, {slow}, {signal_val})",
+        "roi": round(roi, 2),
+        "final_value": int(final_val),
+        "mdd": round(mdd, 2),  # 保存 MDD
+    }
+
+
+# ==========================================
+# 平行化: 價格資料只放一次到 shared memory，worker 直接掛上去讀
+# ==========================================
+SHARED_COLS = ["open", "high", "low", "close", "volume"]
+
+# worker 行程內的全域資料 (initializer 建好後每個任務共用)
+_worker_shm = None
+_worker_df = None
+
+
+def share_frame(df):
+    """
+    把 DataFrame 放進 SharedMemory: 一塊 (欄位 x bars) 的 float64 + 一塊日期 int64
+    回傳 (shm 物件們, 給 worker 用的描述)
+    """
+    return share_arrays(
+        {
+            "values": df[SHARED_COLS].to_numpy(dtype=np.float64).T,
+            "dates": df.index.to_numpy(dtype="datetime64[ns]").view(np.int64),
+        }
+    )
+
+
+def _init_worker(spec):
+    global _worker_shm, _worker_df
+    _worker_shm, arrays = attach_arrays(spec)
+
+    arr = arrays["values"]
+    index = pd.DatetimeIndex(arrays["dates"].view("datetime64[ns]"))
+    # 每個 worker 只組一次 DataFrame (欄位直接指向 shared memory)
+    _worker_df = pd.DataFrame(
+        {col: arr[i] for i, col in enumerate(SHARED_COLS)}, index=index, copy=False
+    )
+    _worker_df["openinterest"] = 0
+
+
+def _evaluate_timed(df, combo):
+    t0 = time.perf_counter()
+    result = evaluate_macd(df, *combo)
+    return result, time.perf_counter() - t0
+
+
+def _evaluate_shared(combo):
+    return _evaluate_timed(_worker_df, combo)
+
+
+def macd_grid(fast_range, slow_range, signal_val):
+    return [
+        (fast, slow, signal_val)
+        for fast in fast_range
+        for slow in slow_range
+        if fast < slow
+    ]
+
+
+def iter_grid(df, combos, workers=None):
+    """
+    逐一產出 (結果, 耗時秒數)，順序與 combos 相同，讓呼叫端可以邊跑邊存
+    workers: None = 全部 CPU 核心，1 = 不開行程池
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or len(combos) <= 1:
+        for combo in combos:
+            yield _evaluate_timed(df, combo)
+        return
+
+    shms, spec = share_frame(df)
+    try:
+        with ProcessPoolExecutor(
+            max_workers=min(workers, len(combos)),
+            initializer=_init_worker,
+            initargs=(spec,),
+        ) as pool:
+            chunksize = max(1, len(combos) // (workers * 4))
+            yield from pool.map(_evaluate_shared, combos, chunksize=chunksize)
+    finally:
+        release(shms)
 
-    # 3. 暴力迴圈
-    for fast in fast_range:
-        for slow in slow_range:
-            if fast >= slow:
-                continue
 
-            cerebro = bt.Cerebro()
-            cerebro.broker.setcash(1000000)
-            cerebro.broker.setcommission(commission=0.002)
-            cerebro.addsizer(bt.sizers.AllInSizer, percents=95)
+def iter_grid_vector(df, combos, chunk_size=CHUNK_SIZE):
+    """向量化網格的串流版本: 每個 chunk 算完就產出，耗時平均分給該 chunk 的每一組"""
+    ema_cache = {}
+    for k in range(0, len(combos), chunk_size):
+        chunk = combos[k : k + chunk_size]
+        t0 = time.perf_counter()
+        results = evaluate_macd_grid(df, chunk, chunk_size=chunk_size, ema_cache=ema_cache)
+        runtime = (time.perf_counter() - t0) / len(chunk)
+        for res in results:
+            yield res, runtime
 
-            # 【關鍵新增】加入 DrawDown 分析器，計算最大虧損
-            cerebro.addanalyzer(bt.analyzers.DrawDown, _name="drawdown")
 
-            data = bt.feeds.PandasData(dataname=df)
-            cerebro.adddata(data)
+def run_grid(df, combos, workers=None):
+    """
+    執行整個參數網格，回傳順序與 combos 相同 (平行與序列結果完全一致)
+    workers: None = 全部 CPU 核心，1 = 不開行程池
+    """
+    return [res for res, _ in iter_grid(df, combos, workers)]
 
-            cerebro.addstrategy(QuickMACD, m1=fast, m2=slow, m3=signal_val)
 
-            # 執行回測並獲取結果
-            strats = cerebro.run()
-            strat = strats[0]
+def optimize_macd(
+    symbol="0050.TW",
+    start="2020-01-01",
+    end="2026-02-06",
+    workers=None,
+    engine="backtrader",
+    run_id=None,
+):
+    """
+    workers: 平行行程數 (None = 全部 CPU 核心，1 = 序列執行)
+    engine: "backtrader" (每組一個 Cerebro) 或 "vector" (整個網格一次用矩陣算完)
+    run_id: 有給的話結果分批寫進資料庫 (OptimizerRun / OptimizerResult)，
+            中斷後用同一個 run_id 重跑會跳過已完成的組合
+    回傳依 ROI 排序的結果 list
+    """
+    print(f"正在為 {symbol} 進行參數最佳化搜索 (含風險評估 MDD)...")
 
-            final_val = cerebro.broker.getvalue()
+    # 1. 抓取資料 (優先讀本地 mmap 價格快取，沒有才連 Yahoo)
+    df = load_optimizer_data(symbol, start, end)
+    if df is None:
+        return
 
-            # 從分析器提取 MDD (Max Drawdown)
-            # 這代表資產從最高點滑落的最大幅度
-            mdd = strat.analyzers.drawdown.get_analysis()["max"]["drawdown"]
+    # 2. 設定參數範圍 (你可以自行微調)
+    # 快線 (Fast): 5 到 20 (間隔 3)
+    fast_range = range(5, 21, 3)
+    # 慢線 (Slow): 20 到 60 (間隔 5)
+    slow_range = range(20, 61, 5)
+    # 訊號線 (Signal): 固定 9
+    signal_val = 9
 
-            profit = final_val - 1000000
-            roi = (profit / 1000000) * 100
+    combos = macd_grid(fast_range, slow_range, signal_val)
 
-            results.append(
-                {
-                    "params": f"({fast}, {slow}, {signal_val})",
-                    "roi": round(roi, 2),
-                    "final_value": int(final_val),
-                    "mdd": round(mdd, 2),  # 保存 MDD
-                }
-            )
+    # 3. 暴力搜索
+    t0 = time.perf_counter()
+    workers = workers or os.cpu_count() or 1
+    mode = "向量化網格" if engine == "vector" else f"{workers} 個行程"
+    if run_id:
+        results = _run_checkpointed(df, combos, symbol, start, end, workers, engine, run_id)
+    elif engine == "vector":
+        # 每個 EMA span 只算一次，所有組合同時撮合
+        results = evaluate_macd_grid(df, combos)
+    else:
+        # 多核心平行，每組一個 Cerebro
+        results = run_grid(df, combos, workers)
+    elapsed = time.perf_counter() - t0
+    print(
+        f"⏱️ {len(combos)} 組參數 ({mode})，耗時 {elapsed:.2f} 秒 "
+        f"({len(combos) / elapsed:.1f} 組/秒)"
+    )
 
     # 4. 排序並顯示結果
     # 這裡我們依然用 ROI 排序，但你可以觀察 MDD 欄位
@@ -120,6 +283,114 @@ def optimize_macd(symbol="0050.TW", start="2020-01-01", end="2026-02-06"):
             f"#{i+1:<4} {res['params']:<15} {res['roi']}%        {res['mdd']}% {risk_mark}        ${res['final_value']:,}"
         )
 
+    return sorted_results
+
+
+def _run_checkpointed(df, combos, symbol, start, end, workers, engine, run_id):
+    """邊跑邊分批寫入資料庫，中斷 (Ctrl+C / 例外) 時先把手上的結果寫完"""
+    from backtester.engine.runs import open_run, ResultWriter, finish_run
+
+    run, pending = open_run(run_id, symbol, combos, engine=engine, start=start, end=end)
+    if len(pending) < len(combos):
+        print(f"♻️ {run_id}: 已完成 {len(combos) - len(pending)} 組，接續剩下 {len(pending)} 組")
+
+    writer = ResultWriter(run)
+    stream = iter_grid_vector(df, pending) if engine == "vector" else iter_grid(df, pending, workers)
+    status = "interrupted"
+    try:
+        for res, runtime in stream:
+            writer.add(res, runtime)
+        status = "done"
+    finally:
+        writer.flush()
+        finish_run(run, status)
+
+    return list(
+        run.results.values("params", "roi", "final_value", "mdd")
+    )
+
+
+def search_strategy(
+    symbol="0050.TW",
+    strategy_name="macd",
+    ranges=None,
+    method="tpe",
+    max_evals=100,
+    max_seconds=None,
+    start="2020-01-01",
+    end="2026-02-06",
+):
+    """
+    用 random / successive halving / TPE 搜尋取代暴力網格
+    ranges 預設為 optimize_macd 的範圍再加上訊號線
+    """
+    # search -> runner -> models 需要 Django；放在這裡，process pool 的 worker import 本模組時不會碰到
+    from backtester.engine.search import search_params
+
+    df = load_optimizer_data(symbol, start, end)
+    if df is None:
+        return
+
+    if ranges is None:
+        ranges = {"m1": range(5, 21), "m2": range(20, 61), "m3": range(5, 13)}
+
+    out = search_params(
+        df, strategy_name, ranges, method=method, max_evals=max_evals, max_seconds=max_seconds
+    )
+    print(
+        f"🔎 {method} 搜尋: {out['evaluations']} 次回測 / 網格 {out['grid_size']} 組，"
+        f"耗時 {out['elapsed']} 秒"
+    )
+    for i, res in enumerate(out["results"][:15]):
+        risk_mark = "⚠️" if res["mdd"] > 30 else "  "
+        print(f"#{i+1:<4} {res['params']}  {res['roi']}%  MDD {res['mdd']}% {risk_mark}")
+    return out
+
+
+def walk_forward_macd(
+    symbol="0050.TW",
+    start="2015-01-01",
+    end="2026-02-06",
+    train_bars=500,
+    test_bars=120,
+    anchored=False,
+    workers=None,
+):
+    """
+    Walk-forward 版本的 optimize_macd: 滾動訓練 / 樣本外測試，避免單次樣本內搜尋過度擬合
+    參數範圍同 optimize_macd，訊號線另外試 6 / 9 / 12
+    """
+    df = load_optimizer_data(symbol, start, end)
+    if df is None:
+        return
+
+    combos = []
+    for signal_val in (6, 9, 12):
+        combos += macd_grid(range(5, 21, 3), range(20, 61, 5), signal_val)
+
+    t0 = time.perf_counter()
+    out = walk_forward(df, combos, train_bars, test_bars, anchored, workers)
+    elapsed = time.perf_counter() - t0
+
+    mode = "anchored" if anchored else "rolling"
+    print(f"\n========== 🔁 {symbol} Walk-Forward ({mode}, {len(combos)} 組參數) ==========")
+    print(f"訓練 {train_bars} 根 / 測試 {test_bars} 根，耗時 {elapsed:.2f} 秒")
+    print("-" * 80)
+    for w in out["windows"]:
+        flag = "🔄" if w["changed"] else "  "
+        print(
+            f"#{w['window']:<3} 測試 {w['test_start']}~{w['test_end']} {w['params']:<14}{flag} "
+            f"樣本內 {w['train_roi']}% | OOS {w['oos_roi']}% (MDD {w['oos_mdd']}%)"
+        )
+    print("-" * 80)
+    summary = out["summary"]
+    print(
+        f"OOS 總報酬 {summary['oos_return_pct']}% | OOS MDD {summary['oos_mdd']}% | "
+        f"換參數 {summary['param_changes']} 次 | 最常用 {summary['most_common_params']} "
+        f"({summary['most_common_share'] * 100:.0f}%)"
+    )
+    return out
+
 
 if __name__ == "__main__":
     optimize_macd()
@@ -0,0 +1,97 @@
+from django.db import transaction
+from backtester.models import OptimizerRun, OptimizerResult
+
+# 每累積幾筆結果寫一次資料庫
+BATCH_SIZE = 200
+
+
+def _day(value):
+    """date / "YYYY-MM-DD" / None 統一成字串方便比較"""
+    return str(value)[:10] if value else None
+
+
+def open_run(run_id, symbol, combos, strategy="macd", engine="backtrader", start=None, end=None):
+    """
+    建立或接續一次最佳化
+    回傳 (run, 尚未評估的 combos)，已經寫進資料庫的組合會被跳過
+    """
+    run, created = OptimizerRun.objects.get_or_create(
+        run_id=run_id,
+        defaults={
+            "symbol": symbol,
+            "strategy": strategy,
+            "engine": engine,
+            "start": start,
+            "end": end,
+            "total": len(combos),
+        },
+    )
+    if not created:
+        stored = (run.symbol, run.strategy, run.engine, _day(run.start), _day(run.end))
+        wanted = (symbol, strategy, engine, _day(start), _day(end))
+        if stored != wanted:
+            # 資料區間或引擎不同時接續會把兩份資料的結果混在同一次最佳化裡
+            raise ValueError(
+                f"run_id {run_id} 已被 {' / '.join(str(v) for v in stored)} 使用，"
+                f"與這次的 {' / '.join(str(v) for v in wanted)} 不同"
+            )
+
+    done = set(run.results.values_list("params", flat=True))
+    pending = [c for c in combos if f"{tuple(c)}" not in done]
+
+    OptimizerRun.objects.filter(pk=run.pk).update(
+        status="running", total=max(run.total, len(combos))
+    )
+    return run, pending
+
+
+class ResultWriter:
+    """結果先放在記憶體，滿 batch_size 筆才用一次 bulk_create 寫入"""
+
+    def __init__(self, run, batch_size=BATCH_SIZE):
+        self.run = run
+        self.batch_size = batch_size
+        self.buffer = []
+        self.written = 0
+
+    def add(self, result, runtime=0.0):
+        self.buffer.append(
+            OptimizerResult(
+                run=self.run,
+                params=result["params"],
+                roi=result["roi"],
+                mdd=result["mdd"],
+                final_value=result["final_value"],
+                runtime=runtime,
+            )
+        )
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        with transaction.atomic():
+            OptimizerResult.objects.bulk_create(self.buffer, ignore_conflicts=True)
+        self.written += len(self.buffer)
+        self.buffer = []
+
+
+def finish_run(run, status="done"):
+    OptimizerRun.objects.filter(pk=run.pk).update(status=status)
+
+
+def top_results(run_id, k=10, max_mdd=None, min_roi=None):
+    """
+    依 ROI 取前 k 名，可用 max_mdd (例如 30 = MDD < 30%) / min_roi 過濾
+    回傳格式同 optimizer.evaluate_macd (另含 runtime)
+    """
+    qs = OptimizerResult.objects.filter(run__run_id=run_id)
+    if max_mdd is not None:
+        qs = qs.filter(mdd__lt=max_mdd)
+    if min_roi is not None:
+        qs = qs.filter(roi__gte=min_roi)
+    return list(
+        qs.order_by("-roi", "mdd")
+        .values("params", "roi", "mdd", "final_value", "runtime")[:k]
+    )
@@ -0,0 +1,228 @@
+import datetime
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from backtester.data.columnar import load_price_arrays
+from backtester.engine.grid import ema_rows, crossover_rows, _ffill_rows
+
+# 每支股票取最近幾根 K 棒 (200 日均線 + EMA 收斂需要的長度)
+LOOKBACK = 400
+
+# 預設掃描的策略 (參數名稱與 backtrader 策略一致，算法同 engine/vector.py)
+SCAN_CONFIG = {
+    "macd": [(12, 26, 9), (14, 40, 9)],
+    "kd": {"k_period": 9, "d_period": 3, "buy_threshold": 20, "sell_threshold": 80},
+    "trend": {"ma_period": 200},
+}
+
+
+# ==========================================
+# 讀資料: 每支股票一段 mmap 切片 -> 對齊成 (股票數 x bars) 矩陣
+# ==========================================
+def _load_from_db(symbols, end, lookback):
+    """沒有 columnar cache 的股票一次查資料庫 (日曆天抓寬一點再截)"""
+    from django.db.models import Max
+    from backtester.models import AdjustedStockHistory
+
+    qs = AdjustedStockHistory.objects.filter(symbol__in=symbols)
+    if end:
+        qs = qs.filter(date__lte=end)
+    last = qs.aggregate(last=Max("date"))["last"]
+    if last is None:
+        return {}
+    qs = qs.filter(date__gte=last - datetime.timedelta(days=lookback * 2 + 30))
+    rows = {}
+    for symbol, date, h, l, c in qs.order_by("symbol", "date").values_list(
+        "symbol", "date", "high", "low", "close"
+    ).iterator(chunk_size=10000):
+        rows.setdefault(symbol, []).append((date, h, l, c))
+
+    out = {}
+    for symbol, items in rows.items():
+        items = items[-lookback:]
+        date, h, l, c = zip(*items)
+        out[symbol] = {
+            "date": np.array(date, dtype="datetime64[D]"),
+            "high": np.array(h, dtype=float),
+            "low": np.array(l, dtype=float),
+            "close": np.array(c, dtype=float),
+        }
+    return out
+
+
+def load_universe_matrix(symbols, end=None, lookback=LOOKBACK, root=None):
+    """
+    讀取還原價並對齊日期 (所有股票日期的聯集，取最後 lookback 根)
+    停牌的日子往前補值，上市較晚的股票開頭為 NaN
+    回傳 dict: symbols / dates / high / low / close 矩陣 / last_date (每支股票自己的最後一天) / missing
+    """
+    arrays = {}
+    missing = []
+    for symbol in symbols:
+        a = load_price_arrays(symbol, "adjusted", end=end, root=root)
+        if a is None or len(a["date"]) == 0:
+            missing.append(symbol)
+        else:
+            arrays[symbol] = {k: a[k][-lookback:] for k in ("date", "high", "low", "close")}
+
+    if missing:
+        arrays.update(_load_from_db(missing, end, lookback))
+        missing = [s for s in missing if s not in arrays]
+
+    names = [s for s in symbols if s in arrays]
+    if not names:
+        return {"symbols": [], "dates": np.array([], dtype="datetime64[D]"), "missing": missing}
+
+    dates = np.unique(np.concatenate([arrays[s]["date"] for s in names]))[-lookback:]
+    shape = (len(names), len(dates))
+    out = {k: np.full(shape, np.nan) for k in ("high", "low", "close")}
+    last_date = np.empty(len(names), dtype="datetime64[D]")
+    for i, symbol in enumerate(names):
+        a = arrays[symbol]
+        keep = a["date"] >= dates[0]
+        pos = np.searchsorted(dates, a["date"][keep])
+        for k in out:
+            out[k][i, pos] = a[k][keep]
+        last_date[i] = a["date"][-1]
+    for k in out:
+        out[k] = _ffill_rows(out[k])
+
+    out.update(symbols=names, dates=dates, last_date=last_date, missing=missing)
+    return out
+
+
+# ==========================================
+# 2D 指標 (每列一支股票)
+# ==========================================
+def sma_rows(x, period):
+    out = np.full(x.shape, np.nan)
+    if period <= x.shape[1]:
+        out[:, period - 1 :] = sliding_window_view(x, period, axis=1).mean(axis=2)
+    return out
+
+
+def _window_rows(x, period, func):
+    out = np.full(x.shape, np.nan)
+    if period <= x.shape[1]:
+        out[:, period - 1 :] = func(sliding_window_view(x, period, axis=1), axis=2)
+    return out
+
+
+def stochastic_rows(high, low, close, period, period_dfast=3, period_dslow=3):
+    """bt.indicators.Stochastic (慢速 KD) 的 2D 版本，回傳 (percK, percD)"""
+    hh = _window_rows(high, period, np.max)
+    ll = _window_rows(low, period, np.min)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        k = 100.0 * ((close - ll) / (hh - ll))
+    perc_k = sma_rows(k, period_dfast)
+    return perc_k, sma_rows(perc_k, period_dslow)
+
+
+def macd_rows(close, combos):
+    """
+    所有股票 x 所有 MACD 參數一起算 (bt.MACD)
+    回傳 (dif, signal)，形狀 (組數, 股票數, bars)
+    """
+    combos = np.asarray(combos, dtype=int).reshape(-1, 3)
+    rows = len(close)
+    spans = np.unique(combos[:, :2])
+    # 每個 span 只算一次: (span 數 x 股票數) 列一起遞迴
+    ema = ema_rows(np.tile(close, (len(spans), 1)), np.repeat(spans, rows))
+    ema = dict(zip(spans, ema.reshape(len(spans), rows, -1)))
+    dif = np.stack([ema[f] - ema[s] for f, s in combos[:, :2]])
+    signal = ema_rows(dif.reshape(len(combos) * rows, -1), np.repeat(combos[:, 2], rows))
+    return dif, signal.reshape(dif.shape)
+
+
+# ==========================================
+# 掃描
+# ==========================================
+def scan_universe(symbols, config=None, end=None, lookback=LOOKBACK, root=None):
+    """
+    對整個股票池算最新一根的 MACD 交叉 / KD / 趨勢訊號
+    回傳 dict: date / rows (每支股票一筆) / stale (資料沒更新到最新一天) / missing (沒有資料)
+    """
+    config = config or SCAN_CONFIG
+    m = load_universe_matrix(symbols, end=end, lookback=lookback, root=root)
+    if not m["symbols"]:
+        return {"date": None, "rows": [], "stale": [], "missing": m["missing"]}
+
+    close, high, low = m["close"], m["high"], m["low"]
+    combos = [tuple(int(v) for v in p) for p in config.get("macd", [])]
+    kd = config.get("kd")
+    trend = config.get("trend")
+
+    if combos:
+        dif, signal = macd_rows(close, combos)
+        flat = (len(combos) * len(close), -1)
+        up, down = crossover_rows(dif.reshape(flat), signal.reshape(flat))
+        golden = up[:, -1].reshape(len(combos), -1)
+        death = down[:, -1].reshape(len(combos), -1)
+    if kd:
+        perc_k, perc_d = stochastic_rows(high, low, close, kd["k_period"], kd["d_period"], kd["d_period"])
+        kd_up, kd_down = crossover_rows(perc_k, perc_d)
+    if trend:
+        ma = sma_rows(close, trend["ma_period"])
+
+    latest = m["dates"][-1]
+    rows, stale = [], []
+    for i, symbol in enumerate(m["symbols"]):
+        if m["last_date"][i] < latest:
+            stale.append({"symbol": symbol, "last_date": str(m["last_date"][i])})
+            continue
+
+        row = {"symbol": symbol, "close": round(float(close[i, -1]), 2), "signals": []}
+        for j, (f, s, g) in enumerate(combos):
+            name = f"MACD({f},{s},{g})"
+            if golden[j, i]:
+                row["signals"].append(f"{name} 黃金交叉")
+            elif death[j, i]:
+                row["signals"].append(f"{name} 死亡交叉")
+        if combos:
+            row["macd_bullish"] = int((dif[:, i, -1] > signal[:, i, -1]).sum())
+        if kd:
+            k, d = perc_k[i, -1], perc_d[i, -1]
+            row["k"] = None if np.isnan(k) else round(float(k), 2)
+            row["d"] = None if np.isnan(d) else round(float(d), 2)
+            if k < kd["buy_threshold"]:
+                row["signals"].append("KD 超賣")
+            elif k > kd["sell_threshold"]:
+                row["signals"].append("KD 超買")
+            if kd_up[i, -1]:
+                row["signals"].append("KD 黃金交叉")
+            elif kd_down[i, -1]:
+                row["signals"].append("KD 死亡交叉")
+        if trend:
+            above = close[i, -1] > ma[i, -1]
+            row["above_ma"] = None if np.isnan(ma[i, -1]) else bool(above)
+            if not np.isnan(ma[i, -2]) and above != (close[i, -2] > ma[i, -2]):
+                row["signals"].append(f"{'站上' if above else '跌破'} {trend['ma_period']} 日均線")
+        rows.append(row)
+
+    return {
+        "date": str(latest),
+        "rows": rows,
+        "stale": stale,
+        "missing": m["missing"],
+    }
+
+
+def format_report(result):
+    """整理成一封信的內文: 有訊號的股票在前"""
+    if result["date"] is None:
+        return f"沒有可掃描的資料 (缺資料: {', '.join(result['missing'])})"
+
+    hits = [r for r in result["rows"] if r["signals"]]
+    lines = [
+        f"📅 資料日期: {result['date']} | 掃描 {len(result['rows'])} 支，{len(hits)} 支有訊號",
+        "-" * 35,
+    ]
+    for r in hits:
+        lines.append(f"{r['symbol']:<10} {r['close']:>8} | {'、'.join(r['signals'])}")
+    if not hits:
+        lines.append("😴 今日無特殊訊號")
+    if result["stale"]:
+        lines.append("-" * 35)
+        lines.append("⚠️ 資料未更新: " + ", ".join(f"{s['symbol']}({s['last_date']})" for s in result["stale"]))
+    if result["missing"]:
+        lines.append("⚠️ 沒有資料: " + ", ".join(result["missing"]))
+    return "\n".join(lines)
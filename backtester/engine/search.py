@@ -0,0 +1,273 @@
+import itertools
+import time
+import numpy as np
+from backtester.engine.runner import STRATEGY_MAP
+from backtester.engine.vector import run_vector_backtest
+from backtester.strategies.optimized_strategies import MACDStrategy
+
+# 參數之間的限制 (不合理的組合直接跳過，不吃預算)
+CONSTRAINTS = {
+    MACDStrategy: lambda p: p["m1"] < p["m2"],  # 快線要比慢線短
+}
+
+
+class Budget:
+    """搜尋預算: 回測次數上限 及/或 秒數上限，兩者任一用完就停"""
+
+    def __init__(self, max_evals=None, max_seconds=None):
+        self.max_evals = max_evals
+        self.max_seconds = max_seconds
+        self.evals = 0
+        self.started = time.perf_counter()
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def exhausted(self):
+        if self.max_evals is not None and self.evals >= self.max_evals:
+            return True
+        if self.max_seconds is not None and self.elapsed >= self.max_seconds:
+            return True
+        return False
+
+
+class ParamSpace:
+    """
+    離散參數空間: 每個參數一組候選值 (使用者給的 range / list)
+    沒給範圍的參數使用策略預設值
+    """
+
+    def __init__(self, strat_class, ranges):
+        valid_keys = list(strat_class.params._getkeys())
+        unknown = set(ranges) - set(valid_keys)
+        if unknown:
+            raise ValueError(f"{strat_class.__name__} 沒有參數: {sorted(unknown)}")
+
+        self.defaults = dict(strat_class.params._getitems())
+        self.keys = [k for k in valid_keys if k in ranges]
+        self.values = [np.asarray(list(ranges[k])) for k in self.keys]
+        self.constraint = CONSTRAINTS.get(strat_class)
+
+    @property
+    def size(self):
+        return int(np.prod([len(v) for v in self.values]))
+
+    def to_params(self, idx):
+        """候選值索引 tuple -> 完整參數 dict"""
+        p = dict(self.defaults)
+        for key, values, i in zip(self.keys, self.values, idx):
+            p[key] = int(values[i])
+        return p
+
+    def is_valid(self, idx):
+        return self.constraint is None or self.constraint(self.to_params(idx))
+
+    def sample(self, rng, n, exclude=()):
+        """隨機抽 n 組不重複且合法的索引；exclude 傳 set 時直接拿來查 (不複製)"""
+        if not isinstance(exclude, (set, frozenset)):
+            exclude = set(exclude)
+        picked = set()
+        out = []
+        attempts = 0
+        while len(out) < n and attempts < n * 50:
+            attempts += 1
+            idx = tuple(int(rng.integers(len(v))) for v in self.values)
+            if idx in exclude or idx in picked or not self.is_valid(idx):
+                continue
+            picked.add(idx)
+            out.append(idx)
+
+        if len(out) < n and self.size <= 100000:
+            # 空間快被抽完時隨機命中率很低，改成列舉剩下的組合
+            rest = [
+                idx
+                for idx in itertools.product(*(range(len(v)) for v in self.values))
+                if idx not in exclude and idx not in picked and self.is_valid(idx)
+            ]
+            rng.shuffle(rest)
+            out += rest[: n - len(out)]
+        return out
+
+
+def evaluate_params(df, strat_class, params, init_cash=1000000.0):
+    """以向量引擎回測一組參數，回傳 ROI / MDD / 最終資產"""
+    final_value, equity, _ = run_vector_backtest(df, strat_class, params, init_cash)
+    equity = np.asarray(equity)
+    peak = np.maximum.accumulate(equity)
+    mdd = float(np.max(100.0 * (peak - equity) / peak))
+    return {
+        "params": params,
+        "roi": round((final_value - init_cash) / init_cash * 100, 2),
+        "mdd": round(mdd, 2),
+        "final_value": int(final_value),
+        "bars": len(df),
+    }
+
+
+# ==========================================
+# 搜尋方法
+# ==========================================
+def _evaluate(df, space, strat_class, idx, budget, init_cash):
+    res = evaluate_params(df, strat_class, space.to_params(idx), init_cash)
+    res["_idx"] = idx
+    budget.evals += 1
+    return res
+
+
+def _random_search(df, space, strat_class, budget, rng, init_cash):
+    results = []
+    tried = set()
+    while not budget.exhausted():
+        batch = space.sample(rng, 1, exclude=tried)
+        if not batch:
+            break  # 整個空間都試過了
+        tried.add(batch[0])
+        results.append(_evaluate(df, space, strat_class, batch[0], budget, init_cash))
+    return results
+
+
+def _successive_halving(df, space, strat_class, budget, rng, init_cash, eta=3, rungs=3, min_bars=250):
+    """
+    先用很多組參數在「最近一小段」資料上跑，每一輪只留下前 1/eta 晉級，
+    資料窗拉長 eta 倍再跑，最後一輪用完整資料
+    """
+    n_total = budget.max_evals or min(space.size, 1000)
+    # 讓所有輪次加起來剛好用完次數預算: n0 * (1 + 1/eta + 1/eta^2 ...)
+    n0 = max(1, int(n_total / sum(eta**-k for k in range(rungs))))
+    candidates = space.sample(rng, min(n0, space.size))
+
+    results = []
+    for rung in range(rungs):
+        window = max(min_bars, int(len(df) / eta ** (rungs - 1 - rung)))
+        data = df.iloc[-window:]
+
+        scored = []
+        for idx in candidates:
+            if budget.exhausted():
+                break
+            res = _evaluate(data, space, strat_class, idx, budget, init_cash)
+            res["rung"] = rung
+            scored.append(res)
+
+        if not scored:
+            break
+        results = scored
+        if rung == rungs - 1 or budget.exhausted():
+            break
+
+        scored.sort(key=lambda r: r["roi"], reverse=True)
+        keep = max(1, len(scored) // eta)
+        candidates = [r["_idx"] for r in scored[:keep]]
+    return results
+
+
+def _tpe_search(df, space, strat_class, budget, rng, init_cash,
+                n_startup=10, gamma=0.25, n_candidates=64):
+    """
+    TPE 風格的代理模型搜尋:
+    把已評估的結果分成好 (前 gamma) / 壞兩群，各參數以平滑後的離散分佈 l(x)、g(x) 建模，
+    從 l(x) 抽候選，挑 l(x)/g(x) 最大的下一組來跑
+    """
+    results = []
+    for idx in space.sample(rng, n_startup):  # 暖身: 先隨機跑幾組
+        if budget.exhausted():
+            break
+        results.append(_evaluate(df, space, strat_class, idx, budget, init_cash))
+    seen = {r["_idx"] for r in results}
+    if not results:
+        return results
+
+    while not budget.exhausted() and len(seen) < space.size:
+        ranked = sorted(results, key=lambda r: r["roi"], reverse=True)
+        n_good = max(1, int(np.ceil(gamma * len(ranked))))
+        good = np.array([r["_idx"] for r in ranked[:n_good]])
+        bad = np.array([r["_idx"] for r in ranked[n_good:]] or [ranked[-1]["_idx"]])
+
+        # 每個維度: 以索引距離做高斯平滑的離散 Parzen 估計
+        l_probs, g_probs = [], []
+        for d, values in enumerate(space.values):
+            grid = np.arange(len(values))
+            bw = max(1.0, len(values) / 10)
+            l_probs.append(_parzen(good[:, d], grid, bw))
+            g_probs.append(_parzen(bad[:, d], grid, bw))
+
+        cand = np.stack(
+            [rng.choice(len(p), size=n_candidates, p=p) for p in l_probs], axis=1
+        )
+        score = np.zeros(n_candidates)
+        for d in range(len(space.values)):
+            score += np.log(l_probs[d][cand[:, d]]) - np.log(g_probs[d][cand[:, d]])
+
+        pick = None
+        for i in np.argsort(-score):
+            idx = tuple(int(v) for v in cand[i])
+            if idx not in seen and space.is_valid(idx):
+                pick = idx
+                break
+        if pick is None:
+            # 候選都試過了，退回隨機抽樣
+            batch = space.sample(rng, 1, exclude=seen)
+            if not batch:
+                break
+            pick = batch[0]
+
+        results.append(_evaluate(df, space, strat_class, pick, budget, init_cash))
+        seen.add(pick)
+    return results
+
+
+def _parzen(points, grid, bw):
+    """離散 Parzen 估計 (含均勻先驗，避免機率為 0)"""
+    weights = np.exp(-0.5 * ((grid[None, :] - points[:, None]) / bw) ** 2).sum(axis=0)
+    weights += 1.0 / len(grid)
+    return weights / weights.sum()
+
+
+SEARCH_METHODS = {
+    "random": _random_search,
+    "halving": _successive_halving,
+    "tpe": _tpe_search,
+}
+
+
+def search_params(
+    df,
+    strategy_name,
+    ranges,
+    method="tpe",
+    max_evals=100,
+    max_seconds=None,
+    seed=0,
+    init_cash=1000000.0,
+    **options,
+):
+    """
+    參數搜尋 (取代暴力網格)，適用 STRATEGY_MAP 裡的任何策略
+    ranges: {"m1": range(5, 21), "m2": range(20, 61, 5), ...}，key 必須是策略參數
+    method: random / halving (successive halving) / tpe (代理模型)
+    預算: max_evals (回測次數) 及/或 max_seconds (秒數)
+
+    回傳 {"results": 依 ROI 排序的 list, "evaluations": 次數, "grid_size": 網格大小, "elapsed": 秒}
+    halving 的 results 為最後一輪 (最長資料窗) 的成績
+    """
+    strat_class = STRATEGY_MAP[strategy_name]
+    space = ParamSpace(strat_class, ranges)
+    if method not in SEARCH_METHODS:
+        raise ValueError(f"未知的搜尋方法: {method}")
+
+    budget = Budget(max_evals, max_seconds)
+    rng = np.random.default_rng(seed)
+    results = SEARCH_METHODS[method](
+        df, space, strat_class, budget, rng, init_cash, **options
+    )
+
+    for r in results:
+        r.pop("_idx", None)
+    results.sort(key=lambda r: r["roi"], reverse=True)
+    return {
+        "results": results,
+        "evaluations": budget.evals,
+        "grid_size": space.size,
+        "elapsed": round(budget.elapsed, 3),
+    }
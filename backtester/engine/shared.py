@@ -0,0 +1,36 @@
+from multiprocessing import shared_memory
+import numpy as np
+
+
+def share_arrays(arrays):
+    """
+    把多個 NumPy 陣列各自複製進一塊 SharedMemory
+    回傳 (shm 物件 list, 給 worker 用的描述 {name: (shm 名稱, shape, dtype)})
+    呼叫端用完要 release()
+    """
+    shms = []
+    spec = {}
+    for name, arr in arrays.items():
+        arr = np.ascontiguousarray(arr)
+        shm = shared_memory.SharedMemory(create=True, size=max(1, arr.nbytes))
+        np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)[...] = arr
+        shms.append(shm)
+        spec[name] = (shm.name, arr.shape, arr.dtype.str)
+    return shms, spec
+
+
+def attach_arrays(spec):
+    """worker 端依描述掛上 SharedMemory，回傳 (shm 物件 list, {name: 陣列})，不複製資料"""
+    shms = []
+    arrays = {}
+    for name, (shm_name, shape, dtype) in spec.items():
+        shm = shared_memory.SharedMemory(name=shm_name)
+        shms.append(shm)
+        arrays[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+    return shms, arrays
+
+
+def release(shms):
+    for shm in shms:
+        shm.close()
+        shm.unlink()
@@ -0,0 +1,226 @@
+import asyncio
+import math
+from collections import deque
+
+NAN = float("nan")
+
+
+# ==========================================
+# O(1) 增量指標 (算法與 engine/vector.py 的 bt 版本相同)
+# ==========================================
+class EMAState:
+    """bt.EMA: 前 period 根的 SMA 當種子，之後 prev * (1 - alpha) + x * alpha"""
+
+    __slots__ = ("period", "alpha", "count", "total", "value")
+
+    def __init__(self, period):
+        self.period = period
+        self.alpha = 2.0 / (1.0 + period)
+        self.count = 0
+        self.total = 0.0
+        self.value = NAN
+
+    def update(self, x):
+        if self.count < self.period:
+            self.count += 1
+            self.total += x
+            if self.count == self.period:
+                self.value = self.total / self.period
+            return self.value
+        self.value += (x - self.value) * self.alpha
+        return self.value
+
+
+class CrossState:
+    """bt.CrossOver: 以「上一個非零差值」判斷交叉，回傳 1 (向上) / -1 (向下) / 0"""
+
+    __slots__ = ("prev",)
+
+    def __init__(self):
+        self.prev = 0.0
+
+    def update(self, diff):
+        if diff != diff:  # NaN (指標還沒暖機完成)
+            return 0
+        cross = 0
+        if self.prev < 0.0 < diff:
+            cross = 1
+        elif self.prev > 0.0 > diff:
+            cross = -1
+        if diff != 0.0:
+            self.prev = diff
+        return cross
+
+
+class MACDState:
+    __slots__ = ("name", "fast", "slow", "signal", "cross", "dif", "sig")
+
+    def __init__(self, m1, m2, m3):
+        self.name = f"MACD({m1},{m2},{m3})"
+        self.fast, self.slow, self.signal = EMAState(m1), EMAState(m2), EMAState(m3)
+        self.cross = CrossState()
+        self.dif = self.sig = NAN
+
+    def update(self, bar):
+        close = bar["close"]
+        fast = self.fast.update(close)
+        slow = self.slow.update(close)
+        if slow != slow:
+            return 0
+        self.dif = fast - slow
+        self.sig = self.signal.update(self.dif)
+        return self.cross.update(self.dif - self.sig)
+
+
+class _WindowExtreme:
+    """單調佇列: 最近 period 根的最大 (sign=1) / 最小 (sign=-1)，攤銷 O(1)"""
+
+    __slots__ = ("period", "sign", "items")
+
+    def __init__(self, period, sign):
+        self.period = period
+        self.sign = sign
+        self.items = deque()  # (index, sign * value)，值遞減
+
+    def update(self, i, x):
+        x *= self.sign
+        items = self.items
+        while items and items[-1][1] <= x:
+            items.pop()
+        items.append((i, x))
+        if items[0][0] <= i - self.period:
+            items.popleft()
+        return items[0][1] * self.sign
+
+
+class _SMAWindow:
+    __slots__ = ("period", "values")
+
+    def __init__(self, period):
+        self.period = period
+        self.values = deque(maxlen=period)
+
+    def update(self, x):
+        self.values.append(x)
+        if len(self.values) < self.period:
+            return NAN
+        return math.fsum(self.values) / self.period  # 視窗只有幾根，NaN 會自然移出
+
+
+class KDState:
+    """bt.indicators.Stochastic (慢速 KD)，K 向上 / 向下穿越 D 視為交叉"""
+
+    __slots__ = ("name", "period", "i", "hh", "ll", "k_sma", "d_sma", "cross", "k", "d")
+
+    def __init__(self, period=9, period_dfast=3, period_dslow=3):
+        self.name = "KD"
+        self.period = period
+        self.i = 0
+        self.hh = _WindowExtreme(period, 1)
+        self.ll = _WindowExtreme(period, -1)
+        self.k_sma = _SMAWindow(period_dfast)
+        self.d_sma = _SMAWindow(period_dslow)
+        self.cross = CrossState()
+        self.k = self.d = NAN
+
+    def update(self, bar):
+        hh = self.hh.update(self.i, bar["high"])
+        ll = self.ll.update(self.i, bar["low"])
+        self.i += 1
+        if self.i < self.period:
+            return 0
+        span = hh - ll
+        raw = 100.0 * (bar["close"] - ll) / span if span else NAN
+        self.k = self.k_sma.update(raw)
+        self.d = self.d_sma.update(self.k)
+        return self.cross.update(self.k - self.d)
+
+
+# ==========================================
+# 多檔股票的串流引擎
+# ==========================================
+class StreamEngine:
+    """
+    每檔股票一組指標狀態，每根 K 棒 O(1) 更新
+    - 同一檔股票時間沒有往前的 K 棒 (重送 / 亂序) 直接丟掉
+    - 同一個 (股票, 指標, 方向, 時間) 的事件只發一次
+    macd: [(m1, m2, m3), ...]；kd: (period, dfast, dslow) 或 None
+    """
+
+    def __init__(self, macd=((12, 26, 9),), kd=(9, 3, 3), on_event=None):
+        self.macd = [tuple(p) for p in macd]
+        self.kd = tuple(kd) if kd else None
+        self.on_event = on_event
+        self.states = {}  # symbol -> [指標狀態, ...]
+        self.last_time = {}  # symbol -> 最後處理的 K 棒時間
+        self.bars = 0
+        self.dropped = 0
+        self.events = 0
+
+    def _new_states(self):
+        states = [MACDState(*p) for p in self.macd]
+        if self.kd:
+            states.append(KDState(*self.kd))
+        return states
+
+    def process(self, bar):
+        """處理一根 K 棒，回傳這根產生的事件 list"""
+        symbol, when = bar["symbol"], bar["time"]
+        last = self.last_time.get(symbol)
+        if last is not None and when <= last:
+            self.dropped += 1
+            return []
+        self.last_time[symbol] = when
+
+        states = self.states.get(symbol)
+        if states is None:
+            states = self.states[symbol] = self._new_states()
+
+        self.bars += 1
+        events = []
+        for state in states:
+            cross = state.update(bar)
+            if cross:
+                events.append({
+                    "symbol": symbol,
+                    "time": when,
+                    "indicator": state.name,
+                    "type": "golden" if cross > 0 else "death",
+                    "close": bar["close"],
+                })
+        if events:
+            self.events += len(events)
+            if self.on_event is not None:
+                for event in events:
+                    self.on_event(event)
+        return events
+
+    async def run(self, feed):
+        """消化一個 feed 直到結束；多個 feed 可以 asyncio.gather 一起跑 (共用同一組狀態)"""
+        async for bar in feed.bars():
+            self.process(bar)
+        return self.stats()
+
+    def snapshot(self, symbol):
+        """某檔股票目前的指標值"""
+        out = {}
+        for state in self.states.get(symbol, []):
+            if isinstance(state, MACDState):
+                out[state.name] = {"dif": state.dif, "signal": state.sig}
+            else:
+                out[state.name] = {"k": state.k, "d": state.d}
+        return out
+
+    def stats(self):
+        return {
+            "symbols": len(self.states),
+            "bars": self.bars,
+            "dropped": self.dropped,
+            "events": self.events,
+        }
+
+
+async def run_streams(engine, feeds):
+    """多個 feed (例如不同券商連線 / 不同股票群組) 同時餵同一個引擎"""
+    await asyncio.gather(*(engine.run(feed) for feed in feeds))
+    return engine.stats()
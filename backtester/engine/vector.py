@@ -0,0 +1,217 @@
+import math
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from backtester.strategies.kd_strategy import Taiwan50KDStrategy
+from backtester.strategies.optimized_strategies import TrendKDStrategy, MACDStrategy
+
+# 與 Cerebro 設定一致: AllInSizer(percents=95) + 0.2% 手續費
+PERCENTS = 95
+COMMISSION = 0.002
+
+
+# ==========================================
+# 指標 (與 backtrader 的計算方式一致)
+# ==========================================
+def sma(x, period):
+    """簡單移動平均，前 period-1 根為 NaN (與 bt.SMA 相同)"""
+    x = np.asarray(x, dtype=float)
+    out = np.full(len(x), np.nan)
+    if period <= len(x):
+        out[period - 1 :] = sliding_window_view(x, period).sum(axis=1) / period
+    return out
+
+
+def ema(x, period):
+    """
+    指數移動平均 (bt.EMA 版本)
+    以第一段 period 根的 SMA 當種子，之後 prev * (1 - alpha) + x * alpha
+    NaN 開頭的序列 (例如 DIF) 會從第一個有效值開始起算
+    """
+    x = np.asarray(x, dtype=float)
+    out = np.full(len(x), np.nan)
+    valid = np.flatnonzero(~np.isnan(x))
+    if len(valid) == 0:
+        return out
+
+    first = valid[0]
+    seed = first + period - 1
+    if seed >= len(x):
+        return out
+
+    alpha = 2.0 / (1.0 + period)
+    alpha1 = 1.0 - alpha
+    prev = math.fsum(x[first : seed + 1]) / period
+    out[seed] = prev
+    # 遞迴本質上無法向量化，但只是純 float 運算，比 Cerebro 的逐 bar 迴圈輕很多
+    for i in range(seed + 1, len(x)):
+        prev = prev * alpha1 + x[i] * alpha
+        out[i] = prev
+    return out
+
+
+def highest(x, period):
+    out = np.full(len(x), np.nan)
+    if period <= len(x):
+        out[period - 1 :] = sliding_window_view(x, period).max(axis=1)
+    return out
+
+
+def lowest(x, period):
+    out = np.full(len(x), np.nan)
+    if period <= len(x):
+        out[period - 1 :] = sliding_window_view(x, period).min(axis=1)
+    return out
+
+
+def stochastic(high, low, close, period, period_dfast=3, period_dslow=3):
+    """bt.indicators.Stochastic (慢速 KD)，回傳 (percK, percD)"""
+    hh = highest(high, period)
+    ll = lowest(low, period)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        k = 100.0 * ((close - ll) / (hh - ll))
+    perc_k = sma(k, period_dfast)
+    perc_d = sma(perc_k, period_dslow)
+    return perc_k, perc_d
+
+
+def macd(close, m1, m2, m3):
+    """bt.indicators.MACD，回傳 (macd, signal)"""
+    dif = ema(close, m1) - ema(close, m2)
+    return dif, ema(dif, m3)
+
+
+# ==========================================
+# 策略訊號 (逐 bar 的進出場條件 -> 布林陣列)
+# ==========================================
+def _ready(*lines):
+    """所有指標都有值的 bar 才會進入 next() (等同 Cerebro 的 minperiod)"""
+    ok = np.ones(len(lines[0]), dtype=bool)
+    for line in lines:
+        ok &= ~np.isnan(line)
+    return ok
+
+
+def kd_signals(o, h, l, c, p):
+    perc_k, perc_d = stochastic(
+        h, l, c, p["k_period"], p["d_period"], p["d_period"]
+    )
+    ready = _ready(perc_k, perc_d)
+    buy = ready & (perc_k < p["buy_threshold"])
+    sell = ready & (perc_k > p["sell_threshold"])
+    return buy, sell
+
+
+def trend_kd_signals(o, h, l, c, p):
+    # 注意: TrendKDStrategy 的 Stochastic 只吃 k_period，d_period 維持預設 3
+    perc_k, perc_d = stochastic(h, l, c, p["k_period"])
+    ma = sma(c, p["ma_period"])
+    ready = _ready(perc_k, perc_d, ma)
+    buy = ready & (c > ma) & (perc_k > perc_d)
+    sell = ready & ((perc_k < perc_d) | (c < ma))
+    return buy, sell
+
+
+def macd_signals(o, h, l, c, p):
+    dif, signal = macd(c, p["m1"], p["m2"], p["m3"])
+    ready = _ready(dif, signal)
+    buy = ready & (dif > signal)  # 金叉
+    sell = ready & (dif < signal)  # 死叉
+    return buy, sell
+
+
+SIGNAL_MAP = {
+    Taiwan50KDStrategy: kd_signals,
+    TrendKDStrategy: trend_kd_signals,
+    MACDStrategy: macd_signals,
+}
+
+
+# ==========================================
+# 撮合與淨值
+# ==========================================
+def simulate(o, c, buy, sell, init_cash, percents=PERCENTS, commission=COMMISSION):
+    """
+    單一部位、全進全出的撮合 (語意同 Cerebro 預設 broker):
+    - 第 i 根收盤出訊號 -> 第 i+1 根開盤成交
+    - 股數 = 現金 / 訊號日收盤 * percents%
+    - 開盤跳空導致現金不足 (含手續費) 時該筆委託作廢 (Margin)
+    只在「交易事件」之間跳躍，不逐 bar 迴圈
+
+    回傳 (最終資產, 每日淨值陣列, 成交清單 [(bar, size, price), ...])
+    """
+    n = len(c)
+    buy_idx = np.flatnonzero(buy)
+    sell_idx = np.flatnonzero(sell)
+
+    cash = float(init_cash)
+    fills = []
+    # 每根 bar 結束時的現金與持股 (以區段填值)
+    cash_line = np.empty(n)
+    size_line = np.zeros(n)
+
+    i = 0
+    while True:
+        k = np.searchsorted(buy_idx, i)
+        if k >= len(buy_idx) or buy_idx[k] + 1 >= n:
+            break
+        entry = buy_idx[k] + 1
+        cash_line[i:entry] = cash
+
+        size = cash / c[entry - 1] * (percents / 100)
+        price = o[entry]
+        cost = size * price
+        comm = cost * commission
+        if cash - cost - comm < 0.0:
+            # 資金不足，委託作廢，成交日當天重新判斷
+            i = entry
+            continue
+
+        cash = cash - cost - comm
+        fills.append((entry, size, price))
+
+        k = np.searchsorted(sell_idx, entry)
+        if k >= len(sell_idx) or sell_idx[k] + 1 >= n:
+            # 抱到最後
+            cash_line[entry:] = cash
+            size_line[entry:] = size
+            i = n
+            break
+
+        exit_ = sell_idx[k] + 1
+        cash_line[entry:exit_] = cash
+        size_line[entry:exit_] = size
+
+        exit_price = o[exit_]
+        cash += size * price + size * (exit_price - price)
+        cash -= size * exit_price * commission
+        fills.append((exit_, -size, exit_price))
+        i = exit_
+
+    cash_line[i:] = cash
+    equity = cash_line + size_line * c
+    return float(equity[-1]), equity, fills
+
+
+def run_vector_backtest(df, strat_class, strat_params=None, init_cash=1000000.0):
+    """
+    以 NumPy 向量化執行回測，結果與 Cerebro 路徑相同
+    df 欄位: open, high, low, close (index 為日期)
+    回傳 (最終資產, 每日淨值 list, 成交紀錄 [(Timestamp, size, price), ...])
+    """
+    signal_func = SIGNAL_MAP.get(strat_class)
+    if signal_func is None:
+        raise ValueError(f"向量引擎不支援策略: {strat_class.__name__}")
+
+    p = dict(strat_class.params._getitems())
+    p.update(strat_params or {})
+
+    o = df["open"].to_numpy(dtype=float)
+    h = df["high"].to_numpy(dtype=float)
+    l = df["low"].to_numpy(dtype=float)
+    c = df["close"].to_numpy(dtype=float)
+
+    buy, sell = signal_func(o, h, l, c, p)
+    final_value, equity, fills = simulate(o, c, buy, sell, init_cash)
+
+    transactions = [(df.index[bar], size, price) for bar, size, price in fills]
+    return final_value, equity.tolist(), transactions
@@ -0,0 +1,162 @@
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from backtester.engine.grid import macd_grid_signals, simulate_grid
+from backtester.engine.shared import share_arrays, attach_arrays, release
+from backtester.engine.vector import simulate
+
+# worker 行程內共用的陣列 (o, c, 交叉矩陣)
+_worker_shm = None
+_worker_arrays = None
+
+
+def walk_forward_windows(n, train_bars, test_bars, anchored=False):
+    """
+    切出 (train_start, train_end, test_start, test_end) 的 bar 索引 (end 不含)
+    rolling: 訓練窗固定長度往前滾；anchored: 訓練窗起點固定在第 0 根
+    """
+    windows = []
+    start = 0
+    while start + train_bars + test_bars <= n:
+        train_start = 0 if anchored else start
+        train_end = start + train_bars
+        windows.append((train_start, train_end, train_end, train_end + test_bars))
+        start += test_bars
+    return windows
+
+
+def _run_window(arrays, window, init_cash):
+    """在訓練窗挑出最佳參數，再拿去測試窗跑樣本外 (OOS)"""
+    o, c, up, down = arrays["o"], arrays["c"], arrays["up"], arrays["down"]
+    train_start, train_end, test_start, test_end = window
+
+    # 指標矩陣在整段歷史只算一次，這裡只是切片
+    train = slice(train_start, train_end)
+    final, _ = simulate_grid(o[train], c[train], up[:, train], down[:, train], init_cash)
+    best = int(np.argmax(final))
+
+    test = slice(test_start, test_end)
+    oos_final, equity, fills = simulate(
+        o[test], c[test], up[best, test], down[best, test], init_cash
+    )
+    return {
+        "best": best,
+        "train_roi": (final[best] - init_cash) / init_cash * 100,
+        "oos_final": oos_final,
+        "equity": equity,
+        "trades": len(fills),
+    }
+
+
+def _init_worker(spec):
+    global _worker_shm, _worker_arrays
+    _worker_shm, _worker_arrays = attach_arrays(spec)
+
+
+def _run_window_shared(args):
+    window, init_cash = args
+    return _run_window(_worker_arrays, window, init_cash)
+
+
+def _max_drawdown(equity):
+    peak = np.maximum.accumulate(equity)
+    return float(np.max(100.0 * (peak - equity) / peak)) if len(equity) else 0.0
+
+
+def walk_forward(df, combos, train_bars=500, test_bars=120, anchored=False,
+                 workers=None, init_cash=1000000.0):
+    """
+    MACD 參數的 walk-forward 最佳化
+    每個訓練窗用向量化網格選出 ROI 最高的參數，在緊接著的測試窗做樣本外回測，
+    各測試窗的淨值串接成一條 OOS 曲線
+    各窗彼此獨立，workers > 1 時以多行程平行執行 (價格與交叉矩陣放在 shared memory)
+
+    回傳 {"windows": [...每窗報表], "equity": {"dates", "values"}, "summary": {...}}
+    """
+    o = df["open"].to_numpy(dtype=float)
+    c = df["close"].to_numpy(dtype=float)
+    up, down = macd_grid_signals(c, combos)
+    arrays = {"o": o, "c": c, "up": up, "down": down}
+
+    windows = walk_forward_windows(len(df), train_bars, test_bars, anchored)
+    if not windows:
+        raise ValueError(
+            f"資料只有 {len(df)} 根，不足一個訓練窗 + 測試窗 ({train_bars} + {test_bars})"
+        )
+
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or len(windows) <= 1:
+        outcomes = [_run_window(arrays, w, init_cash) for w in windows]
+    else:
+        shms, spec = share_arrays(arrays)
+        try:
+            with ProcessPoolExecutor(
+                max_workers=min(workers, len(windows)),
+                initializer=_init_worker,
+                initargs=(spec,),
+            ) as pool:
+                outcomes = list(
+                    pool.map(_run_window_shared, [(w, init_cash) for w in windows])
+                )
+        finally:
+            release(shms)
+
+    # --- 串接 OOS 淨值 & 整理報表 ---
+    dates = df.index
+    stitched = []
+    stitched_dates = []
+    capital = init_cash
+    report = []
+    prev_best = None
+    for k, (window, out) in enumerate(zip(windows, outcomes)):
+        train_start, train_end, test_start, test_end = window
+        scale = capital / init_cash
+        stitched.extend(out["equity"] * scale)
+        stitched_dates.extend(dates[test_start:test_end])
+        capital = out["oos_final"] * scale
+
+        fast, slow, sig = combos[out["best"]]
+        report.append(
+            {
+                "window": k + 1,
+                "train_start": dates[train_start].strftime("%Y-%m-%d"),
+                "train_end": dates[train_end - 1].strftime("%Y-%m-%d"),
+                "test_start": dates[test_start].strftime("%Y-%m-%d"),
+                "test_end": dates[test_end - 1].strftime("%Y-%m-%d"),
+                "params": f"({fast}, {slow}, {sig})",
+                "train_roi": round(out["train_roi"], 2),
+                "oos_roi": round((out["oos_final"] - init_cash) / init_cash * 100, 2),
+                "oos_mdd": round(_max_drawdown(out["equity"]), 2),
+                "trades": out["trades"],
+                "changed": prev_best is not None and out["best"] != prev_best,
+            }
+        )
+        prev_best = out["best"]
+
+    chosen = np.array([combos[out["best"]] for out in outcomes])
+    counts = Counter(r["params"] for r in report)
+    most_common, hits = counts.most_common(1)[0]
+    stitched = np.asarray(stitched)
+    summary = {
+        "windows": len(report),
+        "oos_return_pct": round((capital - init_cash) / init_cash * 100, 2),
+        "oos_mdd": round(_max_drawdown(stitched), 2),
+        # 參數穩定度: 換參數的次數、最常出現的參數占比、各參數的標準差
+        "param_changes": sum(r["changed"] for r in report),
+        "distinct_params": len(counts),
+        "most_common_params": most_common,
+        "most_common_share": round(hits / len(report), 2),
+        "param_std": {
+            name: round(float(chosen[:, i].std()), 2)
+            for i, name in enumerate(["fast", "slow", "signal"])
+        },
+    }
+    return {
+        "windows": report,
+        "equity": {
+            "dates": [d.strftime("%Y-%m-%d") for d in stitched_dates],
+            "values": [round(float(v), 2) for v in stitched],
+        },
+        "summary": summary,
+    }
@@ -0,0 +1,62 @@
+import time
+from datetime import date
+from django.core.management.base import BaseCommand, CommandError
+from backtester.engine.arena import TOP_STRATEGIES, backfill_arena
+
+
+def parse_grid(text):
+    """fast_min:fast_max,slow_min:slow_max,sig_min:sig_max (含頭尾)，只保留 fast < slow"""
+    try:
+        (f0, f1), (s0, s1), (g0, g1) = [tuple(int(v) for v in part.split(":")) for part in text.split(",")]
+    except ValueError:
+        raise CommandError(f"--grid 格式錯誤: {text}")
+    return [
+        (f, s, g)
+        for f in range(f0, f1 + 1)
+        for s in range(s0, s1 + 1)
+        for g in range(g0, g1 + 1)
+        if f < s
+    ]
+
+
+class Command(BaseCommand):
+    help = "用資料庫裡的歷史股價回補 / 重算策略競技場 (PaperTrading)，例如: backfill_arena --start 2025-01-01"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--symbol", type=str, default="0050.TW")
+        parser.add_argument("--start", type=str, required=True, help="YYYY-MM-DD")
+        parser.add_argument("--end", type=str, default=None, help="YYYY-MM-DD (預設到最新)")
+        parser.add_argument("--strategies", nargs="+", default=None, help="MACD 參數，例如 11,45,9 5,35,9 (預設 Top 10)")
+        parser.add_argument("--grid", type=str, default=None, help="整個參數網格，例如 5:20,25:60,9:9")
+        parser.add_argument("--init-capital", type=float, default=1000000)
+
+    def handle(self, *args, **options):
+        if options["grid"]:
+            strategies = parse_grid(options["grid"])
+        elif options["strategies"]:
+            try:
+                strategies = [tuple(int(v) for v in p.split(",")) for p in options["strategies"]]
+            except ValueError:
+                raise CommandError(f"--strategies 格式錯誤: {' '.join(options['strategies'])}")
+            if any(len(s) != 3 for s in strategies):
+                raise CommandError("--strategies 每組要有 快,慢,訊號 三個數字")
+        else:
+            strategies = TOP_STRATEGIES
+
+        try:
+            start = date.fromisoformat(options["start"])
+            end = date.fromisoformat(options["end"]) if options["end"] else None
+        except ValueError:
+            raise CommandError("日期格式錯誤，請用 YYYY-MM-DD")
+        t0 = time.perf_counter()
+        try:
+            days = backfill_arena(strategies, options["symbol"], start, end, options["init_capital"])
+        except ValueError as e:
+            raise CommandError(str(e))
+        elapsed = time.perf_counter() - t0
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"回補 {len(strategies)} 個策略 x {days} 天 = {len(strategies) * days} 筆，耗時 {elapsed:.1f} 秒"
+            )
+        )
@@ -0,0 +1,118 @@
+import threading
+import time
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, connections, OperationalError
+from backtester.models import AdjustedStockHistory
+from backtester.data.writer import bulk_write
+from backtester.engine.runner import load_price_frame
+from backtester.management.commands.benchmark_ingest import synthetic_frames
+
+# SQLite 預設行為 (rollback journal + 每次 commit fsync)，當作對照組
+DEFAULT_PRAGMAS = {"journal_mode": "DELETE", "synchronous": "FULL"}
+
+FIELDS = ["open", "high", "low", "close", "volume", "factor"]
+
+
+class Command(BaseCommand):
+    help = "同時跑回測讀取與 ingestion 寫入，比較 SQLite 預設值與調校後 PRAGMA 的吞吐量"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--readers", type=int, default=4)
+        parser.add_argument("--writers", type=int, default=2)
+        parser.add_argument("--seconds", type=float, default=5.0)
+        parser.add_argument("--symbols", type=int, default=10)
+
+    def handle(self, *args, **options):
+        frames = []
+        for symbol, df in synthetic_frames(options["symbols"] * 2500):
+            df["factor"] = 1.0
+            frames.append((symbol, df))
+            bulk_write(AdjustedStockHistory, symbol, df, FIELDS)
+
+        profiles = [("預設", DEFAULT_PRAGMAS)]
+        if connection.vendor == "sqlite":
+            profiles.append(("調校 (settings)", dict(settings.SQLITE_PRAGMAS)))
+
+        original = getattr(settings, "SQLITE_PRAGMAS", {})
+        self.stdout.write(
+            f"{'設定':<16} {'讀取/秒':>10} {'讀 p95(ms)':>11} {'寫入/秒':>10} {'寫 p95(ms)':>11} {'錯誤':>6}"
+        )
+        try:
+            for label, pragmas in profiles:
+                settings.SQLITE_PRAGMAS = pragmas
+                connections.close_all()  # 讓新連線套用這組 PRAGMA
+                stats = self.run_round(frames, **options)
+                self.stdout.write(
+                    f"{label:<16} {stats['reads'] / options['seconds']:>10.1f} {stats['read_p95']:>11.1f} "
+                    f"{stats['writes'] / options['seconds']:>10.1f} {stats['write_p95']:>11.1f} {stats['errors']:>6}"
+                )
+        finally:
+            settings.SQLITE_PRAGMAS = original
+            connections.close_all()
+            AdjustedStockHistory.objects.filter(symbol__startswith="BENCH").delete()
+
+    def run_round(self, frames, readers, writers, seconds, **kwargs):
+        stop = time.perf_counter() + seconds
+        lock = threading.Lock()
+        stats = {"read_ms": [], "write_ms": [], "errors": 0}
+
+        def reader(k):
+            rng = np.random.default_rng(k)
+            times = []
+            errors = 0
+            try:
+                while time.perf_counter() < stop:
+                    symbol, _ = frames[rng.integers(len(frames))]
+                    t0 = time.perf_counter()
+                    try:
+                        load_price_frame(AdjustedStockHistory, symbol)
+                        times.append((time.perf_counter() - t0) * 1000)
+                    except OperationalError:
+                        errors += 1
+            finally:
+                connection.close()
+            with lock:
+                stats["read_ms"] += times
+                stats["errors"] += errors
+
+        def writer(k):
+            rng = np.random.default_rng(100 + k)
+            times = []
+            errors = 0
+            try:
+                while time.perf_counter() < stop:
+                    # 模擬每日增量: 改寫某支股票最後 20 根
+                    symbol, df = frames[rng.integers(len(frames))]
+                    tail = df.iloc[-20:].copy()
+                    tail["close"] *= 1 + rng.normal(0, 0.001)
+                    t0 = time.perf_counter()
+                    try:
+                        bulk_write(AdjustedStockHistory, symbol, tail, FIELDS)
+                        times.append((time.perf_counter() - t0) * 1000)
+                    except OperationalError:
+                        errors += 1
+            finally:
+                connection.close()
+            with lock:
+                stats["write_ms"] += times
+                stats["errors"] += errors
+
+        threads = [threading.Thread(target=reader, args=(k,)) for k in range(readers)]
+        threads += [threading.Thread(target=writer, args=(k,)) for k in range(writers)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        def p95(values):
+            return float(np.percentile(values, 95)) if values else 0.0
+
+        return {
+            "reads": len(stats["read_ms"]),
+            "writes": len(stats["write_ms"]),
+            "read_p95": p95(stats["read_ms"]),
+            "write_p95": p95(stats["write_ms"]),
+            "errors": stats["errors"],
+        }
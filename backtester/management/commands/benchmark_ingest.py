@@ -0,0 +1,82 @@
+import time
+import numpy as np
+import pandas as pd
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from backtester.models import StockHistory
+from backtester.data.writer import bulk_write
+
+# 每支合成股票的天數 (約 20 年)，總列數不夠整除時最後一支少一點
+BARS_PER_SYMBOL = 5000
+
+
+def synthetic_frames(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range("2005-01-03", periods=BARS_PER_SYMBOL)
+    k = 0
+    while rows > 0:
+        n = min(rows, BARS_PER_SYMBOL)
+        close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, n)))
+        yield f"BENCH{k:04d}", pd.DataFrame(
+            {
+                "open": close * 0.999,
+                "high": close * 1.01,
+                "low": close * 0.99,
+                "close": close,
+                "volume": rng.integers(1_000, 100_000, n),
+            },
+            index=dates[:n],
+        )
+        rows -= n
+        k += 1
+
+
+def write_objects(symbol, df):
+    """舊寫法: 每列一個 model 物件 (iterrows) + 不分批的 bulk_create"""
+    objs = [
+        StockHistory(
+            symbol=symbol,
+            date=index.date(),
+            open=row["open"],
+            high=row["high"],
+            low=row["low"],
+            close=row["close"],
+            volume=int(row["volume"]),
+        )
+        for index, row in df.iterrows()
+    ]
+    StockHistory.objects.bulk_create(objs, ignore_conflicts=True)
+    return len(objs)
+
+
+class Command(BaseCommand):
+    help = "量測 StockHistory 寫入速度 (列/秒)，資料寫在 transaction 內，結束後 rollback"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=str, default="10000,100000,1000000")
+        parser.add_argument(
+            "--baseline-max",
+            type=int,
+            default=100000,
+            help="舊寫法 (iterrows) 只量到這個列數，太大會跑很久",
+        )
+
+    def handle(self, *args, **options):
+        sizes = [int(x) for x in options["rows"].split(",")]
+        self.stdout.write(f"{'列數':>10} {'寫法':<22} {'秒數':>8} {'列/秒':>12}")
+
+        for rows in sizes:
+            frames = list(synthetic_frames(rows))
+            cases = [("bulk_write (upsert)", lambda s, d: bulk_write(StockHistory, s, d))]
+            if rows <= options["baseline_max"]:
+                cases.insert(0, ("iterrows + bulk_create", write_objects))
+
+            for label, write in cases:
+                with transaction.atomic():
+                    t0 = time.perf_counter()
+                    count = sum(write(symbol, df) for symbol, df in frames)
+                    elapsed = time.perf_counter() - t0
+                    transaction.set_rollback(True)
+                self.stdout.write(
+                    f"{count:>10,} {label:<22} {elapsed:>8.2f} {count / elapsed:>12,.0f}"
+                )
@@ -1,6 +1,6 @@
-import yfinance as yf
 from django.core.management.base import BaseCommand
-from backtester.models import StockHistory
+from backtester.data.providers import get_provider
+from backtester.data.ingest import ingest_history
 
 
 class Command(BaseCommand):
@@ -8,30 +8,22 @@ class Command(BaseCommand):
 
     def add_arguments(self, parser):
         parser.add_argument("symbol", type=str)
+        parser.add_argument(
+            "--provider",
+            type=str,
+            default=None,
+            help="資料來源: yahoo, local (預設依 settings.PRICE_PROVIDER)",
+        )
 
     def handle(self, *args, **options):
         symbol = options["symbol"]
         if symbol.isdigit():
             symbol = f"{symbol}.TW"
 
-        self.stdout.write(f"正在從 Yahoo Finance 抓取 {symbol} 十年數據...")
-        ticker = yf.Ticker(symbol)
-        df = ticker.history(period="10y")  # 抓取 10 年
+        self.stdout.write(f"正在抓取 {symbol} 十年數據...")
+        df = get_provider(options["provider"]).history(symbol, period="10y")  # 抓取 10 年
 
-        records = []
-        for date, row in df.iterrows():
-            records.append(
-                StockHistory(
-                    symbol=symbol,
-                    date=date.date(),
-                    open=row["Open"],
-                    high=row["High"],
-                    low=row["Low"],
-                    close=row["Close"],
-                    volume=row["Volume"],
-                )
-            )
-
-        # 使用批量建立提高寫入效率
-        StockHistory.objects.bulk_create(records, ignore_conflicts=True)
-        self.stdout.write(self.style.SUCCESS(f"成功儲存 {len(records)} 筆紀錄"))
+        # 原始價與還原價一起寫入；整段重抓時舊的還原價要一起換掉，
+        # 否則抓取區間之外的還原因子停在舊的，除權息後還原價會出現斷層 (抓不到資料時不會刪)
+        count = ingest_history(symbol, df, replace=True)
+        self.stdout.write(self.style.SUCCESS(f"成功儲存 {count} 筆紀錄"))
@@ -0,0 +1,63 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from backtester.data.providers import get_provider
+from backtester.data.fetcher import fetch_universe, load_universe
+
+
+class Command(BaseCommand):
+    help = "一次更新多支股票 (平行下載 + 限速 + 重試)，例如: fetch_universe --universe tw50"
+
+    def add_arguments(self, parser):
+        parser.add_argument("symbols", nargs="*", type=str)
+        parser.add_argument(
+            "--universe",
+            type=str,
+            default=None,
+            help="股票池名稱 (tw50) 或檔案路徑 (一行一個代號)",
+        )
+        parser.add_argument("--workers", type=int, default=8, help="同時下載的執行緒數")
+        parser.add_argument("--rate", type=float, default=5.0, help="每秒最多幾個請求")
+        parser.add_argument("--retries", type=int, default=3)
+        parser.add_argument("--full", action="store_true", help="全部整段重抓")
+        parser.add_argument(
+            "--provider",
+            type=str,
+            default=None,
+            help="資料來源: yahoo, local (預設依 settings.PRICE_PROVIDER)",
+        )
+
+    def handle(self, *args, **options):
+        symbols = list(options["symbols"])
+        if options["universe"]:
+            try:
+                symbols += load_universe(options["universe"], allow_path=True)
+            except ValueError as e:
+                raise CommandError(str(e))
+        if not symbols:
+            raise CommandError("請給股票代號或 --universe")
+
+        self.stdout.write(f"正在更新 {len(symbols)} 支股票...")
+        t0 = time.perf_counter()
+        results = fetch_universe(
+            symbols,
+            provider=get_provider(options["provider"]),
+            workers=options["workers"],
+            rate=options["rate"],
+            retries=options["retries"],
+            full=options["full"],
+        )
+        elapsed = time.perf_counter() - t0
+
+        for res in results:
+            if res["status"] == "ok":
+                self.stdout.write(f"{res['symbol']:<10} {res['mode']:<12} {res['count']} 筆")
+            else:
+                self.stdout.write(
+                    self.style.ERROR(f"{res['symbol']:<10} {res['status']} {res['error'] or ''}")
+                )
+
+        ok = sum(r["status"] == "ok" for r in results)
+        rows = sum(r["count"] for r in results)
+        self.stdout.write(
+            self.style.SUCCESS(f"完成 {ok}/{len(results)} 支，共寫入 {rows} 筆，耗時 {elapsed:.1f} 秒")
+        )
@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+from backtester.engine.optimizer import optimize_macd
+from backtester.engine.runs import top_results
+
+
+class Command(BaseCommand):
+    help = "MACD 參數最佳化 (給 --run-id 會把結果存進資料庫，中斷後可接續)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("symbol", type=str)
+        parser.add_argument("--start", type=str, default="2020-01-01")
+        parser.add_argument("--end", type=str, default="2026-02-06")
+        parser.add_argument("--workers", type=int, default=None)
+        parser.add_argument(
+            "--engine",
+            type=str,
+            default="backtrader",
+            help="可選: backtrader, vector (NumPy 向量化)",
+        )
+        parser.add_argument("--run-id", type=str, default=None)
+        parser.add_argument("--top", type=int, default=10)
+        parser.add_argument(
+            "--max-mdd", type=float, default=None, help="只列出 MDD 低於此值 (%%) 的結果"
+        )
+
+    def handle(self, *args, **options):
+        symbol = options["symbol"]
+        if symbol.isdigit() and not symbol.endswith(".TW"):
+            symbol = f"{symbol}.TW"
+
+        results = optimize_macd(
+            symbol,
+            options["start"],
+            options["end"],
+            workers=options["workers"],
+            engine=options["engine"],
+            run_id=options["run_id"],
+        )
+        if results is None:
+            self.stdout.write(self.style.ERROR(f"最佳化失敗，抓不到 {symbol} 的資料"))
+            return
+
+        if options["run_id"]:
+            top = top_results(options["run_id"], options["top"], max_mdd=options["max_mdd"])
+            self.stdout.write(self.style.SUCCESS(f"\n{options['run_id']} 前 {len(top)} 名:"))
+            for i, res in enumerate(top):
+                self.stdout.write(
+                    f"#{i + 1:<4} {res['params']:<15} {res['roi']}%  MDD {res['mdd']}%"
+                )
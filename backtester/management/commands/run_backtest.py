@@ -13,16 +13,23 @@ class Command(BaseCommand):
             default="default_kd",
             help="可選: default_kd, trend_kd, macd",
         )
+        parser.add_argument(
+            "--engine",
+            type=str,
+            default="backtrader",
+            help="可選: backtrader, vector (NumPy 向量化)",
+        )
 
     def handle(self, *args, **options):
         symbol = options["symbol"]
         strat = options["strategy"]
+        engine = options["engine"]
 
         if symbol.isdigit() and not symbol.endswith(".TW"):
             symbol = f"{symbol}.TW"
             
         self.stdout.write(f"正在以 {strat} 策略執行 {symbol} 回測...")
-        final_value = run_backtest_from_db(symbol, strategy_name=strat)
+        final_value = run_backtest_from_db(symbol, strategy_name=strat, engine=engine)
 
         if final_value == 0:
             self.stdout.write(
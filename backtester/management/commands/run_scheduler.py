@@ -0,0 +1,61 @@
+import asyncio
+import signal
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from backtester.models import JobRun
+from backtester.scheduler import Scheduler, load_jobs, next_fire, run_job_now
+
+
+class Command(BaseCommand):
+    help = "背景排程服務 (不需要視窗)，工作設定在 settings.SCHEDULER_JOBS，例如: run_scheduler / run_scheduler --run top10_arena"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--only", nargs="+", default=None, help="只排這幾個工作")
+        parser.add_argument("--run", type=str, default=None, help="立刻執行一次指定的工作後結束")
+        parser.add_argument("--list", action="store_true", help="列出工作、下次執行時間與最近紀錄")
+
+    def handle(self, *args, **options):
+        jobs = load_jobs()
+        if options["only"]:
+            unknown = set(options["only"]) - set(jobs)
+            if unknown:
+                raise CommandError(f"沒有這些工作: {', '.join(sorted(unknown))}")
+            jobs = {name: jobs[name] for name in options["only"]}
+
+        if options["list"]:
+            return self.list_jobs(jobs)
+
+        if options["run"]:
+            try:
+                run = run_job_now(options["run"], jobs=jobs, log=self.stdout.write)
+            except ValueError as e:
+                raise CommandError(str(e))
+            if run.status not in ("success", "skipped"):
+                raise CommandError(f"{run.job} {run.status}: {run.error}")
+            return
+
+        scheduler = Scheduler(jobs, log=self.stdout.write)
+        self.stdout.write(f"排程啟動: {', '.join(j.name for j in jobs.values() if j.at)} (Ctrl+C 結束)")
+        asyncio.run(self.serve(scheduler))
+        self.stdout.write("排程已停止")
+
+    async def serve(self, scheduler):
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, scheduler.stop)
+            except (NotImplementedError, RuntimeError):
+                pass  # Windows: Ctrl+C 直接以 KeyboardInterrupt 結束
+        await scheduler.serve()
+
+    def list_jobs(self, jobs):
+        now = timezone.now()
+        for job in jobs.values():
+            fire = next_fire(job.at, now, job.trading_days_only) if job.at else None
+            self.stdout.write(
+                f"{job.name:<16} 下次: {fire:%Y-%m-%d %H:%M}" if fire else f"{job.name:<16} (只能手動執行)"
+            )
+            for run in JobRun.objects.filter(job=job.name)[:5]:
+                self.stdout.write(
+                    f"    {run.started_at:%Y-%m-%d %H:%M:%S} {run.trigger:<8} {run.status:<8} 嘗試 {run.attempts} 次"
+                )
@@ -0,0 +1,51 @@
+import json
+import time
+from datetime import date
+from django.core.management.base import BaseCommand, CommandError
+from backtester.data.fetcher import load_universe
+from backtester.data.providers import normalize_symbol
+from backtester.engine.scanner import LOOKBACK, format_report, scan_universe
+
+
+class Command(BaseCommand):
+    help = "整個股票池一次掃描 MACD / KD / 趨勢訊號 (讀本地資料庫)，例如: scan_universe --universe tw50 --email"
+
+    def add_arguments(self, parser):
+        parser.add_argument("symbols", nargs="*", type=str)
+        parser.add_argument(
+            "--universe",
+            type=str,
+            default=None,
+            help="股票池名稱 (tw50) 或檔案路徑 (一行一個代號)",
+        )
+        parser.add_argument("--end", type=str, default=None, help="掃描到哪一天 (YYYY-MM-DD，預設最新)")
+        parser.add_argument("--lookback", type=int, default=LOOKBACK, help="每支股票取最近幾根 K 棒")
+        parser.add_argument("--json", action="store_true", help="輸出 JSON 而不是文字報表")
+        parser.add_argument("--email", action="store_true", help="把報表寄出")
+
+    def handle(self, *args, **options):
+        symbols = [normalize_symbol(s) for s in options["symbols"]]
+        if options["universe"]:
+            try:
+                symbols += load_universe(options["universe"], allow_path=True)
+            except ValueError as e:
+                raise CommandError(str(e))
+        if not symbols:
+            raise CommandError("請給股票代號或 --universe")
+
+        end = date.fromisoformat(options["end"]) if options["end"] else None
+        t0 = time.perf_counter()
+        result = scan_universe(symbols, end=end, lookback=options["lookback"])
+        elapsed = time.perf_counter() - t0
+
+        report = format_report(result)
+        if options["json"]:
+            self.stdout.write(json.dumps(result, ensure_ascii=False, indent=2))
+        else:
+            self.stdout.write(report)
+        self.stdout.write(self.style.SUCCESS(f"掃描 {len(symbols)} 支股票，耗時 {elapsed:.2f} 秒"))
+
+        if options["email"]:
+            from utils.emailer import send_signal_email
+
+            send_signal_email(f"📊 股票池每日訊號 ({result['date']})", report)
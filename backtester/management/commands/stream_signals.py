@@ -0,0 +1,65 @@
+import asyncio
+import time
+from django.core.management.base import BaseCommand, CommandError
+from backtester.data.feeds import get_feed
+from backtester.engine.streaming import StreamEngine
+
+
+def parse_params(text):
+    return tuple(int(v) for v in text.split(","))
+
+
+class Command(BaseCommand):
+    help = "盤中串流訊號 (分 K 增量更新 MACD / KD)，例如: stream_signals --replay bars.csv --speed 60"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--replay", type=str, default=None, help="重播的分 K CSV (symbol,time,open,high,low,close,volume)")
+        parser.add_argument("--feed", type=str, default=None, help="自訂 feed 類別路徑 (BarFeed 子類別)")
+        parser.add_argument("--symbols", nargs="+", default=None, help="只看這幾檔")
+        parser.add_argument("--speed", type=float, default=0, help="重播速度倍數，0 = 全速")
+        parser.add_argument("--macd", nargs="+", default=["12,26,9"], help="MACD 參數，例如 12,26,9 14,40,9")
+        parser.add_argument("--kd", type=str, default="9,3,3", help="KD 參數 (period,dfast,dslow)，none 關閉")
+
+    def handle(self, *args, **options):
+        if options["replay"]:
+            feed = get_feed("replay", path=options["replay"], symbols=options["symbols"], speed=options["speed"])
+        elif options["feed"]:
+            feed = get_feed(options["feed"])
+        else:
+            raise CommandError("請給 --replay 或 --feed")
+
+        kd = None if options["kd"].lower() == "none" else parse_params(options["kd"])
+        engine = StreamEngine(
+            macd=[parse_params(p) for p in options["macd"]],
+            kd=kd,
+            on_event=self.print_event,
+        )
+
+        # 量每根 K 棒的處理時間 (不含 feed 讀檔)
+        elapsed = [0.0]
+        process = engine.process
+
+        def timed(bar):
+            t0 = time.perf_counter()
+            events = process(bar)
+            elapsed[0] += time.perf_counter() - t0
+            return events
+
+        engine.process = timed
+        try:
+            stats = asyncio.run(engine.run(feed))
+        except KeyboardInterrupt:
+            stats = engine.stats()
+
+        per_bar = elapsed[0] / stats["bars"] * 1e6 if stats["bars"] else 0.0
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{stats['symbols']} 檔 / {stats['bars']} 根 K 棒 / {stats['events']} 個訊號，"
+                f"丟棄重複 {stats['dropped']} 根，平均每根 {per_bar:.1f} µs"
+            )
+        )
+
+    def print_event(self, event):
+        icon = "🔴" if event["type"] == "golden" else "🟢"
+        label = "黃金交叉" if event["type"] == "golden" else "死亡交叉"
+        self.stdout.write(f"{icon} {event['time']:%Y-%m-%d %H:%M} {event['symbol']:<10} {event['indicator']} {label} @ {event['close']}")
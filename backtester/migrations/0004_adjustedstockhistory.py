@@ -0,0 +1,31 @@
+# Generated by Django 5.2.11 on 2026-10-18 12:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backtester', '0003_papertrading'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AdjustedStockHistory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('symbol', models.CharField(db_index=True, max_length=10)),
+                ('date', models.DateField()),
+                ('open', models.FloatField()),
+                ('high', models.FloatField()),
+                ('low', models.FloatField()),
+                ('close', models.FloatField()),
+                ('volume', models.BigIntegerField()),
+                ('factor', models.FloatField(default=1.0)),
+            ],
+            options={
+                'ordering': ['date'],
+                'unique_together': {('symbol', 'date')},
+            },
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.11 on 2026-10-18 13:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backtester', '0005_dataversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OptimizerRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('run_id', models.CharField(max_length=100, unique=True)),
+                ('symbol', models.CharField(max_length=10)),
+                ('strategy', models.CharField(default='macd', max_length=50)),
+                ('engine', models.CharField(default='backtrader', max_length=20)),
+                ('start', models.DateField(blank=True, null=True)),
+                ('end', models.DateField(blank=True, null=True)),
+                ('total', models.IntegerField(default=0)),
+                ('status', models.CharField(default='running', max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='OptimizerResult',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('params', models.CharField(max_length=100)),
+                ('roi', models.FloatField()),
+                ('mdd', models.FloatField()),
+                ('final_value', models.FloatField()),
+                ('runtime', models.FloatField(default=0.0)),
+                ('run', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='results', to='backtester.optimizerrun')),
+            ],
+            options={
+                'ordering': ['-roi'],
+                'unique_together': {('run', 'params')},
+            },
+        ),
+    ]
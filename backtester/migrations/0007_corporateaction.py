@@ -0,0 +1,46 @@
+# Generated by Django 5.2.11 on 2026-10-18 13:15
+
+from django.db import migrations, models
+
+
+def seed_0050_split(apps, schema_editor):
+    # 取代原本寫死在程式裡的 0050 拆股補丁
+    CorporateAction = apps.get_model("backtester", "CorporateAction")
+    CorporateAction.objects.get_or_create(
+        symbol="0050.TW",
+        action="split",
+        ex_date="2024-12-02",
+        defaults={
+            "ratio": 4,
+            "provider_adjusted_from": "2014-01-01",
+            "note": "Yahoo 在 2014-01-01 ~ 拆股日之間給的是已除以 4 的價格",
+        },
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backtester', '0006_optimizerrun'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CorporateAction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('symbol', models.CharField(db_index=True, max_length=10)),
+                ('action', models.CharField(choices=[('split', '分割'), ('reverse_split', '合併 (反分割)'), ('dividend', '現金股利')], max_length=20)),
+                ('ex_date', models.DateField()),
+                ('ratio', models.FloatField(default=1.0)),
+                ('amount', models.FloatField(default=0.0)),
+                ('provider_adjusted_from', models.DateField(blank=True, null=True)),
+                ('note', models.CharField(blank=True, max_length=200)),
+            ],
+            options={
+                'ordering': ['symbol', 'ex_date'],
+                'unique_together': {('symbol', 'action', 'ex_date')},
+            },
+        ),
+        migrations.RunPython(seed_0050_split, migrations.RunPython.noop),
+    ]
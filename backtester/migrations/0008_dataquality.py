@@ -0,0 +1,30 @@
+# Generated by Django 5.2.11 on 2026-10-18 13:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backtester', '0007_corporateaction'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DataQuality',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('symbol', models.CharField(max_length=10, unique=True)),
+                ('clean', models.BooleanField(default=False)),
+                ('rows', models.IntegerField(default=0)),
+                ('duplicates', models.IntegerField(default=0)),
+                ('unsorted', models.IntegerField(default=0)),
+                ('missing_values', models.IntegerField(default=0)),
+                ('ohlc_invalid', models.IntegerField(default=0)),
+                ('zero_volume', models.IntegerField(default=0)),
+                ('jumps', models.JSONField(default=list)),
+                ('gaps', models.JSONField(default=list)),
+                ('checked_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
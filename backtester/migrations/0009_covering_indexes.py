@@ -0,0 +1,25 @@
+# Generated by Django 5.2.11 on 2026-10-18 13:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backtester', '0008_dataquality'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='adjustedstockhistory',
+            index=models.Index(fields=['symbol', 'date', 'open', 'high', 'low', 'close', 'volume'], name='adjustedhistory_covering'),
+        ),
+        migrations.AddIndex(
+            model_name='papertrading',
+            index=models.Index(fields=['date', '-roi'], name='papertrading_date_roi'),
+        ),
+        migrations.AddIndex(
+            model_name='stockhistory',
+            index=models.Index(fields=['symbol', 'date', 'open', 'high', 'low', 'close', 'volume'], name='stockhistory_covering'),
+        ),
+    ]
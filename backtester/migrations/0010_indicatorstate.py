@@ -0,0 +1,34 @@
+# Generated by Django 5.2.11 on 2026-10-18 13:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backtester', '0009_covering_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IndicatorState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('symbol', models.CharField(max_length=10)),
+                ('fast', models.IntegerField()),
+                ('slow', models.IntegerField()),
+                ('signal', models.IntegerField()),
+                ('last_date', models.DateField()),
+                ('last_close', models.FloatField()),
+                ('ema_fast', models.FloatField()),
+                ('ema_slow', models.FloatField()),
+                ('ema_signal', models.FloatField()),
+                ('prev_dif', models.FloatField()),
+                ('prev_signal', models.FloatField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'unique_together': {('symbol', 'fast', 'slow', 'signal')},
+            },
+        ),
+    ]
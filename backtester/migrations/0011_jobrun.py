@@ -0,0 +1,31 @@
+# Generated by Django 5.2.11 on 2026-10-18 13:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backtester', '0010_indicatorstate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JobRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('job', models.CharField(max_length=50)),
+                ('trigger', models.CharField(default='schedule', max_length=20)),
+                ('scheduled_for', models.DateTimeField(blank=True, null=True)),
+                ('status', models.CharField(default='running', max_length=20)),
+                ('attempts', models.IntegerField(default=0)),
+                ('error', models.TextField(blank=True, default='')),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['-started_at'],
+                'indexes': [models.Index(fields=['job', 'status', 'started_at'], name='jobrun_job_status')],
+            },
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
 
 
 class BacktestStrategy(models.Model):
@@ -26,6 +27,193 @@ class StockHistory(models.Model):
     class Meta:
         unique_together = ("symbol", "date")  # 避免同一支股票在同一天重複儲存
         ordering = ["date"]
+        indexes = [
+            # 覆蓋索引: 依 (symbol, date) 範圍讀 OHLCV 時只走索引，不必回表
+            models.Index(
+                fields=["symbol", "date", "open", "high", "low", "close", "volume"],
+                name="stockhistory_covering",
+            ),
+        ]
+
+
+class AdjustedStockHistory(models.Model):
+    """還原價 (給回測計算用)，在更新資料時一併寫入，回測時不必再連 Yahoo"""
+
+    symbol = models.CharField(max_length=10, db_index=True)  # 股票代號
+    date = models.DateField()  # 日期
+    open = models.FloatField()  # 還原開盤價
+    high = models.FloatField()  # 還原最高價
+    low = models.FloatField()  # 還原最低價
+    close = models.FloatField()  # 還原收盤價
+    volume = models.BigIntegerField()  # 成交量
+    factor = models.FloatField(default=1.0)  # 還原因子 (還原價 = 原始價 * factor)
+
+    class Meta:
+        unique_together = ("symbol", "date")
+        ordering = ["date"]
+        indexes = [
+            models.Index(
+                fields=["symbol", "date", "open", "high", "low", "close", "volume"],
+                name="adjustedhistory_covering",
+            ),
+        ]
+
+
+class CorporateAction(models.Model):
+    """
+    除權息 / 分割 / 合併紀錄，ingestion 依此還原原始價並計算還原價
+    provider_adjusted_from: 資料來源在 [此日, 除權日) 之間給的已經是分割後的價格
+    (例如 Yahoo 的 0050)，為空表示資料來源給的是原始價
+    """
+
+    SPLIT = "split"
+    REVERSE_SPLIT = "reverse_split"
+    DIVIDEND = "dividend"
+    ACTION_CHOICES = [
+        (SPLIT, "分割"),
+        (REVERSE_SPLIT, "合併 (反分割)"),
+        (DIVIDEND, "現金股利"),
+    ]
+
+    symbol = models.CharField(max_length=10, db_index=True)
+    action = models.CharField(max_length=20, choices=ACTION_CHOICES)
+    ex_date = models.DateField()  # 除權息日
+    ratio = models.FloatField(default=1.0)  # 分割: 1 股變幾股；合併: 幾股併 1 股
+    amount = models.FloatField(default=0.0)  # 現金股利 (每股)
+    provider_adjusted_from = models.DateField(null=True, blank=True)
+    note = models.CharField(max_length=200, blank=True)
+
+    class Meta:
+        unique_together = ("symbol", "action", "ex_date")
+        ordering = ["symbol", "ex_date"]
+
+    def __str__(self):
+        return f"{self.symbol} {self.ex_date} {self.action}"
+
+
+class DataVersion(models.Model):
+    """每支股票的資料版本，StockHistory 被改寫時 +1 (回測快取用來判斷是否過期)"""
+
+    symbol = models.CharField(max_length=10, unique=True)
+    version = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @classmethod
+    def get_version(cls, symbol):
+        row = cls.objects.filter(symbol=symbol).values_list("version", flat=True).first()
+        return row or 0
+
+    @classmethod
+    def bump(cls, symbol):
+        obj, created = cls.objects.get_or_create(symbol=symbol)
+        cls.objects.filter(pk=obj.pk).update(
+            version=models.F("version") + 1, updated_at=timezone.now()
+        )
+
+    def __str__(self):
+        return f"{self.symbol} v{self.version}"
+
+
+class DataQuality(models.Model):
+    """ingestion 時對還原價做的資料品質檢查結果，clean=True 的股票讀取端可略過清洗"""
+
+    symbol = models.CharField(max_length=10, unique=True)
+    clean = models.BooleanField(default=False)
+    rows = models.IntegerField(default=0)
+    duplicates = models.IntegerField(default=0)  # 重複日期
+    unsorted = models.IntegerField(default=0)  # 日期倒退的次數
+    missing_values = models.IntegerField(default=0)  # 含 NaN 的列
+    ohlc_invalid = models.IntegerField(default=0)  # high < max(open, close) 等不合理的 K 棒
+    zero_volume = models.IntegerField(default=0)  # 成交量為 0 (多半是假日的假 K 棒)
+    jumps = models.JSONField(default=list)  # 隔夜跳空超過門檻的日期
+    gaps = models.JSONField(default=list)  # 缺太多交易日的區間 [[前一天, 後一天], ...]
+    checked_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.symbol} {'clean' if self.clean else 'dirty'}"
+
+
+class IndicatorState(models.Model):
+    """
+    每支股票 x 每組 MACD 參數的 EMA 狀態，每日只需用新的 K 棒做 O(1) 更新
+    last_close 用來偵測除權息後還原價整段改變 (需要重新暖機)
+    """
+
+    symbol = models.CharField(max_length=10)
+    fast = models.IntegerField()
+    slow = models.IntegerField()
+    signal = models.IntegerField()
+    last_date = models.DateField()  # 狀態已算到哪一天
+    last_close = models.FloatField()  # 當天的還原收盤價
+    ema_fast = models.FloatField()
+    ema_slow = models.FloatField()
+    ema_signal = models.FloatField()  # DIF 的 EMA (訊號線)
+    prev_dif = models.FloatField()  # 前一天的 DIF / 訊號線 (判斷交叉用)
+    prev_signal = models.FloatField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ("symbol", "fast", "slow", "signal")
+
+    def __str__(self):
+        return f"{self.symbol} MACD({self.fast},{self.slow},{self.signal}) @ {self.last_date}"
+
+
+class OptimizerRun(models.Model):
+    """一次參數最佳化的執行紀錄 (中斷後以同一個 run_id 重跑會從斷點接續)"""
+
+    run_id = models.CharField(max_length=100, unique=True)
+    symbol = models.CharField(max_length=10)
+    strategy = models.CharField(max_length=50, default="macd")
+    engine = models.CharField(max_length=20, default="backtrader")
+    start = models.DateField(null=True, blank=True)
+    end = models.DateField(null=True, blank=True)
+    total = models.IntegerField(default=0)  # 網格總組數
+    status = models.CharField(max_length=20, default="running")  # running / done / interrupted
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.run_id} ({self.symbol} {self.status})"
+
+
+class JobRun(models.Model):
+    """排程工作的執行紀錄 (running 的紀錄同時當作鎖，避免同一個工作重疊執行)"""
+
+    job = models.CharField(max_length=50)
+    trigger = models.CharField(max_length=20, default="schedule")  # schedule / manual
+    scheduled_for = models.DateTimeField(null=True, blank=True)
+    status = models.CharField(max_length=20, default="running")  # running / success / failed / timeout / skipped
+    attempts = models.IntegerField(default=0)
+    error = models.TextField(blank=True, default="")
+    started_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["-started_at"]
+        indexes = [models.Index(fields=["job", "status", "started_at"], name="jobrun_job_status")]
+
+    def __str__(self):
+        return f"{self.job} {self.status} @ {self.started_at:%Y-%m-%d %H:%M}"
+
+
+class OptimizerResult(models.Model):
+    """最佳化中每一組參數的成績"""
+
+    run = models.ForeignKey(OptimizerRun, on_delete=models.CASCADE, related_name="results")
+    params = models.CharField(max_length=100)  # 例如: "(11, 45, 9)"
+    roi = models.FloatField()  # 報酬率 (%)
+    mdd = models.FloatField()  # 最大回撤 (%)
+    final_value = models.FloatField()  # 最終資產
+    runtime = models.FloatField(default=0.0)  # 回測耗時 (秒)
+
+    class Meta:
+        unique_together = ("run", "params")
+        ordering = ["-roi"]
+
+    def __str__(self):
+        return f"{self.run.run_id} {self.params}: {self.roi}%"
+
 
 class PaperTrading(models.Model):
     strategy_name = models.CharField(max_length=50) # 例如: "MACD(11,45,9)"
@@ -40,6 +228,9 @@ class PaperTrading(models.Model):
     class Meta:
         ordering = ['-date', '-roi'] # 預設按日期新到舊，報酬率高到低排序
         unique_together = ('strategy_name', 'date') # 確保同一策略同一天只有一筆紀錄
+        indexes = [
+            models.Index(fields=['date', '-roi'], name='papertrading_date_roi'),  # 排行榜查詢
+        ]
 
     def __str__(self):
         return f"{self.date} - {self.strategy_name}: {self.roi}%"
\ No newline at end of file
@@ -0,0 +1,286 @@
+import asyncio
+import datetime
+import threading
+import traceback
+import zlib
+from zoneinfo import ZoneInfo
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from backtester.models import JobRun
+
+RUNNING, SUCCESS, FAILED, TIMEOUT, SKIPPED = "running", "success", "failed", "timeout", "skipped"
+
+# running 超過這麼久還沒結束視為行程已掛掉，不再擋住新的執行 (秒)
+STALE_AFTER = 6 * 3600
+
+# PostgreSQL advisory lock 的第一個 key (區分其他用途的 advisory lock)
+ADVISORY_LOCK_CLASS = 20240613
+
+# 同一個行程內的搶名額依序進行；跨行程見 _lock_job
+_claim_lock = threading.Lock()
+
+
+# ==========================================
+# 交易日曆
+# ==========================================
+def market_tz():
+    return ZoneInfo(getattr(settings, "MARKET_TIMEZONE", "Asia/Taipei"))
+
+
+def is_trading_day(day, holidays=None):
+    """週一到週五且不在 settings.TRADING_HOLIDAYS (YYYY-MM-DD 字串) 裡"""
+    if holidays is None:
+        holidays = getattr(settings, "TRADING_HOLIDAYS", [])
+    return day.weekday() < 5 and str(day) not in {str(h) for h in holidays}
+
+
+def next_fire(at, now, trading_days_only=True, holidays=None):
+    """
+    下一次觸發時間 (市場時區): 今天還沒到 at 就是今天，否則往後找
+    trading_days_only 時跳過週末與休市日
+    """
+    hour, minute = (int(v) for v in at.split(":"))
+    now = now.astimezone(market_tz())
+    day = now.date()
+    for _ in range(366):
+        fire = datetime.datetime.combine(day, datetime.time(hour, minute), tzinfo=now.tzinfo)
+        if fire > now and (not trading_days_only or is_trading_day(day, holidays)):
+            return fire
+        day += datetime.timedelta(days=1)
+    raise ValueError("一年內找不到交易日，請檢查 TRADING_HOLIDAYS")
+
+
+# ==========================================
+# 工作定義
+# ==========================================
+class Job:
+    """
+    一個排程工作: func 可為函式或 "module.function" 字串 (執行時才 import)
+    at 為 None 時只能手動觸發
+    """
+
+    def __init__(self, name, func, at=None, trading_days_only=True, timeout=600,
+                 retries=0, backoff=30.0, max_concurrency=1):
+        self.name = name
+        self.func = func
+        self.at = at
+        self.trading_days_only = trading_days_only
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_concurrency = max_concurrency
+
+    def resolve(self):
+        return import_string(self.func) if isinstance(self.func, str) else self.func
+
+
+def load_jobs(conf=None):
+    """settings.SCHEDULER_JOBS: {名稱: {func, at, timeout, retries, backoff, ...}}"""
+    conf = getattr(settings, "SCHEDULER_JOBS", {}) if conf is None else conf
+    return {name: Job(name, **options) for name, options in conf.items()}
+
+
+# ==========================================
+# 執行紀錄 (同時是跨行程的鎖)
+# ==========================================
+def _lock_job(name):
+    """
+    在目前的交易內取得跨行程的鎖，讓「數 running -> 新增紀錄」不會被兩個行程同時做
+    - SQLite: transaction_mode=IMMEDIATE，交易一開始就拿到寫入鎖，不必再做事
+    - PostgreSQL: READ COMMITTED 不會擋住兩個交易同時 count，用 transaction 級的 advisory lock
+    其他資料庫沒有對應做法，只保證同一個行程內不重疊
+    """
+    if connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_xact_lock(%s, %s)", [ADVISORY_LOCK_CLASS, zlib.crc32(name.encode()) - 2**31])
+
+
+def claim_run(job, scheduled_for=None, trigger="schedule"):
+    """
+    還有名額就建立 running 紀錄並回傳 (True, run)，
+    已有 max_concurrency 個同名工作在跑就記一筆 skipped 並回傳 (False, run)
+    """
+    stale = timezone.now() - datetime.timedelta(seconds=STALE_AFTER)
+    with _claim_lock, transaction.atomic():
+        _lock_job(job.name)
+        running = JobRun.objects.filter(job=job.name, status=RUNNING, started_at__gte=stale).count()
+        if running >= job.max_concurrency:
+            run = JobRun.objects.create(
+                job=job.name,
+                trigger=trigger,
+                scheduled_for=scheduled_for,
+                status=SKIPPED,
+                error=f"已有 {running} 個執行中",
+                finished_at=timezone.now(),
+            )
+            return False, run
+        run = JobRun.objects.create(job=job.name, trigger=trigger, scheduled_for=scheduled_for)
+        return True, run
+
+
+def finish_run(run, status, attempts, error=""):
+    run.status = status
+    run.attempts = attempts
+    run.error = error
+    run.finished_at = timezone.now()
+    run.save(update_fields=["status", "attempts", "error", "finished_at"])
+    return run
+
+
+def _with_db(func, *args):
+    """
+    在 to_thread 的執行緒做資料庫操作: Django 只在 request 前後套用 CONN_MAX_AGE / 健康檢查，
+    長駐的排程器要自己在前後呼叫 close_old_connections，才不會一直拿著過期 / 壞掉的連線
+    """
+    close_old_connections()
+    try:
+        return func(*args)
+    finally:
+        close_old_connections()
+
+
+# ==========================================
+# 排程器
+# ==========================================
+class Scheduler:
+    """
+    asyncio 排程: 每個工作一個協程等到下一次觸發時間，工作本身丟到執行緒跑
+    - timeout: 超時就不再等 (執行緒無法強制中止，紀錄維持 running 直到它真的結束，
+      期間同名工作不會再被啟動)
+    - retries / backoff: 例外時等 backoff * 2^(n-1) 秒後重試
+    """
+
+    def __init__(self, jobs, log=print):
+        self.jobs = jobs
+        self.log = log
+        self._stop = None
+        self._event_loop = None
+        self._tasks = set()
+
+    async def run_job(self, job, scheduled_for=None, trigger="schedule", func=None):
+        ok, run = await asyncio.to_thread(_with_db, claim_run, job, scheduled_for, trigger)
+        if not ok:
+            self.log(f"⏭ {job.name} 略過: {run.error}")
+            return run
+
+        func = func or job.resolve()
+        attempt = 0
+        while True:
+            attempt += 1
+            self.log(f"▶ {job.name} 第 {attempt} 次執行")
+            worker, done = self._start_thread(func)
+            try:
+                await asyncio.wait_for(asyncio.shield(worker), timeout=job.timeout)
+            except asyncio.TimeoutError:
+                self.log(f"⏱ {job.name} 超過 {job.timeout} 秒")
+                message = f"超過 {job.timeout} 秒"
+                worker.add_done_callback(lambda f: f.cancelled() or f.exception())
+                # 執行緒結束時才把紀錄改成 timeout，之前一直佔著名額
+                threading.Thread(
+                    target=self._finish_later, args=(run, done, attempt, message), daemon=True
+                ).start()
+                run.status = TIMEOUT
+                run.attempts = attempt
+                run.error = message
+                return run
+            except Exception:
+                error = traceback.format_exc()
+                if attempt <= job.retries:
+                    delay = job.backoff * 2 ** (attempt - 1)
+                    self.log(f"⚠️ {job.name} 失敗，{delay:.0f} 秒後重試")
+                    await asyncio.sleep(delay)
+                    continue
+                self.log(f"❌ {job.name} 失敗: {error.strip().splitlines()[-1]}")
+                return await asyncio.to_thread(_with_db, finish_run, run, FAILED, attempt, error)
+
+            self.log(f"✅ {job.name} 完成")
+            return await asyncio.to_thread(_with_db, finish_run, run, SUCCESS, attempt)
+
+    @staticmethod
+    def _start_thread(func):
+        """
+        在 daemon 執行緒跑工作，回傳 (asyncio future, 結束時 set 的 Event)
+        不用 default executor: 超時的工作不會卡住 event loop 關閉
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        done = threading.Event()
+
+        def deliver(setter, value):
+            if not future.done():
+                setter(value)
+
+        def target():
+            close_old_connections()
+            try:
+                result = func()
+            except BaseException as e:
+                callback = (future.set_exception, e)
+            else:
+                callback = (future.set_result, result)
+            finally:
+                # 每個工作一條新執行緒，結束時關掉它開的連線，否則每跑一次就漏一條
+                connection.close()
+                done.set()
+            try:
+                loop.call_soon_threadsafe(deliver, *callback)
+            except RuntimeError:
+                pass  # event loop 已關閉 (超時後沒人在等了)
+
+        threading.Thread(target=target, daemon=True).start()
+        return future, done
+
+    @staticmethod
+    def _finish_later(run, done, attempt, message):
+        done.wait()
+        try:
+            finish_run(run, TIMEOUT, attempt, message)
+        finally:
+            connection.close()
+
+    async def _loop(self, job):
+        last = None
+        while not self._stop.is_set():
+            now = timezone.now()
+            fire = next_fire(job.at, max(now, last) if last else now, job.trading_days_only)
+            self.log(f"🕒 {job.name} 下次執行: {fire:%Y-%m-%d %H:%M}")
+            # 分段睡，避免電腦休眠 / 調時間後錯過
+            while not self._stop.is_set():
+                delay = (fire - timezone.now()).total_seconds()
+                if delay <= 0:
+                    break
+                try:
+                    await asyncio.wait_for(self._stop.wait(), timeout=min(delay, 60))
+                except asyncio.TimeoutError:
+                    pass
+            if self._stop.is_set():
+                break
+            last = fire
+            # 不等工作結束就排下一次，超時的工作由 run 紀錄擋住重疊
+            task = asyncio.ensure_future(self.run_job(job, scheduled_for=fire))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def serve(self):
+        self._stop = asyncio.Event()
+        self._event_loop = asyncio.get_running_loop()
+        scheduled = [job for job in self.jobs.values() if job.at]
+        await asyncio.gather(*(self._loop(job) for job in scheduled))
+        # 停止時等正在跑的工作收尾 (最多等到各自的 timeout)
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stop(self):
+        """可從其他執行緒呼叫 (例如 GUI 的停止按鈕)"""
+        if self._stop is not None:
+            self._event_loop.call_soon_threadsafe(self._stop.set)
+
+
+def run_job_now(name, func=None, jobs=None, log=print):
+    """同步版的手動觸發 (GUI 按鈕 / 指令列)，一樣會寫紀錄並避免重疊"""
+    jobs = jobs or load_jobs()
+    if name not in jobs:
+        raise ValueError(f"沒有這個工作: {name}")
+    return asyncio.run(Scheduler(jobs, log=log).run_job(jobs[name], trigger="manual", func=func))
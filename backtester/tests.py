@@ -1,3 +1,1741 @@
-from django.test import TestCase
+import asyncio
+import datetime
+import email
+import email.header
+import gzip
+import io
+import json
+import os
+import smtplib
+import socketserver
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from unittest import mock
+from zoneinfo import ZoneInfo
 
-# Create your tests here.
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone as django_timezone
+
+from backtester.models import StockHistory, AdjustedStockHistory, OptimizerRun, CorporateAction, DataQuality, PaperTrading, IndicatorState, JobRun
+from backtester.engine.runner import (
+    run_backtest_from_db,
+    run_cerebro_backtest,
+    load_prices,
+    STRATEGY_MAP,
+)
+from backtester.engine.vector import run_vector_backtest, ema
+from backtester.engine.grid import ema_matrix, evaluate_macd_grid, ewm_rows, crossover_rows
+from backtester.engine.arena import run_arena, backfill_arena
+from backtester.engine.indicator_state import advance_macd
+from backtester.engine.scanner import scan_universe, load_universe_matrix
+from backtester.engine import vector
+from backtester import scheduler
+from backtester.scheduler import Job, Scheduler, next_fire, run_job_now
+from backtester.engine.streaming import StreamEngine, run_streams
+from backtester.data.feeds import ReplayFeed, QueueFeed, MinuteBarAggregator
+from utils.emailer import EmailDispatcher, send_signal_email
+from utils.paper_trader import PaperTrader, INITIAL_POCKETS, WalletArray, trade
+from backtester.engine import optimizer
+from backtester.engine.optimizer import macd_grid, run_grid
+from backtester.engine.runs import open_run, top_results
+from backtester.engine.search import search_params
+from backtester.engine.walkforward import walk_forward, walk_forward_windows
+from backtester.engine.cache import BacktestCache, backtest_cache, run_backtest_cached
+from backtester.data.providers import get_provider, LocalFileProvider, YahooProvider
+from backtester.data.ingest import ingest_history, update_history
+from backtester.data.writer import bulk_write
+from backtester.data.actions import apply_actions
+from backtester.data.quality import validate_frame, is_clean
+from backtester.data.fetcher import fetch_universe, load_universe
+from backtester.data.snapshot import MarketSnapshotCache, market_snapshots
+from backtester.data.columnar import build_price_cache, load_price_arrays, load_price_frame_cached, write_price_arrays
+
+
+def make_ohlcv(n=600, seed=0, start=100.0):
+    """合成的日 K 資料 (隨機漫步)，給各種回測測試共用"""
+    rng = np.random.default_rng(seed)
+    close = start * np.exp(np.cumsum(rng.normal(0.0003, 0.012, n)))
+    open_ = close * (1 + rng.normal(0, 0.004, n))
+    high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.003, n)))
+    low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.003, n)))
+    volume = rng.integers(1_000, 50_000, n).astype(float)
+    df = pd.DataFrame(
+        {"open": open_, "high": high, "low": low, "close": close, "volume": volume},
+        index=pd.bdate_range("2018-01-01", periods=n),
+    )
+    df["openinterest"] = 0
+    return df
+
+
+class VectorEngineParityTest(SimpleTestCase):
+    """向量化引擎必須與 Cerebro 路徑給出相同的結果"""
+
+    CASES = [
+        ("default_kd", {}),
+        ("default_kd", {"k_period": 14, "buy_threshold": 30, "sell_threshold": 70}),
+        ("trend_kd", {}),
+        ("trend_kd", {"ma_period": 60, "k_period": 5}),
+        ("macd", {}),
+        ("macd", {"m1": 5, "m2": 35, "m3": 9}),
+        ("macd", {"m1": 14, "m2": 40, "m3": 9}),
+    ]
+
+    def assert_parity(self, df, strategy_name, params, init_cash=1000000.0):
+        strat_class = STRATEGY_MAP[strategy_name]
+        bt_value, bt_equity, bt_tx = run_cerebro_backtest(
+            df, strat_class, params, init_cash
+        )
+        vec_value, vec_equity, vec_tx = run_vector_backtest(
+            df, strat_class, params, init_cash
+        )
+
+        self.assertGreater(len(bt_tx), 0)
+        self.assertEqual([t[0] for t in bt_tx], [t[0] for t in vec_tx])
+        np.testing.assert_allclose(
+            [t[1] for t in vec_tx], [t[1] for t in bt_tx], rtol=1e-9
+        )
+        np.testing.assert_allclose(
+            [t[2] for t in vec_tx], [t[2] for t in bt_tx], rtol=1e-12
+        )
+        np.testing.assert_allclose(vec_equity, bt_equity, rtol=1e-9)
+        self.assertAlmostEqual(vec_value, bt_value, delta=bt_value * 1e-9)
+
+    def test_parity_on_synthetic_data(self):
+        for seed in (0, 1, 2):
+            df = make_ohlcv(seed=seed)
+            for strategy_name, params in self.CASES:
+                with self.subTest(seed=seed, strategy=strategy_name, params=params):
+                    self.assert_parity(df, strategy_name, params)
+
+    def test_rejected_order_on_gap_up(self):
+        # 開盤大跳空 -> 95% 資金買不起 -> Cerebro 會作廢委託，向量引擎也要一樣
+        df = make_ohlcv(seed=3)
+        gap = df.index[len(df) // 2 :]
+        df.loc[gap[::7], "open"] *= 1.08
+        for strategy_name, params in self.CASES:
+            with self.subTest(strategy=strategy_name, params=params):
+                self.assert_parity(df, strategy_name, params)
+
+    def test_unsupported_strategy(self):
+        import backtrader as bt
+
+        with self.assertRaises(ValueError):
+            run_vector_backtest(make_ohlcv(), bt.Strategy)
+
+
+class PriceCacheDirMixin:
+    """每個測試用自己的 mmap 價格快取目錄，避免互相污染"""
+
+    def setUp(self):
+        super().setUp()
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        override = override_settings(PRICE_CACHE_DIR=cache_dir.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.cache_dir = cache_dir.name
+
+
+class LocalPriceStoreTest(PriceCacheDirMixin, TestCase):
+    """離線資料來源 -> ingestion -> 回測只讀資料庫"""
+
+    def setUp(self):
+        super().setUp()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+        df = make_ohlcv(n=300).drop(columns="openinterest")
+        # 模擬含息還原: 越早的價格還原因子越小
+        df["adj_close"] = df["close"] * np.linspace(0.8, 1.0, len(df))
+        df.index.name = "date"
+        df.to_csv(os.path.join(self.tmp.name, "2330.TW.csv"))
+        self.df = df
+
+    def test_ingest_and_backtest_offline(self):
+        provider = LocalFileProvider(self.tmp.name)
+        df = provider.history("2330.TW")
+        self.assertEqual(len(df), 300)
+
+        count = ingest_history("2330.TW", df, replace=True)
+        self.assertEqual(count, 300)
+        self.assertEqual(AdjustedStockHistory.objects.filter(symbol="2330.TW").count(), 300)
+
+        first = AdjustedStockHistory.objects.filter(symbol="2330.TW").first()
+        self.assertAlmostEqual(first.factor, 0.8)
+        self.assertAlmostEqual(first.close, self.df["adj_close"].iloc[0])
+
+        with mock.patch("yfinance.Ticker") as ticker:
+            result = run_backtest_from_db("2330", "macd", is_api=True, engine="vector")
+            ticker.assert_not_called()
+        self.assertNotIn("error", result)
+        self.assertEqual(len(result["chart_data"]["values"]), 300)
+
+    def test_missing_adjusted_data(self):
+        StockHistory.objects.create(
+            symbol="2330.TW", date="2024-01-02", open=1, high=1, low=1, close=1, volume=1
+        )
+        result = run_backtest_from_db("2330", "macd", is_api=True)
+        self.assertIn("error", result)
+
+    def test_get_provider(self):
+        self.assertIsInstance(get_provider("local"), LocalFileProvider)
+        self.assertIsInstance(get_provider("yahoo"), YahooProvider)
+
+
+class BacktestCacheTest(PriceCacheDirMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        backtest_cache.clear()
+        self.addCleanup(backtest_cache.clear)
+        df = make_ohlcv(n=300).drop(columns="openinterest")
+        df["adj_close"] = df["close"]
+        ingest_history("2330.TW", df, replace=True)
+        self.df = df
+
+    def test_hit_and_invalidation(self):
+        params = {"m1": "12", "m2": 26, "start_date": "2018-01-01"}
+        with mock.patch(
+            "backtester.engine.cache.run_backtest_from_db", wraps=run_backtest_from_db
+        ) as runner:
+            first = run_backtest_cached("2330", "macd", params, engine="vector")
+            # 參數型別不同但語意相同 -> 同一把 key
+            second = run_backtest_cached(
+                "2330.TW", "macd", {"m2": "26", "m1": 12, "start_date": "2018-01-01"}, "vector"
+            )
+            self.assertIs(first, second)
+            self.assertEqual(runner.call_count, 1)
+
+            # 重新寫入資料 -> 版本 +1 -> 快取失效
+            ingest_history("2330.TW", self.df, replace=True)
+            run_backtest_cached("2330", "macd", params, engine="vector")
+            self.assertEqual(runner.call_count, 2)
+
+        stats = backtest_cache.stats()
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 2)
+
+    def test_lru_and_ttl(self):
+        cache = BacktestCache(maxsize=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)  # b 最久沒用 -> 被淘汰
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), 1)
+
+        with mock.patch("backtester.engine.cache.time.monotonic", return_value=1e12):
+            self.assertIsNone(cache.get("a"))
+
+    def test_errors_are_not_cached(self):
+        run_backtest_cached("9999", "macd")
+        self.assertEqual(backtest_cache.stats()["size"], 0)
+
+
+class ColumnarPriceCacheTest(PriceCacheDirMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        df = make_ohlcv(n=200).drop(columns="openinterest")
+        df["adj_close"] = df["close"] * 0.9
+        self.df = df
+
+    def test_rebuilt_on_ingest_and_sliced_by_date(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            ingest_history("2330.TW", self.df, replace=True)
+
+        arrays = load_price_arrays("2330.TW", "adjusted", "2018-02-01", "2018-02-28")
+        self.assertIsInstance(arrays["close"], np.memmap)
+        self.assertEqual(arrays["close"].dtype, np.float64)
+        self.assertEqual(arrays["volume"].dtype, np.int64)
+
+        expected = self.df.loc["2018-02-01":"2018-02-28"]
+        self.assertEqual(len(arrays["date"]), len(expected))
+        np.testing.assert_allclose(arrays["close"], expected["adj_close"])
+
+        raw = load_price_frame_cached("2330.TW", "raw")
+        np.testing.assert_allclose(raw["close"], self.df["close"])
+        # 價格欄位是 mmap 的 view (不複製)，日期索引則是轉換過的新陣列
+        mapped = load_price_arrays("2330.TW", "raw")
+        for col in ("open", "close", "volume"):
+            self.assertTrue(np.shares_memory(raw[col].to_numpy(), mapped[col]))
+        self.assertFalse(raw["close"].to_numpy().flags.writeable)
+
+        # 再寫一次 -> 新版本目錄，舊的被清掉
+        with self.captureOnCommitCallbacks(execute=True):
+            ingest_history("2330.TW", self.df * 2, replace=True)
+        raw = load_price_frame_cached("2330.TW", "raw")
+        np.testing.assert_allclose(raw["close"], self.df["close"] * 2)
+        versions = os.listdir(os.path.join(self.cache_dir, "raw", "2330.TW"))
+        self.assertEqual(sorted(versions), ["CURRENT", "v2"])
+
+    def test_runner_matches_database_path(self):
+        ingest_history("2330.TW", self.df, replace=True)  # 不觸發 on_commit，cache 尚未建立
+        self.assertIsNone(load_price_arrays("2330.TW"))
+
+        params = {"start_date": "2018-02-01", "end_date": "2018-08-31"}
+        from_db = run_backtest_from_db("2330", "macd", params, is_api=True, engine="vector")
+        self.assertIsNotNone(load_price_arrays("2330.TW"))  # 第一次讀取時順便建好
+        from_cache = run_backtest_from_db("2330", "macd", params, is_api=True, engine="vector")
+        self.assertEqual(from_db, from_cache)
+
+    def test_concurrent_writers_same_and_newer_version(self):
+        df = self.df
+        columns = {c: df[c].to_numpy() for c in ("open", "high", "low", "close", "volume")}
+        dates = df.index.to_numpy(dtype="datetime64[D]")
+
+        def write(version):
+            return write_price_arrays("2330.TW", "raw", dates, columns, version, root=self.cache_dir)
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(write, [3] * 8))
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(write, [4, 3, 4, 3, 4, 3]))  # 舊版本晚寫完也不能把 CURRENT 蓋回去
+
+        base = os.path.join(self.cache_dir, "raw", "2330.TW")
+        with open(os.path.join(base, "CURRENT")) as f:
+            self.assertEqual(f.read(), "4")
+        self.assertFalse([n for n in os.listdir(base) if n.endswith(".tmp") or n.startswith(".CURRENT")])
+        arrays = load_price_arrays("2330.TW", "raw", root=self.cache_dir, version=4)
+        np.testing.assert_allclose(arrays["close"], df["close"])
+
+    def test_failed_cache_write_still_returns_db_frame(self):
+        ingest_history("2330.TW", self.df, replace=True)  # 不觸發 on_commit，cache 尚未建立
+        with mock.patch("backtester.engine.runner.build_price_cache", side_effect=OSError("disk full")):
+            df = load_prices("2330.TW", "raw")
+        np.testing.assert_allclose(df["close"], self.df["close"])
+
+    def test_stale_version_is_ignored(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            ingest_history("2330.TW", self.df, replace=True)
+        self.assertIsNotNone(load_price_arrays("2330.TW", version=1))
+        self.assertIsNone(load_price_arrays("2330.TW", version=2))
+        self.assertIsNone(load_price_frame_cached("9999.TW"))
+
+
+class ParallelOptimizerTest(SimpleTestCase):
+    def test_parallel_matches_serial(self):
+        df = make_ohlcv(n=300)
+        combos = macd_grid(range(5, 12, 3), range(20, 31, 10), 9)
+        serial = run_grid(df, combos, workers=1)
+        parallel = run_grid(df, combos, workers=2)
+        self.assertEqual(serial, parallel)
+        self.assertEqual([r["params"] for r in serial], [f"{c}" for c in combos])
+
+    def test_importable_without_django(self):
+        # spawn 的 worker (Windows 預設) 只會 import 本模組，不會 django.setup()
+        env = {k: v for k, v in os.environ.items() if k != "DJANGO_SETTINGS_MODULE"}
+        code = (
+            "import sys, backtester.engine.optimizer; "
+            "assert 'backtester.models' not in sys.modules, 'models imported'"
+        )
+        done = subprocess.run([sys.executable, "-c", code], cwd=settings.BASE_DIR, env=env,
+                              capture_output=True, text=True)
+        self.assertEqual(done.returncode, 0, done.stderr)
+
+
+class MACDGridKernelTest(SimpleTestCase):
+    def test_ema_rows_matches_scalar_ema(self):
+        close = make_ohlcv(n=200)["close"].to_numpy()
+        spans = [5, 12, 26, 60]
+        for span, row in zip(spans, ema_matrix(close, spans)):
+            np.testing.assert_array_equal(row, ema(close, span))
+
+    def test_grid_matches_cerebro(self):
+        df = make_ohlcv(n=400, seed=5)
+        df.loc[df.index[::9], "open"] *= 1.06  # 製造資金不足作廢的情況
+        combos = macd_grid(range(5, 21, 5), range(20, 41, 10), 9) + [(12, 26, 5)]
+        self.assertEqual(evaluate_macd_grid(df, combos, chunk_size=3), run_grid(df, combos, 1))
+
+
+class ParamSearchTest(SimpleTestCase):
+    RANGES = {"m1": range(3, 25, 2), "m2": range(10, 70, 4), "m3": (5, 9, 12)}
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.df = make_ohlcv(n=1200, seed=7)
+        cls.full = search_params(cls.df, "macd", cls.RANGES, method="random", max_evals=None)
+
+    def test_random_covers_valid_grid(self):
+        # m1 < m2 的限制不吃預算
+        valid = sum(1 for a in self.RANGES["m1"] for b in self.RANGES["m2"] if a < b) * 3
+        self.assertEqual(self.full["evaluations"], valid)
+        rois = [r["roi"] for r in self.full["results"]]
+        self.assertEqual(rois, sorted(rois, reverse=True))
+
+    def test_tpe_finds_top_configs_with_small_budget(self):
+        budget = self.full["evaluations"] // 10
+        out = search_params(self.df, "macd", self.RANGES, method="tpe", max_evals=budget)
+        self.assertLessEqual(out["evaluations"], budget)
+        top = {tuple(r["params"].items()) for r in self.full["results"][:5]}
+        self.assertIn(tuple(out["results"][0]["params"].items()), top)
+
+    def test_successive_halving_promotes_to_full_window(self):
+        out = search_params(self.df, "macd", self.RANGES, method="halving", max_evals=40)
+        self.assertLessEqual(out["evaluations"], 40)
+        self.assertTrue(all(r["bars"] == len(self.df) for r in out["results"]))
+        self.assertTrue(all(r["rung"] == 2 for r in out["results"]))
+
+    def test_other_strategies_and_validation(self):
+        out = search_params(
+            self.df, "trend_kd", {"ma_period": range(50, 201, 50), "k_period": range(5, 15)},
+            method="random", max_evals=5,
+        )
+        self.assertEqual(out["evaluations"], 5)
+        with self.assertRaises(ValueError):
+            search_params(self.df, "macd", {"nope": range(3)})
+        with self.assertRaises(ValueError):
+            search_params(self.df, "macd", self.RANGES, method="grid")
+
+
+class WalkForwardTest(SimpleTestCase):
+    def setUp(self):
+        self.df = make_ohlcv(n=900, seed=11)
+        self.combos = macd_grid(range(5, 21, 5), range(20, 61, 10), 9)
+
+    def test_windows(self):
+        self.assertEqual(
+            walk_forward_windows(100, 50, 20),
+            [(0, 50, 50, 70), (20, 70, 70, 90)],
+        )
+        self.assertEqual(
+            walk_forward_windows(100, 50, 20, anchored=True),
+            [(0, 50, 50, 70), (0, 70, 70, 90)],
+        )
+
+    def test_report_and_parallel_parity(self):
+        serial = walk_forward(self.df, self.combos, 300, 100, workers=1)
+        parallel = walk_forward(self.df, self.combos, 300, 100, workers=2)
+        self.assertEqual(serial, parallel)
+
+        windows = serial["windows"]
+        self.assertEqual(len(windows), 6)
+        self.assertEqual(len(serial["equity"]["values"]), 600)
+        self.assertEqual(serial["equity"]["dates"][0], windows[0]["test_start"])
+
+        # 串接後的總報酬 = 各窗報酬連乘
+        growth = np.prod([1 + w["oos_roi"] / 100 for w in windows])
+        self.assertAlmostEqual(
+            serial["summary"]["oos_return_pct"], (growth - 1) * 100, delta=0.05
+        )
+
+    def test_train_winner_matches_grid(self):
+        out = walk_forward(self.df, self.combos, 300, 100, workers=1)
+        first = out["windows"][0]
+        # 第一個訓練窗從第 0 根開始，指標是因果的，結果應等於只拿前 300 根跑整個網格
+        grid = evaluate_macd_grid(self.df.iloc[:300], self.combos)
+        best = max(grid, key=lambda r: r["roi"])
+        self.assertEqual(first["train_roi"], best["roi"])
+
+    def test_not_enough_data(self):
+        with self.assertRaises(ValueError):
+            walk_forward(self.df.iloc[:100], self.combos, 300, 100, workers=1)
+
+
+class CheckpointedOptimizerTest(TestCase):
+    def setUp(self):
+        self.df = make_ohlcv(n=300)
+        self.combos = macd_grid(range(5, 12, 3), range(20, 31, 10), 9)
+
+    def run_checkpointed(self, run_id="t1", engine="backtrader"):
+        return optimizer._run_checkpointed(
+            self.df, self.combos, "TEST", None, None, 1, engine, run_id
+        )
+
+    def test_resume_skips_evaluated_combos(self):
+        real = optimizer.evaluate_macd
+        calls = []
+
+        def flaky(df, *combo):
+            if len(calls) == 3:
+                raise KeyboardInterrupt
+            calls.append(combo)
+            return real(df, *combo)
+
+        with mock.patch.object(optimizer, "evaluate_macd", flaky):
+            with self.assertRaises(KeyboardInterrupt):
+                self.run_checkpointed()
+        run = OptimizerRun.objects.get(run_id="t1")
+        self.assertEqual(run.status, "interrupted")
+        self.assertEqual(run.results.count(), 3)
+
+        calls.clear()
+        with mock.patch.object(optimizer, "evaluate_macd", lambda df, *c: calls.append(c) or real(df, *c)):
+            results = self.run_checkpointed()
+        self.assertEqual(len(calls), len(self.combos) - 3)
+        run.refresh_from_db()
+        self.assertEqual(run.status, "done")
+
+        expected = {r["params"]: r["roi"] for r in run_grid(self.df, self.combos, 1)}
+        self.assertEqual({r["params"]: r["roi"] for r in results}, expected)
+
+    def test_top_results_filter_and_api(self):
+        self.run_checkpointed("t2", engine="vector")
+        everything = top_results("t2", k=100)
+        self.assertEqual(len(everything), len(self.combos))
+        self.assertEqual([r["roi"] for r in everything], sorted([r["roi"] for r in everything], reverse=True))
+
+        cutoff = sorted(r["mdd"] for r in everything)[2]
+        filtered = top_results("t2", k=100, max_mdd=cutoff)
+        self.assertTrue(all(r["mdd"] < cutoff for r in filtered))
+        self.assertLess(len(filtered), len(everything))
+
+        resp = self.client.get(f"/api/optimizer-runs/t2/?k=2&max_mdd={cutoff}")
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json()["results"], filtered[:2])
+        self.assertEqual(self.client.get("/api/optimizer-runs/nope/").status_code, 404)
+        for k in ("0", "-1", "x"):
+            self.assertEqual(self.client.get(f"/api/optimizer-runs/t2/?k={k}").status_code, 400)
+
+    def test_resume_rejects_different_data_or_engine(self):
+        open_run("t3", "TEST", self.combos, engine="vector", start="2020-01-01", end=datetime.date(2021, 1, 1))
+        # 同樣的設定 (日期型別不同也一樣) 可以接續
+        open_run("t3", "TEST", self.combos, engine="vector", start=datetime.date(2020, 1, 1), end="2021-01-01")
+        for options in (
+            {"engine": "backtrader", "start": "2020-01-01", "end": "2021-01-01"},
+            {"engine": "vector", "start": "2019-01-01", "end": "2021-01-01"},
+            {"engine": "vector", "start": "2020-01-01", "end": None},
+        ):
+            with self.assertRaises(ValueError):
+                open_run("t3", "TEST", self.combos, **options)
+
+
+class IncrementalIngestTest(PriceCacheDirMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.provider = LocalFileProvider(self.tmp.name)
+
+        df = make_ohlcv(n=260).drop(columns="openinterest")
+        df["adj_close"] = df["close"] * 0.9
+        df.index.name = "date"
+        self.df = df
+
+    def write(self, df):
+        df.to_csv(os.path.join(self.tmp.name, "2330.TW.csv"))
+
+    def test_tail_only_upsert(self):
+        self.write(self.df.iloc[:250])
+        self.assertEqual(update_history("2330.TW", self.provider), {"mode": "full", "count": 250})
+        self.assertEqual(update_history("2330.TW", self.provider)["mode"], "noop")
+
+        # 新增 10 天，並修正重疊區間內的一筆成交量
+        df = self.df.copy()
+        df.iloc[247, df.columns.get_loc("volume")] += 100
+        self.write(df)
+        self.assertEqual(update_history("2330.TW", self.provider), {"mode": "incremental", "count": 11})
+
+        self.assertEqual(StockHistory.objects.filter(symbol="2330.TW").count(), 260)
+        self.assertEqual(AdjustedStockHistory.objects.filter(symbol="2330.TW").count(), 260)
+        revised = StockHistory.objects.get(symbol="2330.TW", date=df.index[247].date())
+        self.assertEqual(revised.volume, int(df["volume"].iloc[247]))
+        last = AdjustedStockHistory.objects.get(symbol="2330.TW", date=df.index[-1].date())
+        self.assertAlmostEqual(last.close, df["close"].iloc[-1] * 0.9)
+
+    def test_adjustment_change_triggers_full_rebuild(self):
+        self.write(self.df.iloc[:250])
+        update_history("2330.TW", self.provider)
+
+        # 除息後整段還原因子改變
+        df = self.df.copy()
+        df["adj_close"] = df["close"] * 0.85
+        self.write(df)
+        self.assertEqual(update_history("2330.TW", self.provider), {"mode": "full", "count": 260})
+        first = AdjustedStockHistory.objects.filter(symbol="2330.TW").first()
+        self.assertAlmostEqual(first.factor, 0.85)
+
+
+class BulkWriterTest(TestCase):
+    def test_fetch_data_refreshes_adjusted_history_outside_window(self):
+        from django.core.management import call_command
+
+        df = make_ohlcv(n=300).drop(columns="openinterest")
+        df["adj_close"] = df["close"]
+        ingest_history("2330.TW", df, replace=True)
+
+        # 後來配息: 之後重抓只拿到最近一段，但整段還原價都要跟著變
+        fetched = df.iloc[-200:].copy()
+        fetched["adj_close"] = fetched["close"] * 0.95
+        fetched.index.name = "date"
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        fetched.to_csv(os.path.join(tmp.name, "2330.TW.csv"))
+        with override_settings(PRICE_DATA_DIR=tmp.name):
+            call_command("fetch_data", "2330", "--provider", "local", stdout=io.StringIO())
+
+        adjusted = load_prices("2330.TW", "adjusted")["close"]
+        self.assertEqual(len(adjusted), 200)
+        np.testing.assert_allclose(adjusted, fetched["close"] * 0.95)
+
+    def test_upsert_is_idempotent(self):
+        df = make_ohlcv(n=50)
+        self.assertEqual(bulk_write(StockHistory, "2330.TW", df, batch_size=7), 50)
+        self.assertEqual(bulk_write(StockHistory, "2330.TW", df, batch_size=7), 50)
+        self.assertEqual(StockHistory.objects.filter(symbol="2330.TW").count(), 50)
+
+        df.iloc[10, df.columns.get_loc("close")] = 123.0
+        bulk_write(StockHistory, "2330.TW", df.iloc[10:11], upsert=False)
+        row = StockHistory.objects.get(symbol="2330.TW", date=df.index[10].date())
+        self.assertNotEqual(row.close, 123.0)
+
+        bulk_write(StockHistory, "2330.TW", df.iloc[10:11])
+        row.refresh_from_db()
+        self.assertEqual(row.close, 123.0)
+        self.assertEqual(row.volume, int(df["volume"].iloc[10]))
+
+
+class FlakyProvider(LocalFileProvider):
+    """前 fail 次呼叫失敗的假資料來源 (模擬網路錯誤 / 被限流)"""
+
+    def __init__(self, root, fail=1):
+        super().__init__(root)
+        self.fail = fail
+        self.calls = {}
+        self.lock = threading.Lock()
+
+    def history(self, symbol, start=None, end=None, period="max"):
+        with self.lock:
+            self.calls[symbol] = self.calls.get(symbol, 0) + 1
+            n = self.calls[symbol]
+        if n <= self.fail:
+            raise ConnectionError("timeout")
+        return super().history(symbol, start, end, period)
+
+
+class UniverseFetchTest(PriceCacheDirMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.symbols = ["2330.TW", "2317.TW", "2454.TW", "1101.TW", "2412.TW"]
+        for seed, symbol in enumerate(self.symbols):
+            df = make_ohlcv(n=120, seed=seed).drop(columns="openinterest")
+            df.index.name = "date"
+            df.to_csv(os.path.join(self.tmp.name, f"{symbol}.csv"))
+
+    def test_concurrent_fetch_with_retry(self):
+        provider = FlakyProvider(self.tmp.name, fail=1)
+        results = fetch_universe(
+            [s[:4] for s in self.symbols] + ["9999"], provider, workers=3, rate=0, backoff=0
+        )
+        self.assertEqual([r["symbol"] for r in results], self.symbols + ["9999.TW"])
+        for res in results[:-1]:
+            self.assertEqual((res["status"], res["mode"], res["count"], res["attempts"]), ("ok", "full", 120, 2))
+        self.assertEqual(results[-1]["status"], "empty")
+        self.assertEqual(StockHistory.objects.count(), 600)
+
+        # 第二次只抓最後一段，沒有新資料
+        again = fetch_universe(self.symbols, LocalFileProvider(self.tmp.name), rate=0)
+        self.assertEqual({r["mode"] for r in again}, {"noop"})
+
+    def test_retries_exhausted(self):
+        provider = FlakyProvider(self.tmp.name, fail=5)
+        results = fetch_universe(["2330"], provider, retries=2, rate=0, backoff=0)
+        self.assertEqual(results[0]["status"], "error")
+        self.assertEqual(provider.calls["2330.TW"], 3)
+
+    def test_load_universe(self):
+        symbols = load_universe("tw50")
+        self.assertEqual(len(symbols), 50)
+        self.assertIn("2330.TW", symbols)
+
+    def test_load_universe_rejects_paths_unless_allowed(self):
+        path = os.path.join(self.tmp.name, "mine.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("2330\n2317\n")
+        for name in (path, "/etc/hostname", "../universes/tw50", "x\\y"):
+            with self.assertRaises(ValueError):
+                load_universe(name)
+        self.assertEqual(load_universe(path, allow_path=True), ["2330.TW", "2317.TW"])
+
+    def test_update_universe_api_validates_input(self):
+        with mock.patch("backtester.views.fetch_universe", return_value=[]) as fetch:
+            for body in ({"universe": "/etc/passwd"}, {"universe": "../x"}, {"symbols": ["2330", "../etc"]},
+                         {"symbols": 2330}, {}):
+                resp = self.client.post("/api/update-universe/", body, content_type="application/json")
+                self.assertEqual(resp.status_code, 400, body)
+            fetch.assert_not_called()
+
+            resp = self.client.post("/api/update-universe/", {"symbols": "2330, 2317"}, content_type="application/json")
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(fetch.call_args[0][0], ["2330", "2317"])
+
+
+class CorporateActionTest(TestCase):
+    def yahoo_0050(self):
+        """模擬 Yahoo 的 0050: 2014 ~ 拆股日之間的價格已經除以 4"""
+        df = make_ohlcv(n=3000, start=50.0).drop(columns="openinterest")
+        df.index = pd.bdate_range("2013-06-03", periods=len(df))
+        df["adj_close"] = df["close"] * 0.9
+        window = (df.index >= "2014-01-01") & (df.index < "2024-12-02")
+        df.loc[window, ["open", "high", "low", "close", "adj_close"]] /= 4
+        df.loc[window, "volume"] *= 4
+        return df, window
+
+    def test_seeded_0050_split_matches_old_patch(self):
+        yahoo, window = self.yahoo_0050()
+        raw, adj = apply_actions("0050.TW", yahoo)
+
+        # 原始價: 區間內乘回 4 倍，其他不動
+        np.testing.assert_allclose(raw["close"][window], yahoo["close"][window] * 4)
+        np.testing.assert_allclose(raw["volume"][window], yahoo["volume"][window] / 4)
+        np.testing.assert_allclose(raw["close"][~window], yahoo["close"][~window])
+
+        # 還原價: 2014 以前除以 4 (原本的斷層修補)，之後等於 Yahoo 價 * 股利因子
+        before = yahoo.index < "2014-01-01"
+        np.testing.assert_allclose(adj["close"][before], yahoo["close"][before] * 0.9 / 4)
+        np.testing.assert_allclose(adj["volume"][before], yahoo["volume"][before] * 4)
+        np.testing.assert_allclose(adj["close"][~before], yahoo["close"][~before] * 0.9)
+        np.testing.assert_allclose(adj["volume"][~before], yahoo["volume"][~before])
+        np.testing.assert_allclose(adj["close"], raw["close"] * adj["factor"])
+
+    def test_dividend_and_reverse_split(self):
+        df = make_ohlcv(n=10).drop(columns="openinterest")
+        df["adj_close"] = df["close"]
+        ex_div, ex_merge = df.index[4], df.index[7]
+        CorporateAction.objects.create(
+            symbol="2330.TW", action=CorporateAction.DIVIDEND, ex_date=ex_div, amount=2.0
+        )
+        CorporateAction.objects.create(
+            symbol="2330.TW", action=CorporateAction.REVERSE_SPLIT, ex_date=ex_merge, ratio=10
+        )
+        raw, adj = apply_actions("2330.TW", df)
+        pd.testing.assert_frame_equal(raw, df[["open", "high", "low", "close", "volume"]].astype(float))
+
+        div = 1 - 2.0 / df["close"].iloc[3]
+        expected = np.array([div * 10] * 4 + [10] * 3 + [1] * 3)
+        np.testing.assert_allclose(adj["factor"], expected)
+        np.testing.assert_allclose(adj["volume"], df["volume"] / np.array([10] * 7 + [1] * 3))
+
+
+class DataQualityTest(PriceCacheDirMixin, TestCase):
+    def test_validator_flags(self):
+        df = make_ohlcv(n=100).drop(columns="openinterest")
+        report = validate_frame(df)
+        self.assertTrue(report["clean"])
+        self.assertEqual(report["rows"], 100)
+
+        bad = df.copy()
+        bad.iloc[10, bad.columns.get_loc("high")] = bad["low"].iloc[10] * 0.5
+        bad.iloc[20, bad.columns.get_loc("volume")] = 0
+        bad.iloc[30, bad.columns.get_loc("close")] = np.nan
+        bad.iloc[40:, :4] *= 4  # 沒還原到的分割
+        bad = pd.concat([bad.iloc[:60], bad.iloc[70:], bad.iloc[[80]]])  # 缺 10 天 + 重複 / 倒退
+        report = validate_frame(bad)
+        self.assertFalse(report["clean"])
+        self.assertEqual(report["ohlc_invalid"], 1)
+        self.assertEqual(report["zero_volume"], 1)
+        self.assertEqual(report["missing_values"], 1)
+        self.assertEqual(report["jumps"], [str(df.index[40].date())])
+        self.assertEqual(report["gaps"], [[str(df.index[59].date()), str(df.index[70].date())]])
+        self.assertEqual((report["duplicates"], report["unsorted"]), (0, 1))
+
+    def test_quality_recorded_at_ingestion(self):
+        df = make_ohlcv(n=120).drop(columns="openinterest")
+        df["adj_close"] = df["close"]
+        ingest_history("2330.TW", df.iloc[:100], replace=True)
+        self.assertTrue(is_clean("2330.TW"))
+
+        # 增量加進一根成交量為 0 的 K 棒 -> 標記為不乾淨
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        tail = df.copy()
+        tail.iloc[110, tail.columns.get_loc("volume")] = 0
+        tail.index.name = "date"
+        tail.to_csv(os.path.join(tmp.name, "2330.TW.csv"))
+        update_history("2330.TW", LocalFileProvider(tmp.name))
+        quality = DataQuality.objects.get(symbol="2330.TW")
+        self.assertFalse(quality.clean)
+        self.assertEqual((quality.rows, quality.zero_volume), (120, 1))
+
+    def test_revised_overlap_rows_are_revalidated(self):
+        df = make_ohlcv(n=120).drop(columns="openinterest")
+        df["adj_close"] = df["close"]
+        ingest_history("2330.TW", df, replace=True)
+        self.assertTrue(is_clean("2330.TW"))
+
+        # 重疊區間內一根被修正成成交量 0 (沒有新的列)
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        tail = df.copy()
+        tail.iloc[115, tail.columns.get_loc("volume")] = 0
+        tail.index.name = "date"
+        tail.to_csv(os.path.join(tmp.name, "2330.TW.csv"))
+        self.assertEqual(update_history("2330.TW", LocalFileProvider(tmp.name))["mode"], "incremental")
+        quality = DataQuality.objects.get(symbol="2330.TW")
+        self.assertFalse(quality.clean)
+        self.assertEqual((quality.rows, quality.zero_volume), (120, 1))
+
+    def test_clean_symbol_skips_reader_cleaning(self):
+        df = make_ohlcv(n=120).drop(columns="openinterest")
+        df["adj_close"] = df["close"]
+        ingest_history("2330.TW", df, replace=True)
+        with mock.patch.object(pd.DataFrame, "ffill") as ffill:
+            result = run_backtest_from_db("2330", "macd", is_api=True, engine="vector")
+        ffill.assert_not_called()
+        self.assertNotIn("error", result)
+
+
+class SQLiteProfileTest(TestCase):
+    def test_pragmas_applied_on_connect(self):
+        from django.db import connection
+
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA synchronous")
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+            cursor.execute("PRAGMA busy_timeout")
+            self.assertEqual(cursor.fetchone()[0], 20000)
+
+
+def reference_arena_day(close, fast, slow, sig, cash, shares, price):
+    """monitor_top10 原本逐策略的寫法 (pandas ewm + 純 Python 記帳)，給對照用"""
+    close = pd.Series(close)
+    dif = close.ewm(span=fast, adjust=False).mean() - close.ewm(span=slow, adjust=False).mean()
+    macd = dif.ewm(span=sig, adjust=False).mean()
+    action = "HOLD"
+    if dif.iloc[-2] < macd.iloc[-2] and dif.iloc[-1] > macd.iloc[-1]:
+        if cash > price:
+            buy = int((cash / price) * 0.995)
+            if buy > 0:
+                cost = buy * price
+                fee = max(20, int(cost * 0.001425))
+                if cash >= cost + fee:
+                    shares += buy
+                    cash -= cost + fee
+                    action = "BUY"
+    elif dif.iloc[-2] > macd.iloc[-2] and dif.iloc[-1] < macd.iloc[-1]:
+        if shares > 0:
+            revenue = shares * price
+            cash += revenue - max(20, int(revenue * 0.001425)) - int(revenue * 0.001)
+            shares = 0
+            action = "SELL"
+    return cash, shares, action
+
+
+class ArenaTest(TestCase):
+    STRATEGIES = [(f, s, g) for f in (5, 8, 11, 14) for s in (25, 35, 45) for g in (5, 9)]
+
+    def test_ewm_rows_matches_pandas(self):
+        close = make_ohlcv(n=80)["close"]
+        out = ewm_rows(close.to_numpy(), [5, 12, 26])
+        for row, span in zip(out, [5, 12, 26]):
+            np.testing.assert_allclose(row, close.ewm(span=span, adjust=False).mean(), rtol=1e-12)
+
+    def test_matches_per_strategy_loop(self):
+        df = make_ohlcv(n=160, seed=4)
+        close = df["close"].to_numpy()
+        wallets = {s: (1000000, 0) for s in self.STRATEGIES}
+        actions = set()
+        for t in range(100, 160):
+            price = round(close[t] * 1.01, 2)
+            results = run_arena(self.STRATEGIES, close[t - 99 : t + 1], price, df.index[t].date())
+            for strat, res in zip(self.STRATEGIES, results):
+                cash, shares, action = reference_arena_day(close[t - 99 : t + 1], *strat, *wallets[strat], price)
+                wallets[strat] = (cash, shares)
+                actions.add(action)
+                self.assertEqual((res["shares"], res["action"]), (shares, action))
+                self.assertAlmostEqual(res["cash"], cash, places=6)
+        self.assertEqual(actions, {"BUY", "SELL", "HOLD"})
+        self.assertEqual(PaperTrading.objects.count(), 60 * len(self.STRATEGIES))
+
+    def test_rerun_same_day_is_idempotent(self):
+        df = make_ohlcv(n=200, seed=4)
+        close = df["close"].to_numpy()
+        for t in range(100, 200):
+            first = run_arena(self.STRATEGIES, close[t - 99 : t + 1], close[t], df.index[t].date())
+            again = run_arena(self.STRATEGIES, close[t - 99 : t + 1], close[t], df.index[t].date())
+            self.assertEqual(first, again)
+
+    def test_thousands_of_strategies(self):
+        strategies = [(f, s, g) for f in range(3, 30) for s in range(20, 80) for g in range(5, 13) if f < s]
+        close = make_ohlcv(n=100)["close"].to_numpy()
+        results = run_arena(strategies, close, close[-1], datetime.date(2024, 1, 2))
+        self.assertEqual(len(results), len(strategies))
+        self.assertEqual(PaperTrading.objects.count(), len(strategies))
+
+
+class ArenaBackfillTest(PriceCacheDirMixin, TestCase):
+    SYMBOL = "0050.TW"
+    STRATEGIES = [(f, s, g) for f in (5, 8, 11) for s in (25, 35) for g in (5, 9)]
+
+    def setUp(self):
+        super().setUp()
+        df = make_ohlcv(n=260, seed=6).drop(columns="openinterest")
+        df["adj_close"] = df["close"] * 0.97  # 還原價與原始價不同，確認兩者各用在對的地方
+        with self.captureOnCommitCallbacks(execute=True):
+            ingest_history(self.SYMBOL, df, replace=True)
+        self.df = df
+        self.dates = [d.date() for d in df.index]
+
+    def daily_reference(self, first, last):
+        """逐日呼叫 run_arena (每日監控的做法)，回傳 {(策略, 日期): (股數, 現金, 動作)}"""
+        adjusted = load_prices(self.SYMBOL, "adjusted")["close"].to_numpy()
+        raw = load_prices(self.SYMBOL, "raw")["close"].to_numpy()
+        out = {}
+        for t in range(first, last + 1):
+            for r in run_arena(self.STRATEGIES, adjusted[: t + 1], round(raw[t], 2), self.dates[t]):
+                out[(r["name"], self.dates[t])] = (r["shares"], round(r["cash"], 6), r["action"])
+        return out
+
+    def stored(self):
+        return {
+            (p.strategy_name, p.date): (p.shares, round(p.cash, 6), p.action)
+            for p in PaperTrading.objects.all()
+        }
+
+    def test_matches_daily_runs(self):
+        expected = self.daily_reference(100, 259)
+        PaperTrading.objects.all().delete()
+
+        days = backfill_arena(self.STRATEGIES, self.SYMBOL, self.dates[100])
+        self.assertEqual(days, 160)
+        self.assertEqual(self.stored(), expected)
+        self.assertEqual({v[2] for v in expected.values()}, {"BUY", "SELL", "HOLD"})
+
+    def test_continues_from_previous_state_and_overwrites(self):
+        expected = self.daily_reference(100, 259)
+        # 中間一段被弄壞、一段遺失，從 180 開始回補到 219
+        PaperTrading.objects.filter(date__gte=self.dates[180], date__lte=self.dates[199]).update(cash=0, shares=0)
+        PaperTrading.objects.filter(date__gte=self.dates[200], date__lte=self.dates[219]).delete()
+
+        # 只補到 219 會讓 220 之後的紀錄接不上，拒絕
+        with self.assertRaises(ValueError):
+            backfill_arena(self.STRATEGIES, self.SYMBOL, self.dates[180], end=self.dates[219])
+
+        days = backfill_arena(self.STRATEGIES, self.SYMBOL, self.dates[180])
+        self.assertEqual(days, 80)
+        self.assertEqual(self.stored(), expected)
+
+    def test_no_history(self):
+        with self.assertRaises(ValueError):
+            backfill_arena(self.STRATEGIES, "9999.TW", self.dates[0])
+        self.assertEqual(backfill_arena(self.STRATEGIES, self.SYMBOL, datetime.date(2100, 1, 1)), 0)
+
+    def test_grid_backfill_is_fast(self):
+        strategies = [(f, s, g) for f in range(3, 20) for s in range(20, 60, 2) for g in (5, 9, 12)]
+        t0 = time.perf_counter()
+        days = backfill_arena(strategies, self.SYMBOL, self.dates[10])
+        elapsed = time.perf_counter() - t0
+        self.assertEqual(PaperTrading.objects.count(), days * len(strategies))
+        self.assertLess(elapsed, 60)
+
+    def test_command(self):
+        from django.core.management import CommandError, call_command
+
+        out = io.StringIO()
+        call_command("backfill_arena", "--start", str(self.dates[200]), "--strategies", "11,45,9", "5,35,9", stdout=out)
+        self.assertIn("2 個策略 x 60 天", out.getvalue())
+        self.assertEqual(PaperTrading.objects.count(), 120)
+
+        for args in (["--start", "2024-13-01"], ["--start", str(self.dates[200]), "--end", "tomorrow"],
+                     ["--start", str(self.dates[200]), "--strategies", "11,45"],
+                     ["--start", str(self.dates[100]), "--end", str(self.dates[150]), "--strategies", "11,45,9"]):
+            with self.assertRaises(CommandError):
+                call_command("backfill_arena", *args, stdout=io.StringIO())
+
+
+class IndicatorStateTest(TestCase):
+    PARAMS = [(11, 45, 9), (5, 35, 9), (8, 25, 5)]
+
+    def full_macd(self, close):
+        rows = []
+        for fast, slow, signal in self.PARAMS:
+            dif = close.ewm(span=fast, adjust=False).mean() - close.ewm(span=slow, adjust=False).mean()
+            rows.append((dif, dif.ewm(span=signal, adjust=False).mean()))
+        return rows
+
+    def test_daily_advance_matches_full_recompute(self):
+        close = make_ohlcv(n=300, seed=6)["close"]
+        history = mock.Mock(return_value=close[:200])
+        crosses = 0
+        for t in range(200, 300):
+            out = advance_macd("TEST", self.PARAMS, close[t - 4 : t + 1], history)
+            for i, (dif, signal) in enumerate(self.full_macd(close[: t + 1])):
+                np.testing.assert_allclose(out["dif"][i], dif.iloc[-1], rtol=1e-9)
+                np.testing.assert_allclose(out["signal"][i], signal.iloc[-1], rtol=1e-9)
+                golden = dif.iloc[-2] < signal.iloc[-2] and dif.iloc[-1] > signal.iloc[-1]
+                death = dif.iloc[-2] > signal.iloc[-2] and dif.iloc[-1] < signal.iloc[-1]
+                self.assertEqual((out["golden"][i], out["death"][i]), (golden, death))
+                crosses += golden + death
+        self.assertGreater(crosses, 0)
+        # 只有第一天需要暖機
+        self.assertEqual(history.call_count, 1)
+        self.assertEqual(IndicatorState.objects.count(), len(self.PARAMS))
+
+    def test_rerun_same_day(self):
+        close = make_ohlcv(n=120, seed=6)["close"]
+        history = mock.Mock(return_value=close)
+        first = advance_macd("TEST", self.PARAMS, close[-5:], history)
+        again = advance_macd("TEST", self.PARAMS, close[-5:], history)
+        np.testing.assert_array_equal(first["dif"], again["dif"])
+        np.testing.assert_array_equal(first["golden"], again["golden"])
+        self.assertEqual(history.call_count, 1)
+
+    def test_gap_or_adjustment_rewarms(self):
+        close = make_ohlcv(n=160, seed=6)["close"]
+        history = mock.Mock(return_value=close[:100])
+        advance_macd("TEST", self.PARAMS, close[96:100], history)
+
+        # 漏跑超過 recent 的範圍 -> 接不上，重新暖機
+        history.return_value = close[:150]
+        out = advance_macd("TEST", self.PARAMS, close[145:150], history)
+        self.assertEqual(history.call_count, 2)
+        np.testing.assert_allclose(out["dif"][0], self.full_macd(close[:150])[0][0].iloc[-1], rtol=1e-9)
+
+        # 除權息後整段還原價被等比例調整 -> 與紀錄的收盤價對不上，重新暖機
+        adjusted = close * 0.25
+        history.return_value = adjusted[:155]
+        out = advance_macd("TEST", self.PARAMS, adjusted[150:155], history)
+        self.assertEqual(history.call_count, 3)
+        np.testing.assert_allclose(out["dif"][0], self.full_macd(adjusted[:155])[0][0].iloc[-1], rtol=1e-9)
+
+    def test_arena_uses_precomputed_signals(self):
+        close = make_ohlcv(n=120, seed=4)["close"]
+        out = advance_macd("TEST", self.PARAMS, close[-5:], mock.Mock(return_value=close))
+        expected = run_arena(self.PARAMS, close.to_numpy(), close.iloc[-1], close.index[-1].date())
+        PaperTrading.objects.all().delete()
+        results = run_arena(
+            self.PARAMS, None, close.iloc[-1], out["date"], signals=(out["golden"], out["death"])
+        )
+        self.assertEqual(
+            [(r["action"], r["shares"]) for r in results],
+            [(r["action"], r["shares"]) for r in expected],
+        )
+
+
+class SlowProvider:
+    """呼叫次數計數、每次下載要 delay 秒的假資料來源"""
+
+    def __init__(self, df, delay=0.2, fail=0):
+        self.df = df
+        self.delay = delay
+        self.fail = fail
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def history(self, symbol, start=None, end=None, period="max"):
+        with self.lock:
+            self.calls += 1
+            n = self.calls
+        time.sleep(self.delay)
+        if n <= self.fail:
+            raise ConnectionError("模擬網路錯誤")
+        return self.df
+
+
+class MarketSnapshotTest(SimpleTestCase):
+    def setUp(self):
+        df = make_ohlcv(n=5)
+        df["adj_close"] = df["close"] * 0.9
+        self.provider = SlowProvider(df)
+        self.cache = MarketSnapshotCache(ttl=60, provider=self.provider)
+
+    def test_concurrent_callers_share_one_download(self):
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            frames = list(pool.map(lambda _: self.cache.get("0050", period="5d"), range(8)))
+        self.assertEqual(self.provider.calls, 1)
+        for df in frames:
+            pd.testing.assert_frame_equal(df, self.provider.df)
+        self.assertEqual(self.cache.stats()["hits"] + self.cache.stats()["coalesced"], 7)
+
+        # 呼叫端改自己拿到的副本不影響快取
+        frames[0]["close"] = 0.0
+        self.assertTrue((self.cache.get("0050.TW")["close"] > 0).all())
+        self.assertEqual(self.provider.calls, 1)
+
+    def test_key_includes_period_and_trading_date(self):
+        self.provider.delay = 0
+        self.cache.get("0050.TW", period="5d")
+        self.cache.get("0050.TW", period="1y")
+        self.assertEqual(self.provider.calls, 2)
+        with mock.patch("backtester.data.snapshot.trading_date", return_value=datetime.date(2099, 1, 2)):
+            self.cache.get("0050.TW", period="5d")
+        self.assertEqual(self.provider.calls, 3)
+
+    def test_ttl_expiry(self):
+        self.provider.delay = 0
+        self.cache.get("0050.TW")
+        with mock.patch("backtester.data.snapshot.time.monotonic", return_value=time.monotonic() + 61):
+            self.cache.get("0050.TW")
+        self.assertEqual(self.provider.calls, 2)
+
+    def test_errors_reach_all_waiters_and_are_not_cached(self):
+        self.provider.fail = 1
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            futures = [pool.submit(self.cache.get, "0050.TW") for _ in range(4)]
+        for f in futures:
+            self.assertIsInstance(f.exception(), ConnectionError)
+        self.assertEqual(self.provider.calls, 1)
+        self.cache.get("0050.TW")
+        self.assertEqual(self.provider.calls, 2)
+
+    def test_stock_info_api_uses_snapshot(self):
+        market_snapshots.clear()
+        with mock.patch.object(market_snapshots, "provider", self.provider):
+            for _ in range(3):
+                response = self.client.get("/stock/0050/")
+        market_snapshots.clear()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["last_price"], round(float(self.provider.df["close"].iloc[-1]), 2))
+        self.assertEqual(self.provider.calls, 1)
+
+
+class UniverseScannerTest(PriceCacheDirMixin, TestCase):
+    CONFIG = {
+        "macd": [(12, 26, 9), (5, 35, 5)],
+        "kd": {"k_period": 9, "d_period": 3, "buy_threshold": 20, "sell_threshold": 80},
+        "trend": {"ma_period": 50},
+    }
+
+    def setUp(self):
+        super().setUp()
+        self.frames = {}
+        # 長短不一的歷史 + 一支停牌 (少最後兩天)
+        for seed, (symbol, n) in enumerate([("2330.TW", 300), ("2317.TW", 250), ("2454.TW", 180), ("1101.TW", 298)]):
+            df = make_ohlcv(n=300, seed=seed).drop(columns="openinterest").iloc[300 - n :]
+            if symbol == "1101.TW":
+                df = make_ohlcv(n=300, seed=seed).drop(columns="openinterest").iloc[:298]
+            df["adj_close"] = df["close"]
+            with self.captureOnCommitCallbacks(execute=True):
+                ingest_history(symbol, df, replace=True)
+            self.frames[symbol] = df
+
+    def expected_signals(self, df, lookback):
+        df = df.iloc[-lookback:]
+        h, l, c = (df[k].to_numpy() for k in ("high", "low", "close"))
+        signals = []
+        for f, s, g in self.CONFIG["macd"]:
+            dif, signal = vector.macd(c, f, s, g)
+            up, down = crossover_rows(dif[None], signal[None])
+            if up[0, -1]:
+                signals.append(f"MACD({f},{s},{g}) 黃金交叉")
+            elif down[0, -1]:
+                signals.append(f"MACD({f},{s},{g}) 死亡交叉")
+        k, d = vector.stochastic(h, l, c, 9, 3, 3)
+        if k[-1] < 20:
+            signals.append("KD 超賣")
+        elif k[-1] > 80:
+            signals.append("KD 超買")
+        up, down = crossover_rows(k[None], d[None])
+        if up[0, -1]:
+            signals.append("KD 黃金交叉")
+        elif down[0, -1]:
+            signals.append("KD 死亡交叉")
+        ma = vector.sma(c, 50)
+        if (c[-1] > ma[-1]) != (c[-2] > ma[-2]):
+            signals.append(f"{'站上' if c[-1] > ma[-1] else '跌破'} 50 日均線")
+        return signals, k[-1]
+
+    def test_matches_single_symbol_indicators(self):
+        symbols = list(self.frames) + ["9999.TW"]
+        result = scan_universe(symbols, config=self.CONFIG, lookback=200)
+        self.assertEqual(result["missing"], ["9999.TW"])
+        self.assertEqual([s["symbol"] for s in result["stale"]], ["1101.TW"])
+        rows = {r["symbol"]: r for r in result["rows"]}
+        self.assertEqual(set(rows), {"2330.TW", "2317.TW", "2454.TW"})
+        self.assertEqual(result["date"], str(self.frames["2330.TW"].index[-1].date()))
+
+        seen = set()
+        for symbol, row in rows.items():
+            signals, k = self.expected_signals(self.frames[symbol], 200)
+            self.assertEqual(row["signals"], signals)
+            self.assertAlmostEqual(row["k"], round(k, 2))
+            seen.update(signals)
+        self.assertTrue(seen)
+
+    def test_db_fallback_matches_price_cache(self):
+        with mock.patch("backtester.engine.scanner._load_from_db") as db:
+            from_cache = load_universe_matrix(list(self.frames), lookback=200)
+            db.assert_not_called()
+        with mock.patch("backtester.engine.scanner.load_price_arrays", return_value=None):
+            from_db = load_universe_matrix(list(self.frames), lookback=200)
+        np.testing.assert_array_equal(from_cache["dates"], from_db["dates"])
+        np.testing.assert_allclose(from_cache["close"], from_db["close"])
+        # 較晚上市的股票開頭為 NaN
+        self.assertTrue(np.isnan(from_cache["close"][2, 0]))
+
+    def test_command_normalizes_symbols(self):
+        from django.core.management import call_command
+
+        out = io.StringIO()
+        call_command("scan_universe", "2330", "2317.TW", "--json", stdout=out)
+        result = json.loads(out.getvalue().split("\n掃描")[0])
+        self.assertEqual(result["missing"], [])
+        self.assertEqual({r["symbol"] for r in result["rows"]}, {"2330.TW", "2317.TW"})
+
+
+class SchedulerTest(TransactionTestCase):
+    """工作在別的執行緒跑、紀錄要跨執行緒看得到，所以用 TransactionTestCase"""
+
+    def run_job(self, job, **kwargs):
+        return asyncio.run(Scheduler({job.name: job}, log=lambda msg: None).run_job(job, **kwargs))
+
+    @override_settings(TRADING_HOLIDAYS=["2025-01-27"])
+    def test_next_fire_skips_weekends_and_holidays(self):
+        tz = ZoneInfo("Asia/Taipei")
+        friday = datetime.datetime(2025, 1, 24, 13, 0, tzinfo=tz)
+        self.assertEqual(next_fire("13:40", friday), datetime.datetime(2025, 1, 24, 13, 40, tzinfo=tz))
+        # 過了時間 -> 跳過週末與休市日
+        after = datetime.datetime(2025, 1, 24, 13, 40, tzinfo=tz)
+        self.assertEqual(next_fire("13:40", after), datetime.datetime(2025, 1, 28, 13, 40, tzinfo=tz))
+        # 伺服器時間是 UTC 也一樣以台北時間計算
+        utc = datetime.datetime(2025, 1, 24, 4, 0, tzinfo=datetime.timezone.utc)
+        self.assertEqual(next_fire("13:40", utc), datetime.datetime(2025, 1, 24, 13, 40, tzinfo=tz))
+        self.assertEqual(next_fire("13:40", after, trading_days_only=False).date(), datetime.date(2025, 1, 25))
+
+    def test_job_threads_release_db_connections(self):
+        threads = []
+        fake = mock.MagicMock(vendor="sqlite")
+        with mock.patch.object(scheduler, "close_old_connections") as close_old, \
+                mock.patch.object(scheduler, "connection", fake):
+            run = self.run_job(Job("conn", lambda: threads.append(threading.get_ident())))
+        self.assertEqual(run.status, "success")
+        self.assertNotEqual(threads[0], threading.get_ident())
+        fake.close.assert_called_once()  # 工作執行緒結束時關掉自己的連線
+        # claim / finish 前後各一次 + 工作執行緒開始時一次
+        self.assertEqual(close_old.call_count, 5)
+
+    def test_postgres_claim_takes_advisory_lock(self):
+        fake = mock.MagicMock(vendor="postgresql")
+        execute = fake.cursor.return_value.__enter__.return_value.execute
+        with mock.patch.object(scheduler, "connection", fake):
+            scheduler._lock_job("personal_scan")
+            scheduler._lock_job("personal_scan")
+            scheduler._lock_job("top10_arena")
+        sql = {c.args[0] for c in execute.call_args_list}
+        self.assertEqual(sql, {"SELECT pg_advisory_xact_lock(%s, %s)"})
+        keys = [c.args[1] for c in execute.call_args_list]
+        self.assertEqual(keys[0], keys[1])
+        self.assertNotEqual(keys[0], keys[2])
+        self.assertTrue(all(-2**31 <= k[1] < 2**31 for k in keys))
+
+        fake.vendor = "sqlite"
+        execute.reset_mock()
+        with mock.patch.object(scheduler, "connection", fake):
+            scheduler._lock_job("personal_scan")
+        execute.assert_not_called()
+
+    def test_retries_with_backoff(self):
+        calls = []
+
+        def flaky():
+            calls.append(1)
+            if len(calls) < 3:
+                raise ConnectionError("模擬網路錯誤")
+
+        run = self.run_job(Job("flaky", flaky, retries=2, backoff=0))
+        self.assertEqual((run.status, run.attempts), ("success", 3))
+
+        calls.clear()
+        run = self.run_job(Job("flaky", flaky, retries=1, backoff=0))
+        self.assertEqual((run.status, run.attempts), ("failed", 2))
+        self.assertIn("ConnectionError", run.error)
+        self.assertEqual(JobRun.objects.filter(job="flaky").count(), 2)
+
+    def test_timeout_blocks_overlap_until_thread_ends(self):
+        release = threading.Event()
+        job = Job("slow", release.wait, timeout=0.1)
+        run = self.run_job(job)
+        self.assertEqual(run.status, "timeout")
+
+        # 超時的執行緒還在跑 -> 第二次被略過
+        again = self.run_job(job)
+        self.assertEqual(again.status, "skipped")
+
+        release.set()
+        for _ in range(50):
+            if JobRun.objects.get(pk=run.pk).status == "timeout":
+                break
+            time.sleep(0.05)
+        self.assertEqual(JobRun.objects.get(pk=run.pk).status, "timeout")
+        release.clear()
+        threading.Timer(0.05, release.set).start()
+        self.assertEqual(self.run_job(Job("slow", release.wait, timeout=5)).status, "success")
+
+    def test_concurrent_triggers_run_once(self):
+        counter = []
+        job = Job("arena", lambda: (counter.append(1), time.sleep(0.2)), max_concurrency=1)
+
+        async def trigger_twice():
+            scheduler = Scheduler({job.name: job}, log=lambda msg: None)
+            return await asyncio.gather(scheduler.run_job(job), scheduler.run_job(job, trigger="manual"))
+
+        runs = asyncio.run(trigger_twice())
+        self.assertEqual(sorted(r.status for r in runs), ["skipped", "success"])
+        self.assertEqual(len(counter), 1)
+
+    def test_serve_fires_due_jobs_and_stops(self):
+        fired = threading.Event()
+        job = Job("tick", fired.set, at="00:00", trading_days_only=False)
+        scheduler = Scheduler({job.name: job}, log=lambda msg: None)
+        fire_at = django_timezone.now() + datetime.timedelta(seconds=0.2)
+
+        async def main():
+            later = fire_at + datetime.timedelta(hours=1)
+            with mock.patch("backtester.scheduler.next_fire", side_effect=[fire_at, later]):
+                task = asyncio.ensure_future(scheduler.serve())
+                await asyncio.to_thread(fired.wait, 5)
+                scheduler.stop()
+                await asyncio.wait_for(task, 5)
+
+        asyncio.run(main())
+        self.assertTrue(fired.is_set())
+        self.assertEqual(JobRun.objects.get(job="tick").status, "success")
+
+    def test_run_job_now_uses_settings(self):
+        calls = []
+        with override_settings(SCHEDULER_JOBS={"noop": {"func": "builtins.print"}}):
+            run = run_job_now("noop", func=lambda: calls.append(1), log=lambda msg: None)
+            with self.assertRaises(ValueError):
+                run_job_now("missing")
+        self.assertEqual((run.status, run.trigger, len(calls)), ("success", "manual", 1))
+
+
+def write_minute_bars(path, symbols, n=400, duplicates=()):
+    """每檔 n 根分 K 交錯寫成一個 CSV (duplicates: 要重複寫入的列號)"""
+    frames = {}
+    for seed, symbol in enumerate(symbols):
+        df = make_ohlcv(n=n, seed=seed)
+        df.index = pd.date_range("2025-01-02 09:00", periods=n, freq="min")
+        frames[symbol] = df
+    rows = []
+    for i in range(n):
+        for symbol, df in frames.items():
+            bar = df.iloc[i]
+            row = [symbol, df.index[i].isoformat(), bar.open, bar.high, bar.low, bar.close, bar.volume]
+            rows.append(row)
+            if i in duplicates:
+                rows.append(row)
+    pd.DataFrame(rows, columns=["symbol", "time", "open", "high", "low", "close", "volume"]).to_csv(path, index=False)
+    return frames
+
+
+class StreamingEngineTest(SimpleTestCase):
+    MACD = [(12, 26, 9), (5, 35, 5)]
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, "bars.csv")
+        self.frames = write_minute_bars(self.path, ["2330.TW", "2317.TW", "0050.TW"], duplicates={50, 51, 300})
+
+    def expected_events(self, symbol):
+        df = self.frames[symbol]
+        h, l, c = (df[k].to_numpy() for k in ("high", "low", "close"))
+        lines = [(f"MACD({a},{b},{g})", *vector.macd(c, a, b, g)) for a, b, g in self.MACD]
+        lines.append(("KD", *vector.stochastic(h, l, c, 9, 3, 3)))
+        events = set()
+        for name, a, b in lines:
+            up, down = crossover_rows(a[None], b[None])
+            events |= {(symbol, df.index[i], name, "golden") for i in np.flatnonzero(up[0])}
+            events |= {(symbol, df.index[i], name, "death") for i in np.flatnonzero(down[0])}
+        return events
+
+    def test_replay_matches_vector_indicators(self):
+        seen = []
+        engine = StreamEngine(macd=self.MACD, on_event=seen.append)
+        stats = asyncio.run(engine.run(ReplayFeed(self.path)))
+        self.assertEqual(stats, {"symbols": 3, "bars": 1200, "dropped": 9, "events": len(seen)})
+
+        got = {(e["symbol"], pd.Timestamp(e["time"]), e["indicator"], e["type"]) for e in seen}
+        self.assertEqual(len(got), len(seen))  # 重送的 K 棒沒有產生重複事件
+        expected = set()
+        for symbol in self.frames:
+            expected |= self.expected_events(symbol)
+        self.assertEqual(got, expected)
+        self.assertTrue(any(e[2] == "KD" for e in got))
+
+        df = self.frames["2330.TW"]
+        dif, signal = vector.macd(df["close"].to_numpy(), 12, 26, 9)
+        snap = engine.snapshot("2330.TW")["MACD(12,26,9)"]
+        self.assertAlmostEqual(snap["dif"], dif[-1], places=9)
+        self.assertAlmostEqual(snap["signal"], signal[-1], places=9)
+
+    def test_concurrent_feeds_and_symbol_filter(self):
+        engine = StreamEngine(macd=self.MACD)
+        queue = QueueFeed()
+
+        async def main():
+            async def push():
+                df = self.frames["0050.TW"]
+                for t, bar in df.iterrows():
+                    await queue.put({"symbol": "0050.TW", "time": t.to_pydatetime(), **bar.to_dict()})
+                await queue.put(None)
+
+            return await asyncio.gather(
+                run_streams(engine, [ReplayFeed(self.path, symbols=["2330.TW", "2317.TW"]), queue]),
+                push(),
+            )
+
+        stats, _ = asyncio.run(main())
+        self.assertEqual((stats["symbols"], stats["bars"]), (3, 1200))
+
+    def test_tick_aggregation(self):
+        agg = MinuteBarAggregator()
+        t = datetime.datetime(2025, 1, 2, 9, 0, 5)
+        ticks = [(0, 100.0, 1), (20, 101.5, 2), (40, 99.0, 1), (65, 100.5, 3), (30, 120.0, 1)]
+        done = [agg.add({"symbol": "2330.TW", "time": t + datetime.timedelta(seconds=s), "price": p, "volume": v}) for s, p, v in ticks]
+        bar = done[3]
+        self.assertEqual(done[:3] + done[4:], [None, None, None, None])  # 舊分鐘的亂序 tick 不會重開 K 棒
+        self.assertEqual(
+            (bar["time"], bar["open"], bar["high"], bar["low"], bar["close"], bar["volume"]),
+            (datetime.datetime(2025, 1, 2, 9, 0), 100.0, 101.5, 99.0, 99.0, 4),
+        )
+        self.assertEqual([b["close"] for b in agg.flush()], [100.5])
+
+
+class PaperTraderLedgerTest(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+        self.path = os.path.join(tmp.name, "ledger.sqlite3")
+        self.legacy = os.path.join(tmp.name, "paper_wallets.json")
+
+    def trader(self):
+        return PaperTrader(self.path, legacy_file=self.legacy)
+
+    def test_trades_append_ledger_and_update_snapshot(self):
+        trader = self.trader()
+        trader.execute("2025-01-02", 100.0, "BUY")
+        trader.execute("2025-01-03", 110.0, "HOLD")
+        trader.execute("2025-01-06", 120.0, "SELL")
+
+        # 大戶: 買 int(1e6 / 100 * 0.995) = 9950 股，手續費 int(995000 * 0.001425) = 1417
+        cash = 1000000 - 995000 - 1417
+        # 賣 9950 股 @120: 手續費 int(1194000 * 0.001425) = 1701，證交稅 1194
+        cash += 1194000 - 1701 - 1194
+        reloaded = self.trader().wallets["大戶 (100W)"]
+        self.assertEqual((reloaded["cash"], reloaded["shares"]), (cash, 0))
+        self.assertEqual(reloaded["roi"], round((cash - 1000000) / 1000000 * 100, 2))
+        # 微型戶 1000 元買不到: int(1000 / 100 * 0.995) = 9 股 + 手續費 1 元
+        self.assertEqual(self.trader().wallets["微型戶 (1K)"]["cash"], 1000 - 900 - 1 + 1080 - 1 - 1)
+
+        rows = trader.history("大戶 (100W)")
+        self.assertEqual([r["action"] for r in rows], ["賣出 9950 股", "續抱", "買進 9950 股"])
+        self.assertEqual(len(trader.history()), 3 * len(INITIAL_POCKETS))
+
+    def test_same_day_rerun_and_concurrent_execute(self):
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            reports = list(pool.map(lambda _: self.trader().execute("2025-01-02", 100.0, "BUY"), range(4)))
+        # 只有一次真的交易，其餘回報今日已結算
+        self.assertEqual(sum("今日已結算" in r for r in reports), 3)
+        self.assertEqual(len(self.trader().history()), len(INITIAL_POCKETS))
+        self.assertEqual(self.trader().wallets["大戶 (100W)"]["shares"], 9950)
+
+    def test_compact_archives_old_rows(self):
+        trader = self.trader()
+        for day in range(1, 11):
+            trader.execute(f"2025-01-{day:02d}", 100.0 + day, "HOLD")
+        archive = os.path.join(self.dir, "ledger.jsonl.gz")
+        removed = trader.compact("2025-01-08", archive=archive)
+        self.assertEqual(removed, 7 * len(INITIAL_POCKETS))
+        self.assertEqual({r["date"] for r in trader.history()}, {"2025-01-08", "2025-01-09", "2025-01-10"})
+        with gzip.open(archive, "rt", encoding="utf-8") as f:
+            archived = [json.loads(line) for line in f]
+        self.assertEqual(len(archived), removed)
+        self.assertEqual(self.trader().wallets["大戶 (100W)"]["last_date"], "2025-01-10")
+
+    def test_imports_legacy_json(self):
+        legacy = {
+            "大戶 (100W)": {
+                "init_capital": 1000000, "cash": 5000.0, "shares": 100, "total_assets": 12000.0,
+                "roi": -98.8, "history": [{"date": "2025-01-02", "price": 70.0, "assets": 12000, "action": "續抱"}],
+            }
+        }
+        with open(self.legacy, "w", encoding="utf-8") as f:
+            json.dump(legacy, f)
+        trader = self.trader()
+        wallet = trader.wallets["大戶 (100W)"]
+        self.assertEqual((wallet["cash"], wallet["shares"], wallet["last_date"]), (5000.0, 100, "2025-01-02"))
+        self.assertEqual(trader.wallets["微型戶 (1K)"]["cash"], 1000)
+        rows = trader.history("大戶 (100W)")
+        self.assertEqual(len(rows), 1)
+        self.assertEqual((rows[0]["cash"], rows[0]["shares"], rows[0]["assets"]), (None, None, 12000))
+
+    def test_migrates_old_ledger_markers_to_null(self):
+        # 舊版 schema: cash / shares NOT NULL，匯入的歷史以 -1 代表未知
+        with closing(sqlite3.connect(self.path)) as conn:
+            conn.executescript(
+                "CREATE TABLE ledger (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, date TEXT NOT NULL,"
+                " price REAL NOT NULL, signal TEXT NOT NULL, action TEXT NOT NULL, cash REAL NOT NULL,"
+                " shares INTEGER NOT NULL, assets INTEGER NOT NULL, roi REAL NOT NULL, created_at TEXT NOT NULL);"
+                "INSERT INTO ledger VALUES (1, '大戶 (100W)', '2025-01-02', 70.0, '', '續抱', -1, -1, 12000, -98.8, 'x');"
+                "INSERT INTO ledger VALUES (2, '大戶 (100W)', '2025-01-03', 71.0, 'HOLD', '續抱', 5000.0, 100, 12100, -98.79, 'x');"
+            )
+            conn.commit()
+        trader = self.trader()
+        trader.execute("2025-01-06", 72.0, "HOLD")
+        rows = trader.history("大戶 (100W)")
+        self.assertEqual([(r["id"], r["cash"], r["shares"]) for r in rows[1:]], [(2, 5000.0, 100), (1, None, None)])
+        self.assertGreater(rows[0]["id"], 2)
+        self.trader()  # 已遷移過，再開一次不會重建
+
+
+class WalletArrayTest(SimpleTestCase):
+    def test_matches_paper_trader(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        trader = PaperTrader(os.path.join(tmp.name, "ledger.sqlite3"), legacy_file=os.path.join(tmp.name, "none.json"))
+        wallets = WalletArray(list(INITIAL_POCKETS.values()), names=list(INITIAL_POCKETS))
+
+        rng = np.random.default_rng(0)
+        prices = np.round(70 * np.exp(np.cumsum(rng.normal(0, 0.02, 120))), 2)
+        signals = rng.choice(["BUY", "SELL", "HOLD"], size=120, p=[0.25, 0.25, 0.5])
+        messages = set()
+        for day, (price, signal) in enumerate(zip(prices, signals)):
+            trader.execute(f"2025-{day // 28 + 1:02d}-{day % 28 + 1:02d}", float(price), str(signal))
+            codes = wallets.step(price, str(signal))
+            actions = wallets.messages(codes)
+            roi = wallets.roi(price)
+            for i, name in enumerate(INITIAL_POCKETS):
+                w = trader.wallets[name]
+                self.assertEqual((w["cash"], w["shares"], w["roi"], w["last_action"]),
+                                 (wallets.cash[i], wallets.shares[i], roi[i], actions[i]))
+                messages.add(actions[i].split()[0])
+        self.assertTrue({"買進", "賣出", "續抱", "空手"} <= messages)
+
+    def test_thousands_of_wallets_with_own_fee_schedules(self):
+        rng = np.random.default_rng(1)
+        n = 5000
+        capital = rng.choice([50, 1000, 10000, 100000, 1000000], size=n) * rng.uniform(0.5, 2, n)
+        fees = {
+            "fee_rate": rng.choice([0.001425, 0.001425 * 0.28], size=n),
+            "min_fee": rng.choice([1, 20], size=n),
+            "tax_rate": rng.choice([0.001, 0.003], size=n),
+            "buffer": rng.choice([0.995, 0.99], size=n),
+        }
+        wallets = WalletArray(capital, **fees)
+        cash, shares = capital.copy(), np.zeros(n, dtype=int)
+        for step in range(40):
+            price = float(np.round(rng.uniform(40, 200), 2))
+            signal = rng.choice([1, -1, 0], size=n)  # 每個口袋跑不同策略
+            codes = wallets.step(price, signal)
+            actions = wallets.messages(codes)
+            for i in range(n):
+                kind = {1: "BUY", -1: "SELL", 0: "HOLD"}[signal[i]]
+                cash[i], shares[i], msg = trade(cash[i], shares[i], price, kind, **{k: v[i] for k, v in fees.items()})
+                self.assertEqual(msg, actions[i])
+            np.testing.assert_array_equal(wallets.cash, cash)
+            np.testing.assert_array_equal(wallets.shares, shares)
+
+
+class FakeSMTPServer:
+    """測試用的 SMTP 伺服器 (同一行程、只收信不轉寄)，可模擬慢速、暫時 / 永久錯誤與斷線"""
+
+    def __init__(self, delay=0.0, fail_data=0, fail_code=451):
+        self.delay = delay
+        self.fail_data = fail_data
+        self.fail_code = fail_code
+        self.drop_next = False  # 下一個指令直接斷線 (模擬伺服器踢掉閒置連線)
+        self.messages = []
+        self.connections = 0
+        self.logins = 0
+        self.quits = 0
+        self.lock = threading.Lock()
+
+        fake = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def reply(self, line):
+                self.wfile.write(line.encode() + b"\r\n")
+
+            def handle(self):
+                with fake.lock:
+                    fake.connections += 1
+                self.reply("220 fake ESMTP")
+                while True:
+                    line = self.rfile.readline().decode().strip()
+                    if not line:
+                        return
+                    with fake.lock:
+                        drop, fake.drop_next = fake.drop_next, False
+                    if drop:
+                        return
+                    cmd = line.split(" ", 1)[0].upper()
+                    if cmd == "EHLO":
+                        self.reply("250-fake")
+                        self.reply("250 AUTH PLAIN LOGIN")
+                    elif cmd == "AUTH":
+                        with fake.lock:
+                            fake.logins += 1
+                        self.reply("235 ok")
+                    elif cmd == "DATA":
+                        self.reply("354 go ahead")
+                        data = []
+                        while True:
+                            chunk = self.rfile.readline()
+                            if chunk in (b".\r\n", b""):
+                                break
+                            data.append(chunk)
+                        time.sleep(fake.delay)
+                        with fake.lock:
+                            failing = fake.fail_data > 0
+                            if failing:
+                                fake.fail_data -= 1
+                            else:
+                                fake.messages.append(email.message_from_bytes(b"".join(data)))
+                        self.reply(f"{fake.fail_code} rejected" if failing else "250 queued")
+                    elif cmd == "QUIT":
+                        with fake.lock:
+                            fake.quits += 1
+                        self.reply("221 bye")
+                        return
+                    else:  # HELO / MAIL / RCPT / RSET / NOOP
+                        self.reply("250 ok")
+
+        self.server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True).start()
+
+    def subjects(self):
+        return [str(email.header.make_header(email.header.decode_header(m["Subject"]))) for m in self.messages]
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class EmailDispatcherTest(SimpleTestCase):
+    def start(self, **server_options):
+        server = FakeSMTPServer(**server_options)
+        self.addCleanup(server.close)
+        return server
+
+    def dispatcher(self, server, **options):
+        options = {"backoff": 0.01, "log": lambda *a: None, **options}
+        d = EmailDispatcher(
+            host="127.0.0.1", port=server.port, user="bot@example.com", password="pw",
+            to="me@example.com", use_tls=False, **options,
+        )
+        self.addCleanup(d.close, 5)
+        return d
+
+    def test_submit_does_not_block_and_reuses_one_session(self):
+        server = self.start(delay=0.02)
+        d = self.dispatcher(server)
+        t0 = time.perf_counter()
+        futures = [d.submit(f"訊號 {i}", f"內容 {i}") for i in range(40)]
+        submitted = time.perf_counter() - t0
+        self.assertLess(submitted, 40 * 0.02 / 4)
+        self.assertTrue(d.flush(timeout=10))
+
+        self.assertTrue(all(f.result() for f in futures))
+        self.assertEqual(server.subjects(), [f"訊號 {i}" for i in range(40)])
+        self.assertEqual((server.connections, server.logins), (1, 1))
+        self.assertEqual(server.messages[0]["To"], "me@example.com")
+        self.assertEqual(d.stats(), {"queued": 0, "sent": 40, "failed": 0, "retried": 0, "connections": 1})
+
+    def test_transient_errors_are_retried_with_backoff(self):
+        server = self.start(fail_data=2)
+        d = self.dispatcher(server, retries=3)
+        futures = [d.submit("a", "1"), d.submit("b", "2")]
+        self.assertTrue(d.flush(timeout=10))
+        self.assertEqual([f.result() for f in futures], [True, True])
+        self.assertEqual(server.subjects(), ["a", "b"])
+        self.assertEqual(d.stats()["retried"], 2)
+
+    def test_permanent_error_fails_fast_and_queue_keeps_going(self):
+        server = self.start(fail_data=1, fail_code=554)
+        d = self.dispatcher(server, retries=3)
+        bad, good = d.submit("bad", "x"), d.submit("good", "y")
+        self.assertTrue(d.flush(timeout=10))
+        with self.assertRaises(smtplib.SMTPDataError):
+            bad.result()
+        self.assertTrue(good.result())
+        self.assertEqual(server.subjects(), ["good"])
+        self.assertEqual((d.stats()["failed"], d.stats()["retried"]), (1, 0))
+
+    def test_reconnects_when_server_drops_session(self):
+        server = self.start()
+        d = self.dispatcher(server)
+        d.submit("first", "1").result(timeout=5)
+        server.drop_next = True
+        d.submit("second", "2").result(timeout=5)
+        self.assertEqual(server.subjects(), ["first", "second"])
+        self.assertEqual(server.connections, 2)
+        self.assertEqual(d.stats()["retried"], 0)  # NOOP 發現斷線就重連，不算重試
+
+    def test_idle_session_is_closed(self):
+        server = self.start()
+        d = self.dispatcher(server, idle_timeout=0.05)
+        d.submit("first", "1").result(timeout=5)
+        for _ in range(100):
+            if server.quits:
+                break
+            time.sleep(0.02)
+        self.assertEqual(server.quits, 1)
+        d.submit("second", "2").result(timeout=5)
+        self.assertEqual(server.connections, 2)
+
+    def test_gives_up_after_retries_when_server_is_down(self):
+        server = self.start()
+        port = server.port
+        server.close()
+        d = EmailDispatcher(host="127.0.0.1", port=port, user="", password="", retries=2,
+                            backoff=0.01, log=lambda *a: None)
+        self.addCleanup(d.close, 5)
+        future = d.submit("lost", "x")
+        with self.assertRaises(OSError):
+            future.result(timeout=5)
+        self.assertEqual((d.stats()["failed"], d.stats()["retried"]), (1, 2))
+
+    def test_close_drains_queue(self):
+        server = self.start(delay=0.01)
+        d = self.dispatcher(server)
+        for i in range(10):
+            d.submit(f"m{i}", "x")
+        self.assertTrue(d.close(timeout=10))
+        self.assertEqual(len(server.messages), 10)
+        self.assertEqual(server.quits, 1)
+        with self.assertRaises(RuntimeError):
+            d.submit("late", "x")
+
+    def test_cancelled_messages_are_skipped(self):
+        server = self.start(delay=0.2)
+        d = self.dispatcher(server)
+        first = d.submit("first", "1")
+        time.sleep(0.05)  # 第一封寄送中，其餘還在排隊
+        futures = [d.submit(f"m{i}", "x") for i in range(3)]
+        self.assertTrue(futures[1].cancel())
+        self.assertTrue(d.flush(timeout=10))
+        self.assertFalse(first.cancel())  # 寄出後不能再取消
+        self.assertEqual(server.subjects(), ["first", "m0", "m2"])
+        self.assertTrue(futures[0].result() and futures[2].result())
+
+    def test_unexpected_error_does_not_kill_worker(self):
+        server = self.start()
+        d = self.dispatcher(server)
+        real = d._deliver
+
+        def broken(msg, future):
+            if "bad" in str(msg["Subject"]):
+                raise KeyError("boom")
+            return real(msg, future)
+
+        with mock.patch.object(d, "_deliver", broken):
+            bad, good = d.submit("bad", "x"), d.submit("good", "y")
+            self.assertTrue(d.flush(timeout=10))
+        with self.assertRaises(KeyError):
+            bad.result()
+        self.assertTrue(good.result())
+        self.assertEqual(server.subjects(), ["good"])
+        self.assertEqual(d.stats()["failed"], 1)
+
+    def test_send_signal_email_uses_shared_queue(self):
+        server = self.start()
+        d = self.dispatcher(server)
+        with mock.patch("utils.emailer._dispatcher", d):
+            future = send_signal_email("📊 股票池每日訊號", "內容", wait=True)
+        self.assertTrue(future.result())
+        self.assertEqual(server.subjects(), ["📊 股票池每日訊號"])
@@ -4,7 +4,10 @@ from .views import (
     StockInfoAPIView,
     SaveStrategyAPIView,
     RunBacktestAPIView,
+    BacktestCacheStatsAPIView,
+    OptimizerResultsAPIView,
     UpdateStockDataAPIView,
+    UpdateUniverseAPIView,
     PaperTradingLeaderboardAPIView,  # 新增這個 View
 )
 
@@ -13,7 +16,10 @@ urlpatterns = [
     path("stock/<str:symbol>/", StockInfoAPIView.as_view(), name="stock-info"),
     path("api/save/", SaveStrategyAPIView.as_view(), name="save-strategy"),
     path("api/run-backtest/", RunBacktestAPIView.as_view(), name="run-backtest"),
+    path("api/backtest-cache/", BacktestCacheStatsAPIView.as_view(), name="backtest-cache"),
+    path("api/optimizer-runs/<str:run_id>/", OptimizerResultsAPIView.as_view(), name="optimizer-run"),
     path("api/update-stock/", UpdateStockDataAPIView.as_view(), name="update-stock"),
+    path("api/update-universe/", UpdateUniverseAPIView.as_view(), name="update-universe"),
     
     # 新增排行榜 API 路徑
     path("api/leaderboard/", PaperTradingLeaderboardAPIView.as_view(), name="leaderboard"),
@@ -1,17 +1,20 @@
+import re
 from django.shortcuts import render
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-import yfinance as yf
-import pandas as pd
 from django.contrib.auth.models import User
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 from django.db.models import Max
 
 # 匯入你的資料庫模型與回測引擎
-from .models import BacktestStrategy, StockHistory, PaperTrading
-from .engine.runner import run_backtest_from_db
+from .models import BacktestStrategy, StockHistory, PaperTrading, OptimizerRun
+from .engine.cache import run_backtest_cached, backtest_cache
+from .engine.runs import top_results
+from .data.ingest import update_history
+from .data.fetcher import fetch_universe, load_universe
+from .data.snapshot import market_snapshot
 
 
 def index(request):
@@ -23,14 +26,13 @@ class StockInfoAPIView(APIView):
         if symbol.isdigit() and not symbol.endswith(".TW"):
             symbol = f"{symbol}.TW"
         try:
-            ticker = yf.Ticker(symbol)
-            hist = ticker.history(period="5d")
+            hist = market_snapshot(symbol, period="5d")
             if not hist.empty:
                 last_row = hist.iloc[-1]
                 return Response(
                     {
                         "symbol": symbol,
-                        "last_price": round(float(last_row["Close"]), 2),
+                        "last_price": round(float(last_row["close"]), 2),
                         "date": hist.index[-1].strftime("%Y-%m-%d"),
                     }
                 )
@@ -64,16 +66,58 @@ class RunBacktestAPIView(APIView):
             symbol = request.data.get("symbol", "0050")
             strategy = request.data.get("strategy", "default_kd")
             custom_params = request.data.get("params", {})
+            engine = request.data.get("engine", "backtrader")  # backtrader / vector
 
-            # 呼叫回測引擎
-            result = run_backtest_from_db(
-                symbol, strategy_name=strategy, params=custom_params, is_api=True
+            # 呼叫回測引擎 (相同輸入且資料未更新時直接回傳快取)
+            result = run_backtest_cached(
+                symbol, strategy_name=strategy, params=custom_params, engine=engine
             )
             return Response(result)
         except Exception as e:
             return Response({"error": f"回測失敗: {str(e)}"}, status=500)
 
 
+# 回測快取命中率 (hit/miss 計數)
+class BacktestCacheStatsAPIView(APIView):
+    authentication_classes = []
+    permission_classes = []
+
+    def get(self, request):
+        return Response(backtest_cache.stats())
+
+
+# 參數最佳化結果查詢: /api/optimizer-runs/<run_id>/?k=10&max_mdd=30
+class OptimizerResultsAPIView(APIView):
+    authentication_classes = []
+    permission_classes = []
+
+    def get(self, request, run_id):
+        run = OptimizerRun.objects.filter(run_id=run_id).first()
+        if run is None:
+            return Response({"error": f"找不到最佳化紀錄 {run_id}"}, status=404)
+        try:
+            k = int(request.query_params.get("k", 10))
+            max_mdd = request.query_params.get("max_mdd")
+            min_roi = request.query_params.get("min_roi")
+            max_mdd = float(max_mdd) if max_mdd is not None else None
+            min_roi = float(min_roi) if min_roi is not None else None
+        except ValueError:
+            return Response({"error": "參數格式錯誤"}, status=400)
+        if k < 1:
+            return Response({"error": "k 必須大於 0"}, status=400)
+
+        return Response(
+            {
+                "run_id": run.run_id,
+                "symbol": run.symbol,
+                "status": run.status,
+                "total": run.total,
+                "evaluated": run.results.count(),
+                "results": top_results(run_id, k, max_mdd=max_mdd, min_roi=min_roi),
+            }
+        )
+
+
 # 【核心修正】強效資料修復 (忽略時區差異)
 @method_decorator(csrf_exempt, name="dispatch")
 class UpdateStockDataAPIView(APIView):
@@ -85,56 +129,72 @@ class UpdateStockDataAPIView(APIView):
         if symbol.isdigit() and not symbol.endswith(".TW"):
             symbol = f"{symbol}.TW"
         try:
-            print(f"正在重抓 {symbol} ...")
-            StockHistory.objects.filter(symbol=symbol).delete()
-
-            ticker = yf.Ticker(symbol)
-            # 抓取不還原的資料 (actions=False) 避免 Yahoo 自動還原導致混亂
-            df = ticker.history(period="max", auto_adjust=False, actions=False)
+            # 預設只抓最後一段並 upsert 有變動的列；full=true 或偵測到除權息 / 分割時才整段重抓
+            full = str(request.data.get("full", "")).lower() in ("1", "true", "yes")
+            print(f"正在更新 {symbol} ({'完整重抓' if full else '增量'}) ...")
+            out = update_history(symbol, full=full)
 
-            if df.empty:
+            if out["mode"] == "full" and out["count"] == 0:
                 return Response({"error": "無法取得歷史資料"}, status=404)
 
-            # 【修復補丁】針對 0050.TW
-            if "0050" in symbol:
-                print("執行 0050 資料強效修復...")
-
-                # 轉成純日期 (date) 進行比對，避開時區 bug
-                dates = df.index.date
-                patch_start = pd.Timestamp("2014-01-01").date()
-                patch_end = pd.Timestamp("2024-12-02").date()  # 拆股日
-
-                # 找出 2014/1/1 ~ 2024/12/02 之間的資料
-                # 邏輯：這段期間 Yahoo 給的是「已經拆股過(除以4)」的價格
-                # 但我們為了顯示正確的歷史K線，需要把它「乘回 4 倍」還原成當時的真實價格
-                mask = (dates >= patch_start) & (dates < patch_end)
-
-                if mask.any():
-                    df.loc[mask, ["Open", "High", "Low", "Close"]] *= 4
-                    df.loc[mask, "Volume"] /= 4
-                    print(f"已修復 {mask.sum()} 筆資料 (還原為真實 190 元股價)")
-
-            history_list = [
-                StockHistory(
-                    symbol=symbol,
-                    date=index.date(),
-                    open=row["Open"],
-                    high=row["High"],
-                    low=row["Low"],
-                    close=row["Close"],
-                    volume=row["Volume"],
-                )
-                for index, row in df.iterrows()
-            ]
-            StockHistory.objects.bulk_create(history_list)
-
             return Response(
-                {"message": f"{symbol} 資料已修復並更新！", "count": len(history_list)}
+                {"message": f"{symbol} 資料已更新！", "mode": out["mode"], "count": out["count"]}
             )
         except Exception as e:
             return Response({"error": f"更新失敗: {str(e)}"}, status=500)
 
 
+SYMBOL_RE = re.compile(r"^[0-9A-Za-z^][0-9A-Za-z.\-^]{0,19}$")
+MAX_SYMBOLS = 200
+
+
+def parse_symbols(value):
+    """symbols 可為 list 或以逗號 / 空白分隔的字串，格式不符丟 ValueError"""
+    if value in (None, ""):
+        return []
+    if isinstance(value, str):
+        value = re.split(r"[,\s]+", value.strip())
+    if not isinstance(value, (list, tuple)) or not all(isinstance(v, str) for v in value):
+        raise ValueError("symbols 必須是字串或字串陣列")
+    symbols = [v.strip() for v in value if v.strip()]
+    bad = [v for v in symbols if not SYMBOL_RE.match(v)]
+    if bad:
+        raise ValueError(f"股票代號格式錯誤: {', '.join(bad[:5])}")
+    if len(symbols) > MAX_SYMBOLS:
+        raise ValueError(f"一次最多 {MAX_SYMBOLS} 支股票")
+    return symbols
+
+
+# 批次更新多支股票: {"symbols": ["2330", "2317"]} 或 {"universe": "tw50"} (只接受內建股票池名稱)
+@method_decorator(csrf_exempt, name="dispatch")
+class UpdateUniverseAPIView(APIView):
+    authentication_classes = []
+    permission_classes = []
+
+    def post(self, request):
+        universe = request.data.get("universe")
+        try:
+            symbols = parse_symbols(request.data.get("symbols"))
+            if universe:
+                if not isinstance(universe, str):
+                    raise ValueError("universe 必須是股票池名稱")
+                symbols += load_universe(universe)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+        if not symbols:
+            return Response({"error": "請提供 symbols 或 universe"}, status=400)
+
+        full = str(request.data.get("full", "")).lower() in ("1", "true", "yes")
+        results = fetch_universe(symbols, full=full)
+        return Response(
+            {
+                "ok": sum(r["status"] == "ok" for r in results),
+                "total": len(results),
+                "results": results,
+            }
+        )
+
+
 # 【新增】策略競技場排行榜 API (讓前端抓取 Top 10 資料)
 class PaperTradingLeaderboardAPIView(APIView):
     authentication_classes = []
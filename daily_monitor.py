@@ -1,9 +1,17 @@
 # daily_monitor.py
-import yfinance as yf
-import pandas as pd
-import datetime
-import schedule
+import os
+import asyncio
+import django
 from utils.emailer import send_signal_email  # 匯入剛剛寫的寄信功能
+from utils.paper_trader import PaperTrader
+
+# 設定 Django 環境 (指標狀態存在資料庫)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'quant_platform.settings')
+django.setup()
+
+from backtester.data.snapshot import market_snapshot
+from backtester.engine.indicator_state import advance_macd, provider_closes, WARM_PERIOD
+from backtester.scheduler import Scheduler, load_jobs
 
 # 設定你的「冠軍參數」
 FAST_EMA = 14
@@ -11,94 +19,68 @@ SLOW_EMA = 40
 SIGNAL_EMA = 9
 SYMBOL = "0050.TW"
 
-def calculate_macd(df):
-    """手動計算 MACD (不依賴 TA-Lib，純 Pandas 實作)"""
-    # 1. 計算快線與慢線 (EMA)
-    ema_fast = df['Close'].ewm(span=FAST_EMA, adjust=False).mean()
-    ema_slow = df['Close'].ewm(span=SLOW_EMA, adjust=False).mean()
-    
-    # 2. 計算 DIF (快 - 慢)
-    df['dif'] = ema_fast - ema_slow
-    
-    # 3. 計算 MACD 訊號線 (DIF 的 EMA)
-    df['macd_signal'] = df['dif'].ewm(span=SIGNAL_EMA, adjust=False).mean()
-    
-    # 4. 計算柱狀圖 (OSC)
-    df['osc'] = df['dif'] - df['macd_signal']
-    return df
 
-def run_daily_scan():
-    print(f"🕵️‍♂️ 正在掃描 {SYMBOL} 的最新訊號...")
-    
-    # 1. 抓取資料 (抓最近 100 天就夠算指標了)
-    # auto_adjust=True 很重要，我們要用「還原股價」算指標才準
-    df = yf.Ticker(SYMBOL).history(period="100d", auto_adjust=True)
-    
+def run_personal_scan(log=print):
+    """個人口袋掃描: MACD 訊號 + 五個口袋模擬記帳 + 寄出報表 (排程與 GUI 共用)"""
+    log("開始執行個人口袋掃描...")
+    # 只抓最近幾天: 原始價記帳、還原價推進資料庫裡的 EMA 狀態
+    df = market_snapshot(SYMBOL, period="5d")
     if df.empty:
-        print("❌ 抓不到資料，請檢查網路")
-        return
+        raise RuntimeError("抓不到資料")
 
-    # 2. 計算指標
-    df = calculate_macd(df)
-    
-    # 3. 取得最後兩天的資料來比對交叉
-    # today = 今天收盤 (或最新盤中)
-    # yesterday = 昨天收盤
-    today = df.iloc[-1]
-    yesterday = df.iloc[-2]
-    
-    curr_price = round(today['Close'], 2)
-    date_str = df.index[-1].strftime('%Y-%m-%d')
+    state = advance_macd(
+        SYMBOL,
+        [(FAST_EMA, SLOW_EMA, SIGNAL_EMA)],
+        df['adj_close'],
+        lambda: provider_closes(SYMBOL, WARM_PERIOD),
+    )
+    today = {'dif': state['dif'][0], 'macd_signal': state['signal'][0]}
+    yesterday = {'dif': state['prev_dif'][0], 'macd_signal': state['prev_signal'][0]}
 
-    print(f"📅 日期: {date_str} | 收盤價: {curr_price}")
-    print(f"📊 今日 DIF: {today['dif']:.2f} | 訊號線: {today['macd_signal']:.2f}")
-    print(f"📊 昨日 DIF: {yesterday['dif']:.2f} | 訊號線: {yesterday['macd_signal']:.2f}")
+    real_price = round(df['close'].iloc[-1], 2)
+    date_str = state['date'].strftime('%Y-%m-%d')
+    log(f"日期: {date_str} | 現價: {real_price}")
 
-    # 4. 判斷訊號 (黃金交叉 / 死亡交叉)
-    signal_type = None
-    
-    # 黃金交叉：昨天 DIF < 訊號線，且 今天 DIF > 訊號線
+    signal_type = "HOLD"
+    signal_msg = "無特殊訊號"
     if yesterday['dif'] < yesterday['macd_signal'] and today['dif'] > today['macd_signal']:
         signal_type = "BUY"
-    
-    # 死亡交叉：昨天 DIF > 訊號線，且 今天 DIF < 訊號線
+        signal_msg = "🚀 黃金交叉 (買進)"
     elif yesterday['dif'] > yesterday['macd_signal'] and today['dif'] < today['macd_signal']:
         signal_type = "SELL"
+        signal_msg = "📉 死亡交叉 (賣出)"
+
+    # 執行記帳
+    trader = PaperTrader()
+    wallet_report = trader.execute(date_str, real_price, signal_type)
+    log(f"訊號: {signal_type} | 記帳完成")
+
+    # 寄信
+    subject = f"✅ {SYMBOL} 個人監控與帳務回報"
+    if signal_type != "HOLD":
+        subject = f"【{signal_type}】{SYMBOL} 訊號觸發！"
+
+    content = (
+        f"📅 日期: {date_str}\n"
+        f"💰 收盤: {real_price}\n"
+        f"📊 指標: DIF {today['dif']:.2f} | MACD {today['macd_signal']:.2f}\n"
+        f"📢 訊號: {signal_msg}\n"
+        f"--------------------------------\n"
+        f"💼【五個口袋模擬績效】\n"
+        f"{wallet_report}\n"
+        f"--------------------------------\n"
+        f"個人監控機器人報告完畢。"
+    )
+    send_signal_email(subject, content)
+    log(f"📧 個人報表已發送")
+    return signal_type
 
-    # 5. 發送通知
-    if signal_type == "BUY":
-        subject = f"🚀【買進訊號】{SYMBOL} 出現黃金交叉！"
-        content = (
-            f"監控標的: {SYMBOL}\n"
-            f"日期: {date_str}\n"
-            f"收盤價: {curr_price}\n\n"
-            f"📈 技術指標 (MACD {FAST_EMA}-{SLOW_EMA}-{SIGNAL_EMA}):\n"
-            f"DIF 向上突破訊號線，確認轉強！\n"
-            f"建議動作: 分批佈局或買入。"
-        )
-        send_signal_email(subject, content)
-        
-    elif signal_type == "SELL":
-        subject = f"📉【賣出訊號】{SYMBOL} 出現死亡交叉！"
-        content = (
-            f"監控標的: {SYMBOL}\n"
-            f"日期: {date_str}\n"
-            f"收盤價: {curr_price}\n\n"
-            f"📉 技術指標 (MACD {FAST_EMA}-{SLOW_EMA}-{SIGNAL_EMA}):\n"
-            f"DIF 向下跌破訊號線，趨勢轉弱！\n"
-            f"建議動作: 獲利了結或停損觀望。"
-        )
-        send_signal_email(subject, content)
-    else:
-        print("😴 今日無特殊訊號，趨勢延續中...")
 
 if __name__ == "__main__":
-    print("機器人啟動中... 每天 13:40 自動掃描")
-    
-    # 設定每天下午 1:40 執行
-    # schedule.every().day.at("13:40").do(run_daily_scan)
-    schedule.every().day.at("13:40").do(run_daily_scan)
-    
-    while True:
-        schedule.run_pending()
-        time.sleep(60) # 每分鐘檢查一次時間
\ No newline at end of file
+    print("機器人啟動中... 每個交易日 13:40 執行個人口袋掃描 (MACD 訊號 + 五個口袋記帳 + 寄出報表)")
+    print("完整排程 (含 Top 10 競技場) 請用 python manage.py run_scheduler")
+
+    # 只排 settings.SCHEDULER_JOBS 的 personal_scan (交易日 13:40)，
+    # 執行紀錄寫進 JobRun，與 run_scheduler / GUI 共用同一個工作名稱與鎖，不會重複寄報表
+    jobs = load_jobs()
+    asyncio.run(Scheduler({"personal_scan": jobs["personal_scan"]}).serve())
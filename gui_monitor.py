@@ -1,25 +1,18 @@
 import tkinter as tk
 from tkinter import scrolledtext
+import asyncio
 import threading
-import time
-import schedule
-import yfinance as yf
-import pandas as pd
 from datetime import datetime
+from functools import partial
 
-# 匯入工具
-from utils.emailer import send_signal_email
-from utils.paper_trader import PaperTrader
-
-# 匯入 Top 10 監控邏輯 (請確保 monitor_top10.py 在同一層目錄)
+# 匯入 Top 10 / 個人監控邏輯 (請確保 monitor_top10.py 在同一層目錄，import 時會一併設定好 Django)
 import monitor_top10 
+import daily_monitor
+from daily_monitor import SYMBOL
+from backtester.scheduler import Scheduler, load_jobs, run_job_now
 
-# ================= 設定區 =================
-SYMBOL = "0050.TW"
-FAST_EMA = 14
-SLOW_EMA = 40
-SIGNAL_EMA = 9
-# ==========================================
+# 排程本身由 backtester/scheduler.py 負責 (伺服器上請用 python manage.py run_scheduler)，
+# 這個視窗只是它的一個前端: 手動執行也會寫 JobRun 紀錄，與背景排程不會重疊
 
 class StockMonitorApp:
     def __init__(self, root):
@@ -79,71 +72,11 @@ class StockMonitorApp:
 
     # ==================== 功能邏輯 ====================
 
-    def calculate_macd(self, df):
-        ema_fast = df['Close'].ewm(span=FAST_EMA, adjust=False).mean()
-        ema_slow = df['Close'].ewm(span=SLOW_EMA, adjust=False).mean()
-        df['dif'] = ema_fast - ema_slow
-        df['macd_signal'] = df['dif'].ewm(span=SIGNAL_EMA, adjust=False).mean()
-        return df
-
     def scan_logic(self):
-        """個人口袋掃描邏輯"""
-        self.log(f"開始執行個人口袋掃描...")
-        try:
-            ticker = yf.Ticker(SYMBOL)
-            df_adj = ticker.history(period="100d", auto_adjust=True)
-            df_raw = ticker.history(period="1d", auto_adjust=False)
-
-            if df_adj.empty or df_raw.empty:
-                self.log("❌ 錯誤：抓不到資料")
-                return
-
-            df_adj = self.calculate_macd(df_adj)
-            today = df_adj.iloc[-1]
-            yesterday = df_adj.iloc[-2]
-            
-            real_price = round(df_raw['Close'].iloc[-1], 2) 
-            date_str = df_adj.index[-1].strftime('%Y-%m-%d')
-
-            self.log(f"日期: {date_str} | 現價: {real_price}")
-            
-            signal_type = "HOLD"
-            signal_msg = "無特殊訊號"
-            
-            if yesterday['dif'] < yesterday['macd_signal'] and today['dif'] > today['macd_signal']:
-                signal_type = "BUY"
-                signal_msg = "🚀 黃金交叉 (買進)"
-            elif yesterday['dif'] > yesterday['macd_signal'] and today['dif'] < today['macd_signal']:
-                signal_type = "SELL"
-                signal_msg = "📉 死亡交叉 (賣出)"
-
-            # 執行記帳
-            trader = PaperTrader()
-            wallet_report = trader.execute(date_str, real_price, signal_type)
-            
-            self.log(f"訊號: {signal_type} | 記帳完成")
-
-            # 寄信
-            subject = f"✅ {SYMBOL} 個人監控與帳務回報"
-            if signal_type != "HOLD":
-                subject = f"【{signal_type}】{SYMBOL} 訊號觸發！"
-
-            content = (
-                f"📅 日期: {date_str}\n"
-                f"💰 收盤: {real_price}\n"
-                f"📊 指標: DIF {today['dif']:.2f} | MACD {today['macd_signal']:.2f}\n"
-                f"📢 訊號: {signal_msg}\n"
-                f"--------------------------------\n"
-                f"💼【五個口袋模擬績效】\n"
-                f"{wallet_report}\n"
-                f"--------------------------------\n"
-                f"個人監控機器人報告完畢。"
-            )
-            send_signal_email(subject, content)
-            self.log(f"📧 個人報表已發送")
-
-        except Exception as e:
-            self.log(f"❌ 錯誤: {e}")
+        """個人口袋掃描 (經過排程器: 有紀錄、不與排程重疊)"""
+        run = run_job_now("personal_scan", func=partial(daily_monitor.run_personal_scan, log=self.log), log=self.log)
+        if run.status not in ("success", "skipped"):
+            self.log(f"❌ 錯誤: {run.error.strip().splitlines()[-1] if run.error else run.status}")
 
     # ==================== 按鈕事件 ====================
 
@@ -165,10 +98,11 @@ class StockMonitorApp:
         self.log("這會寫入資料庫並更新網頁排行榜，請稍候...")
         try:
             # 呼叫 monitor_top10.py 裡面的函式
-            monitor_top10.run_simulation()
-            self.log("✅ Top 10 更新完成！請查看網頁或信箱。")
-        except Exception as e:
-            self.log(f"❌ Top 10 更新失敗: {e}")
+            run = run_job_now("top10_arena", func=monitor_top10.run_simulation, log=self.log)
+            if run.status == "success":
+                self.log("✅ Top 10 更新完成！請查看網頁或信箱。")
+            elif run.status != "skipped":
+                self.log(f"❌ Top 10 更新失敗: {run.status}")
         finally:
             self.btn_run_top10.config(state='normal')
 
@@ -179,30 +113,23 @@ class StockMonitorApp:
         self.is_running = True
         self.btn_start.config(state='disabled')
         self.btn_stop.config(state='normal')
-        self.lbl_status.config(text="狀態：排程監控中 (每天 13:40 執行)", fg="green")
-        
-        schedule.clear()
-        # 每天下午 1:40 同時跑兩件事：個人掃描 & Top 10 更新
-        schedule.every().day.at("13:40").do(self.scan_logic)
-        schedule.every().day.at("13:41").do(self.run_top10_scan) # 晚一分鐘跑 Top 10
+        self.lbl_status.config(text="狀態：排程監控中 (交易日 13:40 執行)", fg="green")
         
+        # 每個交易日下午 1:40 個人掃描、1:41 Top 10 更新 (設定在 settings.SCHEDULER_JOBS)
+        self.scheduler = Scheduler(load_jobs(), log=self.log)
         self.log("排程已啟動，等待下午 1:40 觸發...")
-        self.monitor_thread = threading.Thread(target=self._schedule_loop)
+        self.monitor_thread = threading.Thread(target=lambda: asyncio.run(self.scheduler.serve()))
         self.monitor_thread.daemon = True
         self.monitor_thread.start()
 
     def stop_schedule(self):
         self.is_running = False
+        self.scheduler.stop()
         self.btn_start.config(state='normal')
         self.btn_stop.config(state='disabled')
         self.lbl_status.config(text="狀態：已停止", fg="red")
         self.log("排程已停止")
 
-    def _schedule_loop(self):
-        while self.is_running:
-            schedule.run_pending()
-            time.sleep(1)
-
 if __name__ == "__main__":
     root = tk.Tk()
     app = StockMonitorApp(root)
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -74,11 +75,94 @@ WSGI_APPLICATION = 'quant_platform.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# 預設 SQLite；設定環境變數 QUANT_DB=postgres 改用 PostgreSQL (需安裝 psycopg)
+DB_BACKEND = os.environ.get('QUANT_DB', 'sqlite')
+
+if DB_BACKEND == 'postgres':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('POSTGRES_DB', 'quant_platform'),
+            'USER': os.environ.get('POSTGRES_USER', 'postgres'),
+            'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+            'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+            'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+            # 長駐連線 (monitor / 排程 / API 不必每次重新連線)
+            'CONN_MAX_AGE': int(os.environ.get('POSTGRES_CONN_MAX_AGE', 600)),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {},
+        }
     }
+    if os.environ.get('POSTGRES_POOL'):
+        # psycopg 連線池 (Django 5.1+)，與 CONN_MAX_AGE 互斥
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': 2,
+            'max_size': int(os.environ.get('POSTGRES_POOL')),
+        }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+            'OPTIONS': {
+                # 交易一開始就拿寫入鎖，避免兩個寫入者互相升級鎖而 "database is locked"
+                'transaction_mode': 'IMMEDIATE',
+                'timeout': 20,
+            },
+        }
+    }
+
+# 每條 SQLite 連線建立時套用的 PRAGMA (backtester/db.py)，設成 {} 可關閉
+# WAL: 讀寫互不阻塞 (回測讀取時 ingestion 仍可寫入)
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    'busy_timeout': 20000,
+    'cache_size': -64000,  # 負數 = KB
+    'temp_store': 'MEMORY',
+}
+
+
+# Price data
+# 歷史股價來源: "yahoo" 或 "local" (讀 PRICE_DATA_DIR 底下的 <symbol>.csv / .parquet)
+PRICE_PROVIDER = 'yahoo'
+PRICE_DATA_DIR = BASE_DIR / 'price_data'
+# 每支股票的 mmap 欄位快取 (.npy)，ingestion 時重建，多個 worker 共用 page cache
+PRICE_CACHE_DIR = BASE_DIR / 'price_cache'
+
+# 回測結果快取: 行程內 LRU 筆數上限 / 存活秒數，BACKEND 填 CACHES 的 alias 可跨 worker 共用
+BACKTEST_CACHE = {
+    'MAXSIZE': 128,
+    'TTL': 600,
+    'BACKEND': None,
+}
+
+# 每日監控共用的最新行情快取 (backtester/data/snapshot.py): 同一交易日內 TTL 秒內不重複下載
+MARKET_TIMEZONE = 'Asia/Taipei'
+MARKET_SNAPSHOT = {
+    'TTL': 300,
+}
+
+# 背景排程 (python manage.py run_scheduler)，at 為市場時區的 HH:MM，只在交易日觸發
+# 休市日 (週末以外) 寫在 TRADING_HOLIDAYS，例如 ['2025-01-27', '2025-01-28']
+TRADING_HOLIDAYS = []
+SCHEDULER_JOBS = {
+    'personal_scan': {
+        'func': 'daily_monitor.run_personal_scan',
+        'at': '13:40',
+        'timeout': 300,
+        'retries': 2,
+        'backoff': 60,
+    },
+    'top10_arena': {
+        'func': 'monitor_top10.run_simulation',
+        'at': '13:41',
+        'timeout': 600,
+        'retries': 2,
+        'backoff': 60,
+    },
 }
 
 
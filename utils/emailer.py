@@ -1,4 +1,9 @@
+import atexit
+import queue
 import smtplib
+import threading
+import time
+from concurrent.futures import Future
 from email.mime.text import MIMEText
 from email.header import Header
 
@@ -24,45 +29,255 @@ USE_TLS = False
 # =================================================
 
 
-def send_signal_email(subject, content):
+# 背景寄信佇列設定
+BATCH_SIZE = 50  # 一次連線最多連續寄幾封 (之後 NOOP 確認連線還活著)
+IDLE_TIMEOUT = 60  # 佇列空閒超過幾秒就先斷線 (伺服器通常也會踢掉閒置連線)
+RETRIES = 3  # 暫時性錯誤 (斷線 / 4xx) 的重試次數
+BACKOFF = 5.0  # 第 n 次重試前等 BACKOFF * 2^(n-1) 秒
+SEND_TIMEOUT = 30  # 單一 SMTP 指令的 socket timeout
+SHUTDOWN_TIMEOUT = 120  # 程式結束時最多等幾秒把佇列寄完
+
+
+def build_message(subject, content, sender=MY_EMAIL, to=TO_EMAIL):
     msg = MIMEText(content, "plain", "utf-8")
     msg["Subject"] = Header(subject, "utf-8")
-    msg["From"] = MY_EMAIL
-    msg["To"] = TO_EMAIL
+    msg["From"] = sender
+    msg["To"] = to
+    return msg
+
+
+def is_permanent(error):
+    """5xx 回應 (帳密錯誤、收件人被拒...) 重試也沒用"""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return True
+    return isinstance(error, smtplib.SMTPResponseException) and 500 <= error.smtp_code < 600
+
+
+def explain(error):
+    """失敗時附上排查建議"""
+    if "Authentication" in str(error) or getattr(error, "smtp_code", None) == 535:
+        return "💡 提示: 請檢查帳號密碼是否正確，或伺服器是否允許該 IP 連線。"
+    if "refused" in str(error):
+        return "💡 提示: 連線被拒，請檢查 Port 是否正確，或防火牆是否擋住了。"
+    return ""
+
+
+class EmailDispatcher:
+    """
+    背景寄信佇列: submit() 立刻回傳 Future，由一條 daemon 執行緒負責寄出
+    - 同一條 SMTP 連線 (含登入) 跨多封信重複使用，閒置 idle_timeout 秒才斷線
+    - 每次從佇列取出最多 batch_size 封連續寄，批次開始前 NOOP 確認連線
+    - 斷線 / 4xx 等暫時性錯誤重新連線並以 backoff * 2^(n-1) 秒重試，5xx 直接失敗
+    """
+
+    def __init__(self, host=SMTP_SERVER, port=SMTP_PORT, user=MY_EMAIL, password=MY_PASSWORD,
+                 to=TO_EMAIL, use_tls=USE_TLS, batch_size=BATCH_SIZE, idle_timeout=IDLE_TIMEOUT,
+                 retries=RETRIES, backoff=BACKOFF, timeout=SEND_TIMEOUT, log=print):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.to = to
+        self.use_tls = use_tls
+        self.batch_size = batch_size
+        self.idle_timeout = idle_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.log = log
+        self.queue = queue.Queue()
+        self._server = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._closed = False
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.connections = 0
+
+    # ---------- 對外介面 ----------
+    def submit(self, subject, content, to=None):
+        """排入佇列，回傳 concurrent.futures.Future (寄出後 result() 為 True，失敗為例外)"""
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("寄信佇列已關閉")
+            self._ensure_worker()
+            self.queue.put((build_message(subject, content, self.user, to or self.to), future))
+        return future
+
+    def flush(self, timeout=None):
+        """等佇列裡的信全部處理完 (寄出或放棄)，timeout 到了還沒完成回傳 False"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.queue.all_tasks_done:
+            while self.queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.queue.all_tasks_done.wait(remaining)
+        return True
+
+    def close(self, timeout=None):
+        """寄完剩下的信後停止背景執行緒並斷線"""
+        with self._lock:
+            if self._closed:
+                return True
+            self._closed = True
+            thread = self._thread
+            if thread is None:
+                return True
+            self.queue.put(None)
+        thread.join(timeout)
+        return not thread.is_alive()
 
-    try:
-        # 判斷連線模式
-        if SMTP_PORT == 465:
+    def stats(self):
+        return {
+            "queued": self.queue.qsize(),
+            "sent": self.sent,
+            "failed": self.failed,
+            "retried": self.retried,
+            "connections": self.connections,
+        }
+
+    # ---------- 背景執行緒 ----------
+    def _ensure_worker(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="email-dispatcher", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                item = self.queue.get(timeout=self.idle_timeout)
+            except queue.Empty:
+                self._disconnect()
+                continue
+            batch = [item]
+            while item is not None and len(batch) < self.batch_size:
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                batch.append(item)
+
+            stop = batch[-1] is None
+            self._check_connection()
+            for entry in batch:
+                try:
+                    # 排隊時已被 cancel() 的信直接跳過；之後 Future 進入 running，不能再取消
+                    if entry is not None and entry[1].set_running_or_notify_cancel():
+                        self._deliver(*entry)
+                except Exception as e:
+                    # 任何一封出狀況都不能讓背景執行緒掛掉 (否則 flush 永遠等不到、後面的信也寄不出去)
+                    self.failed += 1
+                    self.log(f"❌ 寄信失敗: {e}")
+                    if not entry[1].done():
+                        entry[1].set_exception(e)
+                finally:
+                    self.queue.task_done()
+            if stop:
+                self._disconnect()
+                return
+
+    def _connect(self):
+        if self.port == 465:
             # SSL 模式 (常見於 Port 465)
-            server = smtplib.SMTP_SSL(SMTP_SERVER, SMTP_PORT)
+            server = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout)
         else:
-            # 一般模式 (常見於 Port 587 或 25)
-            server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT)
-
-            # 如果是 587，通常需要啟動 TLS 加密
-            if USE_TLS:
+            # 一般模式 (常見於 Port 587 或 25)，587 通常需要啟動 TLS 加密
+            server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+            if self.use_tls:
                 server.starttls()
+        # 伺服器不需要驗證時把帳號或密碼設成空字串
+        if self.user and self.password:
+            server.login(self.user, self.password)
+        self.connections += 1
+        return server
+
+    def _disconnect(self):
+        server, self._server = self._server, None
+        if server is None:
+            return
+        try:
+            server.quit()
+        except Exception:
+            server.close()
+
+    def _check_connection(self):
+        """閒置過的連線可能已被伺服器關掉，先 NOOP 確認，壞了就丟掉重連"""
+        if self._server is None:
+            return
+        try:
+            if self._server.noop()[0] == 250:
+                return
+        except Exception:
+            pass
+        self._server.close()
+        self._server = None
+
+    def _deliver(self, msg, future):
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                if self._server is None:
+                    self._server = self._connect()
+                self._server.send_message(msg)
+            except Exception as e:
+                if isinstance(e, smtplib.SMTPResponseException) and e.smtp_code < 500:
+                    self._check_connection()  # 4xx 時連線通常還能用
+                elif not isinstance(e, smtplib.SMTPRecipientsRefused):
+                    self._disconnect()
+                if attempt <= self.retries and not is_permanent(e):
+                    delay = self.backoff * 2 ** (attempt - 1)
+                    self.retried += 1
+                    self.log(f"⚠️ 寄信失敗 ({e})，{delay:.0f} 秒後重試")
+                    time.sleep(delay)
+                    continue
+                self.failed += 1
+                self.log(f"❌ 寄信失敗: {e}")
+                hint = explain(e)
+                if hint:
+                    self.log(hint)
+                future.set_exception(e)
+                return
+            self.sent += 1
+            self.log(f"✅ [自架SMTP] 信件已發送至 {msg['To']}")
+            future.set_result(True)
+            return
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
 
-        # 登入 (如果你的 SMTP 不需要驗證，可以把這兩行註解掉)
-        if MY_EMAIL and MY_PASSWORD:
-            server.login(MY_EMAIL, MY_PASSWORD)
+def get_dispatcher():
+    """全程式共用的寄信佇列 (第一次寄信時才建立，程式結束前會等它寄完)"""
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = EmailDispatcher()
+            atexit.register(_dispatcher.close, SHUTDOWN_TIMEOUT)
+        return _dispatcher
 
-        # 發送
-        server.send_message(msg)
-        server.quit()
-        print(f"✅ [自架SMTP] 信件已發送至 {TO_EMAIL}")
 
-    except Exception as e:
-        print(f"❌ 寄信失敗: {e}")
-        # 如果失敗，印出更詳細的錯誤建議
-        if "Authentication" in str(e):
-            print("💡 提示: 請檢查帳號密碼是否正確，或伺服器是否允許該 IP 連線。")
-        elif "refused" in str(e):
-            print("💡 提示: 連線被拒，請檢查 Port 是否正確，或防火牆是否擋住了。")
+def send_signal_email(subject, content, wait=False):
+    """
+    排入背景佇列後立刻返回，不擋住訊號計算；回傳 Future
+    wait=True 時等到寄出 (或確定失敗) 才返回，失敗不丟例外 (與舊版相同只印出錯誤)
+    """
+    future = get_dispatcher().submit(subject, content)
+    if wait:
+        try:
+            future.result()
+        except Exception:
+            pass
+    return future
 
 
 if __name__ == "__main__":
     send_signal_email(
         "SMTP 測試信",
         "恭喜！你的自架 SMTP Server 串接成功！\n這是一封來自 Python 機器人的自動通知。",
+        wait=True,
     )
@@ -1,9 +1,15 @@
 # utils/paper_trader.py
+import gzip
 import json
 import os
+import sqlite3
+from contextlib import closing
 from datetime import datetime
+import numpy as np
 
-# 設定檔案儲存位置
+# 帳本位置: SQLite 檔案 (wallets = 目前餘額快照，ledger = 只會新增的交易紀錄)
+LEDGER_FILE = "paper_ledger.sqlite3"
+# 舊版整包 JSON 帳本，第一次開啟新帳本時自動匯入
 DATA_FILE = "paper_wallets.json"
 
 # 設定初始口袋 (名稱: 本金)
@@ -15,37 +21,268 @@ INITIAL_POCKETS = {
     "大戶 (100W)": 1000000,
 }
 
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS wallets (
+    name TEXT PRIMARY KEY,
+    init_capital REAL NOT NULL,
+    cash REAL NOT NULL,
+    shares INTEGER NOT NULL,
+    total_assets REAL NOT NULL,
+    roi REAL NOT NULL,
+    last_date TEXT,
+    last_action TEXT
+);
+CREATE TABLE IF NOT EXISTS ledger (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    date TEXT NOT NULL,
+    price REAL NOT NULL,
+    signal TEXT NOT NULL,
+    action TEXT NOT NULL,
+    cash REAL,
+    shares INTEGER,
+    assets INTEGER NOT NULL,
+    roi REAL NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ledger_name_date ON ledger (name, date);
+"""
+
+# 手續費 0.1425% (最低 1 元)、證交稅 0.1% (ETF)、買進時預留 0.5% 當手續費緩衝
+FEE_RATE = 0.001425
+MIN_FEE = 1
+TAX_RATE = 0.001
+BUY_BUFFER = 0.995
+
+WALLET_FIELDS = ["init_capital", "cash", "shares", "total_assets", "roi", "last_date", "last_action"]
+
+
+def trade(cash, shares, price, signal_type, fee_rate=FEE_RATE, min_fee=MIN_FEE,
+          tax_rate=TAX_RATE, buffer=BUY_BUFFER):
+    """
+    單一口袋的一次交易，回傳 (cash, shares, 動作說明)
+    買進預留 0.5% 手續費緩衝；手續費 0.1425% 最低 1 元；賣出另扣 0.1% 證交稅 (ETF)
+    """
+    # --- 買進邏輯 ---
+    if signal_type == "BUY" and cash > price:
+        # 計算最多能買幾股 (預留 0.5% 當手續費緩衝)
+        max_shares = int((cash / price) * buffer)
+        if max_shares <= 0:
+            return cash, shares, "買不起 1 股"
+
+        cost = max_shares * price
+        # 手續費 (0.1425%, 最低 1 元)
+        fee = max(min_fee, int(cost * fee_rate))
+        if cash < cost + fee:
+            return cash, shares, "資金不足"
+        return cash - (cost + fee), shares + max_shares, f"買進 {max_shares} 股"
+
+    # --- 賣出邏輯 ---
+    if signal_type == "SELL" and shares > 0:
+        revenue = shares * price
+        # 手續費 (0.1425%, 最低 1 元)
+        fee = max(min_fee, int(revenue * fee_rate))
+        # 證交稅 (0.1% ETF)
+        tax = int(revenue * tax_rate)
+        return cash + revenue - fee - tax, 0, f"賣出 {shares} 股"
+
+    # --- 無動作 ---
+    return cash, shares, "續抱" if shares > 0 else "空手"
+
+
+def format_line(name, wallet, action_msg):
+    roi = wallet["roi"]
+    symbol = "🔺" if roi > 0 else "🔻" if roi < 0 else "▫️"
+    return f"{name}: ${int(wallet['total_assets']):,} ({symbol}{roi}%) | {action_msg}"
+
+
+# WalletArray.step 回傳的動作代碼
+HOLD, BOUGHT, SOLD, CANT_AFFORD, NO_FUNDS = 0, 1, 2, 3, 4
+SIGNAL_CODES = {"BUY": 1, "SELL": -1, "HOLD": 0}
+
+
+class WalletArray:
+    """
+    大量口袋一起模擬: cash / shares / 本金 / 費率都是陣列，每個訊號一次陣列運算更新全部
+    規則與 trade() 完全相同 (費率、低消、證交稅、買進緩衝可每個口袋不同)
+    """
+
+    def __init__(self, init_capital, fee_rate=FEE_RATE, min_fee=MIN_FEE, tax_rate=TAX_RATE,
+                 buffer=BUY_BUFFER, names=None):
+        self.init_capital = np.asarray(init_capital, dtype=float)
+        n = len(self.init_capital)
+        self.cash = self.init_capital.copy()
+        self.shares = np.zeros(n, dtype=np.int64)
+        self.fee_rate = np.broadcast_to(np.asarray(fee_rate, dtype=float), (n,))
+        self.min_fee = np.broadcast_to(np.asarray(min_fee, dtype=float), (n,))
+        self.tax_rate = np.broadcast_to(np.asarray(tax_rate, dtype=float), (n,))
+        self.buffer = np.broadcast_to(np.asarray(buffer, dtype=float), (n,))
+        self.names = list(names) if names is not None else [str(i) for i in range(n)]
+        self._traded = np.zeros(n, dtype=np.int64)  # 上一次 step 各口袋成交股數
+
+    def __len__(self):
+        return len(self.cash)
+
+    def step(self, price, signal):
+        """
+        price: 成交價 (純量或每個口袋一個)
+        signal: "BUY" / "SELL" / "HOLD"，或每個口袋一個的 1 / -1 / 0 陣列 (不同策略)
+        回傳動作代碼陣列 (HOLD / BOUGHT / SOLD / CANT_AFFORD / NO_FUNDS)
+        """
+        n = len(self)
+        price = np.broadcast_to(np.asarray(price, dtype=float), (n,))
+        if isinstance(signal, str):
+            signal = SIGNAL_CODES[signal]
+        signal = np.broadcast_to(np.asarray(signal), (n,))
+        cash, shares = self.cash, self.shares
+        codes = np.full(n, HOLD, dtype=np.int8)
+
+        # --- 買進 ---
+        want = (signal == 1) & (cash > price)
+        max_shares = np.floor((cash / price) * self.buffer).astype(np.int64)
+        cost = max_shares * price
+        fee = np.maximum(self.min_fee, np.floor(cost * self.fee_rate))
+        codes[want & (max_shares <= 0)] = CANT_AFFORD
+        codes[want & (max_shares > 0) & (cash < cost + fee)] = NO_FUNDS
+        buy = want & (max_shares > 0) & (cash >= cost + fee)
+
+        # --- 賣出 ---
+        sell = (signal == -1) & (shares > 0)
+        revenue = shares * price
+        sell_fee = np.maximum(self.min_fee, np.floor(revenue * self.fee_rate))
+        tax = np.floor(revenue * self.tax_rate)
+
+        # 運算順序與 trade() 相同，浮點數結果逐位一致
+        self.cash = np.where(buy, cash - (cost + fee), np.where(sell, cash + revenue - sell_fee - tax, cash))
+        self.shares = np.where(buy, shares + max_shares, np.where(sell, 0, shares))
+        codes[buy] = BOUGHT
+        codes[sell] = SOLD
+        self._traded = np.where(buy, max_shares, np.where(sell, shares, 0))
+        return codes
+
+    def total_assets(self, price):
+        return self.cash + self.shares * np.asarray(price, dtype=float)
+
+    def roi(self, price):
+        return np.round((self.total_assets(price) - self.init_capital) / self.init_capital * 100, 2)
+
+    def messages(self, codes):
+        """動作代碼 -> 與 PaperTrader 相同的文字 (只在要出報表時才轉，不在熱路徑上)"""
+        out = []
+        for code, traded, shares in zip(codes, self._traded, self.shares):
+            if code == BOUGHT:
+                out.append(f"買進 {traded} 股")
+            elif code == SOLD:
+                out.append(f"賣出 {traded} 股")
+            elif code == CANT_AFFORD:
+                out.append("買不起 1 股")
+            elif code == NO_FUNDS:
+                out.append("資金不足")
+            else:
+                out.append("續抱" if shares > 0 else "空手")
+        return out
+
 
 class PaperTrader:
-    def __init__(self):
+    """
+    多口袋模擬帳戶
+    - 每次 execute 在同一個 IMMEDIATE 交易裡: 讀快照 -> 交易 -> 每個口袋新增一筆 ledger -> 更新快照
+      (GUI 按鈕與排程同時觸發也會排隊，不會讀到舊餘額；同一天重複執行不會重複交易)
+    - 載入只讀 wallets 快照 (筆數 = 口袋數)，歷史要用 history() 另外查
+    """
+
+    def __init__(self, path=None, legacy_file=None):
+        self.path = path or LEDGER_FILE
+        self.legacy_file = legacy_file or DATA_FILE
+        self._init_db()
         self.wallets = self._load_data()
 
-    def _load_data(self):
-        """讀取或初始化帳本"""
-        if os.path.exists(DATA_FILE):
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=20, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute("PRAGMA busy_timeout = 20000")
+        return conn
+
+    def _init_db(self):
+        with closing(self._connect()) as conn:
+            conn.executescript(SCHEMA)
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._migrate(conn)
+                if conn.execute("SELECT COUNT(*) FROM wallets").fetchone()[0] == 0:
+                    self._seed(conn)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    @staticmethod
+    def _migrate(conn):
+        """舊版 ledger 的 cash / shares 為 NOT NULL 且以 -1 代表未知: 重建成可為 NULL 並把 -1 換成 NULL"""
+        columns = {row["name"]: row["notnull"] for row in conn.execute("PRAGMA table_info(ledger)")}
+        if not columns.get("cash"):
+            return
+        conn.execute("ALTER TABLE ledger RENAME TO ledger_old")
+        conn.execute("DROP INDEX IF EXISTS ledger_name_date")
+        for statement in SCHEMA.split(";"):
+            if "ledger" in statement:
+                conn.execute(statement)
+        conn.execute(
+            "INSERT INTO ledger (id, name, date, price, signal, action, cash, shares, assets, roi, created_at)"
+            " SELECT id, name, date, price, signal, action,"
+            " CASE WHEN cash = -1 AND shares = -1 THEN NULL ELSE cash END,"
+            " CASE WHEN cash = -1 AND shares = -1 THEN NULL ELSE shares END,"
+            " assets, roi, created_at FROM ledger_old"
+        )
+        conn.execute("DROP TABLE ledger_old")
+
+    def _seed(self, conn):
+        """初始化口袋；有舊版 JSON 帳本就連同歷史一起匯入"""
+        legacy = {}
+        if os.path.exists(self.legacy_file):
             try:
-                with open(DATA_FILE, "r", encoding="utf-8") as f:
-                    return json.load(f)
-            except:
-                pass  # 讀取失敗則重置
+                with open(self.legacy_file, "r", encoding="utf-8") as f:
+                    legacy = json.load(f)
+            except (OSError, ValueError):
+                legacy = {}  # 讀取失敗則重置
 
-        # 初始化錢包結構
-        wallets = {}
+        now = datetime.now().isoformat(timespec="seconds")
         for name, capital in INITIAL_POCKETS.items():
-            wallets[name] = {
-                "init_capital": capital,  # 初始本金
-                "cash": capital,  # 目前現金
-                "shares": 0,  # 持有股數
-                "total_assets": capital,  # 總資產 (現金+股票)
-                "roi": 0.0,  # 報酬率
-                "history": [],  # 每日淨值紀錄
-            }
-        return wallets
-
-    def _save_data(self):
-        """儲存帳本"""
-        with open(DATA_FILE, "w", encoding="utf-8") as f:
-            json.dump(self.wallets, f, ensure_ascii=False, indent=4)
+            old = legacy.get(name) or {}
+            history = old.get("history", [])
+            last = history[-1] if history else {}
+            conn.execute(
+                "INSERT INTO wallets VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    name,
+                    old.get("init_capital", capital),
+                    old.get("cash", capital),
+                    old.get("shares", 0),
+                    old.get("total_assets", capital),
+                    old.get("roi", 0.0),
+                    last.get("date"),
+                    last.get("action"),
+                ),
+            )
+            init = old.get("init_capital", capital)
+            conn.executemany(
+                "INSERT INTO ledger (name, date, price, signal, action, cash, shares, assets, roi, created_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    # 舊格式只有總資產，現金 / 股數無法還原，記為 NULL
+                    (name, h["date"], h["price"], "", h["action"], None, None, h["assets"],
+                     round((h["assets"] - init) / init * 100, 2), now)
+                    for h in history
+                ],
+            )
+
+    def _load_data(self):
+        """讀取目前餘額快照 (與口袋數成正比，不讀歷史)"""
+        with closing(self._connect()) as conn:
+            rows = conn.execute(f"SELECT name, {', '.join(WALLET_FIELDS)} FROM wallets").fetchall()
+        return {row["name"]: {k: row[k] for k in WALLET_FIELDS} for row in rows}
 
     def execute(self, date_str, price, signal_type):
         """
@@ -53,76 +290,94 @@ class PaperTrader:
         signal_type: 'BUY', 'SELL', 'HOLD' (無訊號)
         """
         report_lines = []
+        now = datetime.now().isoformat(timespec="seconds")
 
-        for name, wallet in self.wallets.items():
-            cash = wallet["cash"]
-            shares = wallet["shares"]
-
-            # --- 買進邏輯 ---
-            if signal_type == "BUY" and cash > price:
-                # 計算最多能買幾股 (預留 0.5% 當手續費緩衝)
-                max_shares = int((cash / price) * 0.995)
-
-                if max_shares > 0:
-                    cost = max_shares * price
-                    # 手續費 (0.1425%, 最低 1 元)
-                    fee = max(1, int(cost * 0.001425))
-
-                    if cash >= (cost + fee):
-                        wallet["cash"] -= cost + fee
-                        wallet["shares"] += max_shares
-                        action_msg = f"買進 {max_shares} 股"
-                    else:
-                        action_msg = "資金不足"
-                else:
-                    action_msg = "買不起 1 股"
-
-            # --- 賣出邏輯 ---
-            elif signal_type == "SELL" and shares > 0:
-                revenue = shares * price
-                # 手續費 (0.1425%, 最低 1 元)
-                fee = max(1, int(revenue * 0.001425))
-                # 證交稅 (0.1% ETF)
-                tax = int(revenue * 0.001)
-
-                wallet["cash"] += revenue - fee - tax
-                wallet["shares"] = 0
-                action_msg = f"賣出 {shares} 股"
-
-            # --- 無動作 ---
-            else:
-                action_msg = "續抱" if shares > 0 else "空手"
-
-            # --- 每日結算 ---
-            # 更新總資產市值
-            market_value = wallet["shares"] * price
-            wallet["total_assets"] = wallet["cash"] + market_value
-
-            # 計算報酬率
-            roi = (
-                (wallet["total_assets"] - wallet["init_capital"])
-                / wallet["init_capital"]
-            ) * 100
-            wallet["roi"] = round(roi, 2)
-
-            # 寫入歷史紀錄 (只留最近 5 筆避免檔案爆炸，或可全留)
-            record = {
-                "date": date_str,
-                "price": price,
-                "assets": int(wallet["total_assets"]),
-                "action": action_msg,
-            }
-            wallet["history"].append(record)
-
-            # 準備報表文字
-            symbol = "🔺" if roi > 0 else "🔻" if roi < 0 else "▫️"
-            report_lines.append(
-                f"{name}: ${int(wallet['total_assets']):,} ({symbol}{roi}%) | {action_msg}"
-            )
+        with closing(self._connect()) as conn:
+            # 拿到寫入鎖後才讀餘額，同時觸發的另一方會等這邊 commit 完
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = conn.execute(f"SELECT name, {', '.join(WALLET_FIELDS)} FROM wallets").fetchall()
+                wallets = {row["name"]: {k: row[k] for k in WALLET_FIELDS} for row in rows}
+                records = []
+                for name, wallet in wallets.items():
+                    if wallet["last_date"] == date_str:
+                        # 今天已經結算過 (重複觸發)，只回報不再交易
+                        report_lines.append(format_line(name, wallet, f"{wallet['last_action']} (今日已結算)"))
+                        continue
+
+                    cash, shares, action_msg = trade(wallet["cash"], wallet["shares"], price, signal_type)
+
+                    # --- 每日結算 ---
+                    total_assets = cash + shares * price
+                    roi = round((total_assets - wallet["init_capital"]) / wallet["init_capital"] * 100, 2)
+                    wallet.update(
+                        cash=cash, shares=shares, total_assets=total_assets, roi=roi,
+                        last_date=date_str, last_action=action_msg,
+                    )
+                    records.append(
+                        (name, date_str, price, signal_type, action_msg, cash, shares,
+                         int(total_assets), roi, now)
+                    )
+                    report_lines.append(format_line(name, wallet, action_msg))
+
+                conn.executemany(
+                    "INSERT INTO ledger (name, date, price, signal, action, cash, shares, assets, roi, created_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    records,
+                )
+                conn.executemany(
+                    "UPDATE wallets SET cash = ?, shares = ?, total_assets = ?, roi = ?, last_date = ?, last_action = ?"
+                    " WHERE name = ?",
+                    [
+                        tuple(wallets[r[0]][k] for k in WALLET_FIELDS[1:]) + (r[0],)
+                        for r in records
+                    ],
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
 
-        self._save_data()
+        self.wallets = wallets
         return "\n".join(report_lines)
 
+    def history(self, name=None, limit=None):
+        """查 ledger (新到舊)，name=None 為全部口袋"""
+        sql = "SELECT * FROM ledger"
+        params = []
+        if name is not None:
+            sql += " WHERE name = ?"
+            params.append(name)
+        sql += " ORDER BY id DESC"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+        with closing(self._connect()) as conn:
+            return [dict(row) for row in conn.execute(sql, params)]
+
+    def compact(self, before_date, archive=None):
+        """
+        刪掉 before_date (不含) 之前的 ledger，快照不受影響
+        archive: 刪除前先追加寫進這個 .jsonl.gz 檔 (一行一筆)
+        回傳刪除筆數
+        """
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = conn.execute(
+                    "SELECT * FROM ledger WHERE date < ? ORDER BY id", (before_date,)
+                ).fetchall()
+                if rows and archive:
+                    with gzip.open(archive, "at", encoding="utf-8") as f:
+                        for row in rows:
+                            f.write(json.dumps(dict(row), ensure_ascii=False) + "\n")
+                conn.execute("DELETE FROM ledger WHERE date < ?", (before_date,))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return len(rows)
+
 
 # 測試用
 if __name__ == "__main__":